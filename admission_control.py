@@ -0,0 +1,346 @@
+"""
+Cost-aware admission control for the image processing endpoints.
+
+Every request is priced *before* the image is decoded: the pixel count
+comes from the image header (PIL opens lazily) and the styles the request
+will render. Each worker keeps a memory and CPU budget; a request waits
+briefly for room in the budget and is shed with 429 + Retry-After when the
+budget stays exhausted. A request that could never fit the memory budget
+on its own is refused with 413. Waiting requests are let in by priority
+class and client (weighted fair queuing, see request_scheduling).
+
+Configuration (environment):
+    ADMISSION_MEMORY_MB      - transient memory budget per worker (default 900)
+    ADMISSION_CPU_BUDGET     - concurrent CPU work units per worker
+                               (default 4 x the thread policy's threads per worker)
+    ADMISSION_QUEUE_TIMEOUT  - seconds a request may wait for budget (default 2.0)
+"""
+
+import io
+import os
+import math
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+from thread_policy import policy as thread_policy
+from request_scheduling import FairQueue, current_request
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MEMORY_MB = float(os.environ.get('ADMISSION_MEMORY_MB', 900))
+ADMISSION_CPU_BUDGET = float(os.environ.get('ADMISSION_CPU_BUDGET', 4 * thread_policy.threads_per_worker))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 2.0))
+
+# Transient bytes per input pixel and CPU units per megapixel for each step.
+# Memory figures are the peak temporaries of the implementation (e.g. the
+# int16 Sobel pair and int32 squares in 'standard'); CPU weights are relative
+# to one Canny pass.
+STYLE_COSTS = {
+    'decode':           {'bytes_per_pixel': 8,  'cpu_per_mp': 0.5},
+    'standard':         {'bytes_per_pixel': 18, 'cpu_per_mp': 0.5},
+    'detailed':         {'bytes_per_pixel': 5,  'cpu_per_mp': 1.0},
+    'bold':             {'bytes_per_pixel': 5,  'cpu_per_mp': 1.5},
+    'canny':            {'bytes_per_pixel': 4,  'cpu_per_mp': 2.0},
+    'artistic':         {'bytes_per_pixel': 4,  'cpu_per_mp': 1.0},
+    'embossed':         {'bytes_per_pixel': 4,  'cpu_per_mp': 3.0},
+    'halftone':         {'bytes_per_pixel': 4,  'cpu_per_mp': 0.7},
+    'crosshatch':       {'bytes_per_pixel': 5,  'cpu_per_mp': 0.3},
+    'svg':              {'bytes_per_pixel': 6,  'cpu_per_mp': 2.0},
+    # Ordered dither is one tiled compare; diffusion keeps a float32 error
+    # buffer and steps through w + 2h diagonals
+    'dither':           {'bytes_per_pixel': 2,  'cpu_per_mp': 0.05},
+    'dither_diffusion': {'bytes_per_pixel': 6,  'cpu_per_mp': 2.2},
+    # Crosshatch SVG: blurred tone, one layer mask and a block of sample maps
+    'hatch':            {'bytes_per_pixel': 3,  'cpu_per_mp': 0.7},
+    # Cached outside mask, one OR per style raster and the SVG clip
+    'pendant':          {'bytes_per_pixel': 1,  'cpu_per_mp': 0.3},
+    # Skeleton, float32 distance map and int64 pixel index
+    'centerline':       {'bytes_per_pixel': 14, 'cpu_per_mp': 3.0},
+    'encode':           {'bytes_per_pixel': 3,  'cpu_per_mp': 1.0},
+    # Nearest-neighbour toolpath order of a G-code/DXF export: k-d tree
+    # queries per stroke, about 1,200 strokes per MP on busy photos
+    'order':            {'bytes_per_pixel': 0,  'cpu_per_mp': 4.0},
+    'pet':              {'bytes_per_pixel': 14, 'cpu_per_mp': 6.0},
+    'professional':     {'bytes_per_pixel': 12, 'cpu_per_mp': 12.0},
+    'remove_background': {'bytes_per_pixel': 16, 'cpu_per_mp': 4.0},
+    # Shared blur + float64 integral per (blur, contrast); each threshold
+    # variant then costs one compare pass and one retained uint8 image
+    'sweep':            {'bytes_per_pixel': 24, 'cpu_per_mp': 1.5},
+    'sweep_variant':    {'bytes_per_pixel': 1,  'cpu_per_mp': 0.15},
+}
+
+# Styles /vectorize always renders, plus what each 'style' value adds
+BASE_VECTORIZE_STYLES = ['standard', 'detailed', 'bold']
+OPTIONAL_VECTORIZE_STYLES = ['canny', 'artistic', 'embossed', 'halftone', 'crosshatch', 'dither']
+
+REMOVE_BACKGROUND_STEPS = ['decode', 'remove_background', 'encode']
+PET_STEPS = ['decode', 'pet', 'canny', 'artistic', 'detailed', 'svg'] + ['encode'] * 4
+PROFESSIONAL_STEPS = ['decode', 'professional', 'encode']
+# G-code/DXF export of /process-pet traces the contrast edges only
+PET_EXPORT_STEPS = ['decode', 'pet', 'canny', 'svg', 'order']
+# /process-pet in the 'minimal' quality tier: contrast edges and their SVG
+PET_MINIMAL_STEPS = ['decode', 'pet', 'canny', 'svg', 'encode']
+
+
+# Bed nesting per million stroke points: every placed copy is transformed
+# and written to the job SVG, each distinct artwork is ordered once
+NEST_COSTS = {
+    'bytes_per_point': 160,
+    'cpu_per_mpoint': 450,
+    'order_cpu_per_mpoint': 650,
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted into the worker budget"""
+
+    def __init__(self, message, status_code=429, retry_after=1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RequestCost:
+    def __init__(self, memory_mb, cpu_units, pixels, steps):
+        self.memory_mb = memory_mb
+        self.cpu_units = cpu_units
+        self.pixels = pixels
+        self.steps = steps
+
+    def to_dict(self):
+        return {
+            'memory_mb': round(self.memory_mb, 1),
+            'cpu_units': round(self.cpu_units, 2),
+            'megapixels': round(self.pixels / 1e6, 2),
+            'steps': self.steps
+        }
+
+
+def probe_image_size(image_bytes):
+    """Read (width, height) from the image header without decoding pixels"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        return img.size
+
+
+def trace_step(trace='outline'):
+    """Step that turns a rendered image into SVG for a 'trace' parameter"""
+    return 'centerline' if trace == 'centerline' else 'svg'
+
+
+def vectorize_steps(style, trace='outline', dither_method=None, pendant=False, styles=None):
+    """
+    Processing steps /vectorize runs for a given 'style', 'trace', dither
+    method and pendant crop; `styles` overrides the rendered styles
+    """
+    steps = ['decode'] + list(BASE_VECTORIZE_STYLES)
+    if styles is not None:
+        steps = ['decode'] + list(styles)
+    elif style == 'all':
+        steps += OPTIONAL_VECTORIZE_STYLES
+    elif style in OPTIONAL_VECTORIZE_STYLES:
+        steps.append(style)
+    if dither_method == 'diffusion':
+        steps = ['dither_diffusion' if s == 'dither' else s for s in steps]
+    # One PNG encode per rendered style plus the SVG trace (crosshatch
+    # draws its SVG as hatch lines instead)
+    steps += ['encode'] * (len(steps) - 1) + ['hatch' if style == 'crosshatch' else trace_step(trace)]
+    if pendant:
+        steps.append('pendant')
+    return steps
+
+
+def preview_steps(styles, pendant=False):
+    """Steps of a style contact sheet: every style at thumbnail size, one PNG encode"""
+    return ['decode'] + list(styles) + (['pendant'] if pendant else []) + ['encode']
+
+
+def export_steps(svg_style, trace='outline', pendant=False):
+    """
+    Steps of a G-code/DXF export: only the primary style, its vector trace
+    and the toolpath order (hatch lines keep theirs), no PNG encodes
+    """
+    if svg_style == 'crosshatch':
+        steps = ['decode', 'hatch']
+    else:
+        steps = ['decode', svg_style, trace_step(trace), 'order']
+    if pendant:
+        steps.append('pendant')
+    return steps
+
+
+def sweep_steps(passes, variants, images=False):
+    """
+    Processing steps of an engraving sweep: one shared pass per
+    (blur, contrast) pair, one threshold per variant, and either one encoded
+    contact sheet or one encoded image per variant
+    """
+    steps = ['decode'] + ['sweep'] * passes + ['sweep_variant'] * variants
+    return steps + ['encode'] * (variants if images else 1)
+
+
+def estimate_cost(width, height, steps, working_pixels=None):
+    """
+    Price a request from its pixel count and processing steps.
+
+    Memory is the largest single step's temporaries plus the outputs that
+    stay alive until the response is built; CPU is the sum over all steps.
+    With working_pixels (a degraded quality tier) the image is downscaled
+    right after decoding, so only the decode is priced at full size.
+    """
+    pixels = width * height
+    working = pixels if working_pixels is None else working_pixels
+
+    def step_pixels(step):
+        return pixels if step == 'decode' else working
+
+    peak_bytes = max(STYLE_COSTS[s]['bytes_per_pixel'] * step_pixels(s) for s in steps)
+    retained = sum(1 for s in steps if s not in ('decode', 'encode', 'svg', 'centerline', 'hatch', 'order'))
+    memory_mb = (peak_bytes + retained * working) / (1024 * 1024)
+    cpu_units = sum(STYLE_COSTS[s]['cpu_per_mp'] * step_pixels(s) for s in steps) / 1e6
+
+    return RequestCost(memory_mb, cpu_units, pixels, sorted(set(steps)))
+
+
+def nest_cost(placed_points, artwork_points):
+    """Price a /nest request from the stroke points of all copies and of the distinct artworks"""
+    memory_mb = NEST_COSTS['bytes_per_point'] * placed_points / (1024 * 1024)
+    cpu_units = (NEST_COSTS['cpu_per_mpoint'] * placed_points +
+                 NEST_COSTS['order_cpu_per_mpoint'] * artwork_points) / 1e6
+    return RequestCost(memory_mb, cpu_units, 0, ['nest'])
+
+
+class AdmissionController:
+    """Per-worker memory/CPU budget with a short bounded, fairly ordered wait"""
+
+    def __init__(self, memory_mb=ADMISSION_MEMORY_MB, cpu_budget=ADMISSION_CPU_BUDGET,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, queue=None):
+        self.memory_budget = memory_mb
+        self.cpu_budget = cpu_budget
+        self.queue_timeout = queue_timeout
+        self.queue = queue or FairQueue()
+
+        self._cond = threading.Condition()
+        self._memory_in_use = 0.0
+        self._cpu_in_use = 0.0
+        self._in_flight = 0
+        self._waiting = 0
+        self._avg_hold_seconds = 1.0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.too_large = 0
+
+    def _fits(self, cost):
+        if self._in_flight == 0:
+            # An idle worker always takes a request that fits in memory, even
+            # if it is CPU-heavy; it will just be slow rather than starved.
+            return True
+        return (self._memory_in_use + cost.memory_mb <= self.memory_budget and
+                self._cpu_in_use + cost.cpu_units <= self.cpu_budget)
+
+    def _retry_after(self):
+        backlog = self._in_flight + self._waiting
+        return max(1, int(math.ceil(self._avg_hold_seconds * max(backlog, 1))))
+
+    def _busy(self, message="Server busy, please retry"):
+        self.rejected += 1
+        return AdmissionRejected(message, status_code=429, retry_after=self._retry_after())
+
+    @contextmanager
+    def admit(self, cost, priority=None, client=None):
+        """
+        Hold budget for the duration of the block, or raise AdmissionRejected.
+        The priority class and client default to the current request's.
+        """
+        if cost.memory_mb > self.memory_budget:
+            with self._cond:
+                self.too_large += 1
+            raise AdmissionRejected(
+                f"Image too large to process: needs ~{cost.memory_mb:.0f}MB, "
+                f"worker budget is {self.memory_budget:.0f}MB",
+                status_code=413, retry_after=None
+            )
+
+        if priority is None:
+            priority, client = current_request()
+        now = time.monotonic()
+        deadline = now + self.queue.timeout(priority, self.queue_timeout)
+        with self._cond:
+            ticket, preempted = self.queue.push(priority, client, cost.cpu_units, now)
+            if ticket is None:
+                raise self._busy()
+            if preempted is not None:
+                self._cond.notify_all()
+            self._waiting += 1
+            try:
+                while not (self.queue.next_eligible() is ticket and self._fits(cost)):
+                    if ticket.preempted:
+                        raise self._busy("Server busy with interactive requests, please retry")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.queue.remove(ticket, rejected=True)
+                        # The next waiter in line may be eligible now
+                        self._cond.notify_all()
+                        raise self._busy()
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            self.queue.started(ticket, time.monotonic())
+            self._memory_in_use += cost.memory_mb
+            self._cpu_in_use += cost.cpu_units
+            self._in_flight += 1
+            self.admitted += 1
+            # Later waiters may fit in the remaining budget
+            self._cond.notify_all()
+
+        start = time.monotonic()
+        try:
+            yield cost
+        finally:
+            held = time.monotonic() - start
+            with self._cond:
+                self.queue.finished(ticket)
+                self._memory_in_use -= cost.memory_mb
+                self._cpu_in_use -= cost.cpu_units
+                self._in_flight -= 1
+                self._avg_hold_seconds = 0.8 * self._avg_hold_seconds + 0.2 * held
+                self._cond.notify_all()
+
+    def queue_depth(self, priority=None):
+        """Requests holding budget plus those waiting for it (of one class if given)"""
+        with self._cond:
+            return self._in_flight + (self._waiting if priority is None else self.queue.waiting(priority))
+
+    def stats(self):
+        with self._cond:
+            return {
+                'memory_budget_mb': self.memory_budget,
+                'memory_in_use_mb': round(self._memory_in_use, 1),
+                'cpu_budget': self.cpu_budget,
+                'cpu_in_use': round(self._cpu_in_use, 2),
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'too_large': self.too_large,
+                'avg_hold_seconds': round(self._avg_hold_seconds, 3),
+                'scheduling': self.queue.stats()
+            }
+
+
+def rejection_response(error):
+    """Flask (response, status, headers) tuple for an AdmissionRejected error"""
+    from flask import jsonify
+
+    headers = {}
+    if error.retry_after is not None:
+        headers['Retry-After'] = str(error.retry_after)
+    body = {'success': False, 'error': str(error)}
+    if error.retry_after is not None:
+        body['retry_after'] = error.retry_after
+    return jsonify(body), error.status_code, headers
@@ -1,18 +1,24 @@
 """
-PupRing AI Python Services - Minimal Version for Railway
-Basic Flask application without heavy ML dependencies
+PupRing AI Python Services - Gateway
+Single entry point that dispatches processing requests either to the
+engines loaded in-process or to the backend services over pooled HTTP
 """
 
+from thread_policy import policy as thread_policy  # before any engine import: sets OpenMP/BLAS limits
 import os
 import sys
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import logging
 from datetime import datetime
-import tempfile
 import traceback
-from PIL import Image
-import requests
+from readiness import Readiness
+from admission_control import AdmissionRejected, rejection_response
+from image_request import ImageRequestError, read_image_payload, read_json_payload
+from result_store import deliver, serve_result
+from response_compression import init_app as init_compression, compression_stats
+from request_scheduling import init_app as init_scheduling, scheduling_headers
+from backend_client import BackendClient, BackendError, iter_response, response_headers
 
 # Configure logging
 logging.basicConfig(
@@ -24,24 +30,151 @@ logger = logging.getLogger(__name__)
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
+init_compression(app)
+init_scheduling(app)
 
 # Configuration
 PORT = int(os.environ.get('PORT', 5001))
 DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
 
+# 'inprocess' runs the engines in this process, 'remote' forwards to the
+# backend services, 'auto' uses in-process engines when their dependencies
+# (OpenCV, rembg) are installed and falls back to the backends otherwise
+GATEWAY_MODE = os.environ.get('GATEWAY_MODE', 'auto').lower()
+VECTORIZATION_SERVICE_URL = os.environ.get('VECTORIZATION_SERVICE_URL', 'http://localhost:5000')
+BACKGROUND_REMOVAL_SERVICE_URL = os.environ.get('BACKGROUND_REMOVAL_SERVICE_URL', 'http://localhost:5002')
+
+backends = {
+    'vectorization': BackendClient('vectorization', VECTORIZATION_SERVICE_URL),
+    'background_removal': BackendClient('background_removal', BACKGROUND_REMOVAL_SERVICE_URL),
+}
+
+def load_engines():
+    """Import the in-process engines that are available, keyed by backend name"""
+    engines = {}
+    if GATEWAY_MODE == 'remote':
+        return engines
+
+    try:
+        import vectorization_service
+        engines['vectorization'] = vectorization_service
+    except ImportError as e:
+        logger.info(f"Vectorization engine not available in-process: {e}")
+
+    try:
+        import background_removal_service
+        engines['background_removal'] = background_removal_service
+    except ImportError as e:
+        logger.info(f"rembg engine not available in-process: {e}")
+
+    if GATEWAY_MODE == 'inprocess' and 'vectorization' not in engines:
+        raise RuntimeError("GATEWAY_MODE=inprocess but the vectorization engine could not be imported")
+    return engines
+
+engines = load_engines()
+
+# Gateway routes: (backend, backend path, in-process handler)
+ROUTES = {
+    '/remove-background': ('background_removal', '/remove-background',
+                           lambda engine, image_bytes, params: engine.remove_background_bytes(
+                               image_bytes, params.get('mode'), params.get('model'), params.get('quality'))),
+    '/vectorize': ('vectorization', '/vectorize',
+                   lambda engine, image_bytes, params: engine.vectorize_bytes(
+                       image_bytes, params.get('style', 'canny'), params.get('trace'), params)),
+    '/style-preview': ('vectorization', '/style-preview',
+                       lambda engine, image_bytes, params: engine.style_preview_bytes(image_bytes, params)),
+    '/process-pet': ('vectorization', '/process-pet',
+                     lambda engine, image_bytes, params: engine.process_pet_bytes(image_bytes, params)),
+    '/professional-engraving': ('vectorization', '/professional-engraving',
+                                lambda engine, image_bytes, params: engine.professional_engraving_bytes(image_bytes, params)),
+    '/engraving-filter': ('vectorization', '/engraving-filter',
+                          lambda engine, image_bytes, params: engine.engraving_filter_bytes(image_bytes, params)),
+    '/engraving-sweep': ('vectorization', '/engraving-sweep',
+                         lambda engine, image_bytes, params: engine.engraving_sweep_bytes(image_bytes, params)),
+    '/nest': ('vectorization', '/nest',
+              lambda engine, image_bytes, params: engine.nest_request(params)),
+}
+
+# Routes whose body is a JSON batch rather than one image
+PAYLOAD_READERS = {
+    '/nest': read_json_payload,
+}
+
+def resolve_engine(backend):
+    """In-process engine for a backend, if one is loaded"""
+    engine = engines.get(backend)
+    if engine is None and backend == 'background_removal' and GATEWAY_MODE == 'inprocess':
+        # Without rembg, fall back to the OpenCV background removal
+        engine = engines.get('vectorization')
+    return engine
+
+def dispatch(route):
+    """Run the route in-process or stream it through to its backend"""
+    backend, backend_path, handler = ROUTES[route]
+    engine = resolve_engine(backend)
+
+    if engine is not None:
+        image_bytes, params = PAYLOAD_READERS.get(route, read_image_payload)(request)
+        result = handler(engine, image_bytes, params)
+        if not isinstance(result, dict):
+            # G-code/DXF exports (format=gcode|dxf) stream as a file download
+            return result.response()
+        return jsonify(deliver(result, params.get('delivery')))
+
+    # Forward the untouched body; the backend parses JSON or multipart itself
+    # and compresses for the client's Accept-Encoding
+    upstream = backends[backend].forward(
+        backend_path, request.stream, request.content_type,
+        request.content_length, params=request.args,
+        accept_encoding=request.headers.get('Accept-Encoding'), headers=scheduling_headers()
+    )
+    return Response(iter_response(upstream), status=upstream.status_code,
+                    headers=response_headers(upstream))
+
+def gateway_mode():
+    return {route: ('inprocess' if resolve_engine(backend) is not None else 'remote')
+            for route, (backend, _, _) in ROUTES.items()}
+
+# In-process engines warm themselves up on import and the gateway reports
+# ready once they are; without engines there is nothing to warm up
+readiness = Readiness('pupring-python-services')
+if not engines:
+    readiness.start([])
+
+def gateway_readiness():
+    """Readiness payload combining the gateway and any in-process engines"""
+    if not engines:
+        return readiness.readiness()
+
+    payloads = {name: engine.readiness.readiness()[0] for name, engine in engines.items()}
+    ready = all(engine.readiness.is_ready for engine in engines.values())
+    return {
+        'status': 'ready' if ready else 'warming',
+        'service': 'pupring-python-services',
+        'engines': payloads,
+        'timestamp': datetime.utcnow().isoformat()
+    }, 200 if ready else 503
+
 @app.route('/', methods=['GET'])
 def health_check():
     """Basic health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'service': 'PupRing AI Python Services',
-        'version': '1.0.0-minimal',
+        'version': '1.1.0',
         'timestamp': datetime.utcnow().isoformat(),
         'endpoints': {
             '/health': 'Health check',
-            '/remove-background': 'Basic background processing',
-            '/professional-engraving': 'Basic engraving processing',
-            '/services': 'List available services'
+            '/remove-background': 'Background removal',
+            '/vectorize': 'Image vectorization',
+            '/style-preview': 'Contact sheet of all styles at thumbnail size',
+            '/process-pet': 'Pet processing with face detection',
+            '/professional-engraving': 'Professional pet engraving filter',
+            '/engraving-filter': 'Engraving filter with optional density auto-tune',
+            '/engraving-sweep': 'Engraving filter parameter sweep',
+            '/nest': 'Pack pendant engravings onto engraver beds',
+            '/services': 'List available services',
+            '/results/<key>': 'Stored results (delivery=url)'
         }
     })
 
@@ -50,167 +183,183 @@ def health():
     """Detailed health check"""
     return jsonify({
         'status': 'healthy',
-        'services': {
-            'basic_processing': 'available',
-            'image_optimization': 'available'
-        },
+        'services': {route.lstrip('/'): mode for route, mode in gateway_mode().items()},
+        'backends': {name: client.stats() for name, client in backends.items()},
+        'compression': compression_stats(),
         'system': {
             'python_version': sys.version,
             'flask_port': PORT,
-            'debug_mode': DEBUG
+            'debug_mode': DEBUG,
+            'gateway_mode': GATEWAY_MODE,
+            'threads': thread_policy.report()
         },
         'timestamp': datetime.utcnow().isoformat()
     })
 
+@app.route('/results/<key>', methods=['GET'])
+def result_file(key):
+    """Stored result (delivery=url) with ETag and Range support"""
+    return serve_result(key)
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe - the process is up and serving"""
+    return jsonify(readiness.liveness())
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_probe():
+    """Readiness probe - only 200 once the worker is warmed up"""
+    payload, status = gateway_readiness()
+    return jsonify(payload), status
+
 @app.route('/services', methods=['GET'])
 def list_services():
     """List all available services"""
+    modes = gateway_mode()
     return jsonify({
         'available_services': [
             {
-                'name': 'Basic Background Processing',
+                'name': 'Background Removal',
                 'endpoint': '/remove-background',
                 'method': 'POST',
-                'description': 'Basic image processing for background removal',
+                'description': 'Remove background from pet images',
+                'input': 'multipart/form-data image file or JSON {"image": base64}',
+                'mode': modes['/remove-background'],
+                'status': 'available'
+            },
+            {
+                'name': 'Image Vectorization',
+                'endpoint': '/vectorize',
+                'method': 'POST',
+                'description': 'Render engraving styles and an SVG (style parameter selects extras)',
+                'input': 'multipart/form-data image file or JSON {"image": base64, "style": ...}',
+                'mode': modes['/vectorize'],
                 'status': 'available'
             },
             {
-                'name': 'Basic Engraving Processing',
+                'name': 'Style Preview',
+                'endpoint': '/style-preview',
+                'method': 'POST',
+                'description': 'One sprite of every style at thumbnail size with a JSON index of tile rectangles',
+                'input': 'multipart/form-data image file or JSON {"image": base64, "tile_size": 192, "styles": "..."}',
+                'mode': modes['/style-preview'],
+                'status': 'available'
+            },
+            {
+                'name': 'Pet Processing',
+                'endpoint': '/process-pet',
+                'method': 'POST',
+                'description': 'Face-cropped pet engraving styles and SVG',
+                'input': 'multipart/form-data image file or JSON {"image": base64}',
+                'mode': modes['/process-pet'],
+                'status': 'available'
+            },
+            {
+                'name': 'Professional Engraving',
                 'endpoint': '/professional-engraving',
                 'method': 'POST',
-                'description': 'Basic engraving processing',
+                'description': 'Professional pet engraving filter for pendants',
+                'input': 'multipart/form-data image file or JSON {"image": base64}',
+                'mode': modes['/professional-engraving'],
+                'status': 'available'
+            },
+            {
+                'name': 'Engraving Filter',
+                'endpoint': '/engraving-filter',
+                'method': 'POST',
+                'description': 'Simple engraving filter, auto-tuned to target_black ink coverage when given',
+                'input': 'multipart/form-data image file or JSON {"image": base64, "target_black": 0.35}',
+                'mode': modes['/engraving-filter'],
+                'status': 'available'
+            },
+            {
+                'name': 'Engraving Parameter Sweep',
+                'endpoint': '/engraving-sweep',
+                'method': 'POST',
+                'description': 'Contact sheet of engraving filter variants over a parameter grid',
+                'input': 'multipart/form-data image file or JSON {"image": base64, "block_sizes": [...], "adapt_cs": [...]}',
+                'mode': modes['/engraving-sweep'],
+                'status': 'available'
+            },
+            {
+                'name': 'Bed Nesting',
+                'endpoint': '/nest',
+                'method': 'POST',
+                'description': 'Pack many pendant engravings onto one engraver job file per bed',
+                'input': 'JSON {"items": [{"svg" or "image", "width_mm", "height_mm", "quantity"}], "bed_width_mm", "bed_height_mm"}',
+                'mode': modes['/nest'],
                 'status': 'available'
             }
         ]
     })
 
-@app.route('/remove-background', methods=['POST'])
-def remove_background():
-    """Basic background processing endpoint"""
+def gateway_endpoint(route, label):
+    """Shared error handling around dispatch()"""
     try:
-        logger.info("Background processing request received")
-        
-        if 'image' not in request.files:
-            return jsonify({
-                'success': False,
-                'error': 'No image file provided'
-            }), 400
-        
-        file = request.files['image']
-        if file.filename == '':
-            return jsonify({
-                'success': False,
-                'error': 'No file selected'
-            }), 400
-        
-        # For now, return the original image (basic processing)
-        # This can be enhanced once Railway deployment is working
+        logger.info(f"{label} request received")
+        return dispatch(route)
+    except ImageRequestError as e:
         return jsonify({
-            'success': True,
-            'message': 'Basic processing completed',
-            'method': 'basic',
-            'processedUrl': 'https://via.placeholder.com/400x400.png?text=Processed+Image',
-            'processingTime': 2.0,
-            'note': 'This is a basic version - full AI processing will be added after successful deployment'
-        })
-        
-    except Exception as e:
-        logger.error(f"Background processing error: {str(e)}")
-        logger.error(traceback.format_exc())
+            'success': False,
+            'error': str(e)
+        }), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except BackendError as e:
+        logger.error(f"{label} backend error: {str(e)}")
         return jsonify({
             'success': False,
-            'error': 'Processing service error',
+            'error': f'{label} service unavailable',
             'details': str(e)
-        }), 500
-
-@app.route('/professional-engraving', methods=['POST'])
-def professional_engraving():
-    """Basic engraving processing endpoint"""
-    try:
-        logger.info("Engraving processing request received")
-        
-        if 'image' not in request.files:
-            return jsonify({
-                'success': False,
-                'error': 'No image file provided'
-            }), 400
-        
-        file = request.files['image']
-        if file.filename == '':
-            return jsonify({
-                'success': False,
-                'error': 'No file selected'
-            }), 400
-        
-        # Basic image processing with Pillow
-        try:
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                file.save(temp_file.name)
-                temp_path = temp_file.name
-            
-            # Basic processing with Pillow
-            with Image.open(temp_path) as img:
-                # Convert to grayscale for basic engraving effect
-                grayscale = img.convert('L')
-                
-                # For now, return a placeholder
-                # This demonstrates the endpoint is working
-                return jsonify({
-                    'success': True,
-                    'engravingUrl': 'https://via.placeholder.com/400x400.png?text=Engraved+Image',
-                    'style': 'basic',
-                    'method': 'pillow-basic',
-                    'processingTime': 1.5,
-                    'dimensions': {
-                        'width': img.width,
-                        'height': img.height
-                    },
-                    'note': 'Basic processing completed - full AI engraving will be added after successful deployment'
-                })
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-                
+        }), e.status_code
     except Exception as e:
-        logger.error(f"Engraving processing error: {str(e)}")
+        logger.error(f"{label} error: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({
             'success': False,
-            'error': 'Engraving service error', 
+            'error': f'{label} service error',
             'details': str(e)
         }), 500
 
+@app.route('/remove-background', methods=['POST'])
+def remove_background():
+    """Background removal endpoint"""
+    return gateway_endpoint('/remove-background', 'Background removal')
+
 @app.route('/vectorize', methods=['POST'])
 def vectorize():
-    """Basic vectorization endpoint"""
-    try:
-        logger.info("Vectorization request received")
-        
-        if 'image' not in request.files:
-            return jsonify({
-                'success': False,
-                'error': 'No image file provided'
-            }), 400
-        
-        # Basic response for now
-        return jsonify({
-            'success': True,
-            'vectorizedUrl': 'https://via.placeholder.com/400x400.svg?text=Vectorized',
-            'format': 'svg',
-            'method': 'basic',
-            'processingTime': 1.0,
-            'note': 'Basic vectorization - advanced features will be added after deployment'
-        })
-        
-    except Exception as e:
-        logger.error(f"Vectorization error: {str(e)}")
-        return jsonify({
-            'success': False,
-            'error': 'Vectorization service error',
-            'details': str(e)
-        }), 500
+    """Vectorization endpoint"""
+    return gateway_endpoint('/vectorize', 'Vectorization')
+
+@app.route('/style-preview', methods=['POST'])
+def style_preview():
+    """Style contact sheet endpoint"""
+    return gateway_endpoint('/style-preview', 'Style preview')
+
+@app.route('/process-pet', methods=['POST'])
+def process_pet():
+    """Pet processing endpoint"""
+    return gateway_endpoint('/process-pet', 'Pet processing')
+
+@app.route('/professional-engraving', methods=['POST'])
+def professional_engraving():
+    """Professional engraving endpoint"""
+    return gateway_endpoint('/professional-engraving', 'Professional engraving')
+
+@app.route('/engraving-filter', methods=['POST'])
+def engraving_filter():
+    """Engraving filter endpoint"""
+    return gateway_endpoint('/engraving-filter', 'Engraving filter')
+
+@app.route('/engraving-sweep', methods=['POST'])
+def engraving_sweep():
+    """Engraving parameter sweep endpoint"""
+    return gateway_endpoint('/engraving-sweep', 'Engraving sweep')
+
+@app.route('/nest', methods=['POST'])
+def nest():
+    """Bed nesting endpoint"""
+    return gateway_endpoint('/nest', 'Bed nesting')
 
 @app.errorhandler(404)
 def not_found(error):
@@ -218,8 +367,9 @@ def not_found(error):
     return jsonify({
         'error': 'Endpoint not found',
         'available_endpoints': [
-            '/', '/health', '/services', '/remove-background', 
-            '/professional-engraving', '/vectorize'
+            '/', '/health', '/health/live', '/health/ready', '/services', '/results/<key>',
+            '/remove-background', '/vectorize', '/style-preview', '/process-pet', '/professional-engraving',
+            '/engraving-filter', '/engraving-sweep', '/nest'
         ]
     }), 404
 
@@ -232,21 +382,30 @@ def internal_error(error):
     }), 500
 
 if __name__ == '__main__':
-    logger.info(f"Starting PupRing AI Python Services (Minimal) on port {PORT}")
+    logger.info(f"Starting PupRing AI Python Services gateway on port {PORT}")
     logger.info(f"Debug mode: {DEBUG}")
-    
+    logger.info(f"Routing: {gateway_mode()}")
+
     # Print available endpoints
     logger.info("Available endpoints:")
     logger.info("  GET  / - Health check")
     logger.info("  GET  /health - Detailed health check")
+    logger.info("  GET  /health/live - Liveness probe")
+    logger.info("  GET  /health/ready - Readiness probe")
     logger.info("  GET  /services - List all services")
-    logger.info("  POST /remove-background - Basic background processing")
-    logger.info("  POST /professional-engraving - Basic engraving processing")
-    logger.info("  POST /vectorize - Basic vectorization")
-    
+    logger.info("  GET  /results/<key> - Stored results")
+    logger.info("  POST /remove-background - Background removal")
+    logger.info("  POST /vectorize - Image vectorization")
+    logger.info("  POST /style-preview - Style contact sheet")
+    logger.info("  POST /process-pet - Pet processing")
+    logger.info("  POST /professional-engraving - Professional engraving")
+    logger.info("  POST /engraving-filter - Engraving filter with density auto-tune")
+    logger.info("  POST /engraving-sweep - Engraving parameter sweep")
+    logger.info("  POST /nest - Bed nesting")
+
     app.run(
         host='0.0.0.0',
         port=PORT,
         debug=DEBUG,
         use_reloader=False
-    )
\ No newline at end of file
+    )
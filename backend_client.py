@@ -0,0 +1,136 @@
+"""
+Pooled keep-alive HTTP client the gateway uses to reach the processing
+backends (vectorization_service.py, background_removal_service.py).
+
+One requests.Session per backend keeps connections alive between calls.
+Request bodies are forwarded as a stream with the client's original
+Content-Type, so multipart uploads and JSON payloads reach the backend
+byte-for-byte without being parsed or re-encoded by the gateway.
+
+Configuration (environment):
+    BACKEND_POOL_SIZE        - keep-alive connections per backend (default 10)
+    BACKEND_CONNECT_TIMEOUT  - seconds to establish a connection (default 3)
+    BACKEND_READ_TIMEOUT     - seconds to wait for a response (default 110)
+    BACKEND_CONNECT_RETRIES  - retries on connection failure only (default 2)
+"""
+
+import os
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+BACKEND_POOL_SIZE = int(os.environ.get('BACKEND_POOL_SIZE', 10))
+BACKEND_CONNECT_TIMEOUT = float(os.environ.get('BACKEND_CONNECT_TIMEOUT', 3))
+BACKEND_READ_TIMEOUT = float(os.environ.get('BACKEND_READ_TIMEOUT', 110))
+BACKEND_CONNECT_RETRIES = int(os.environ.get('BACKEND_CONNECT_RETRIES', 2))
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Headers worth passing back from the backend to the client
+FORWARDED_RESPONSE_HEADERS = ('Content-Type', 'Retry-After', 'Content-Encoding', 'ETag', 'Cache-Control',
+                              'Content-Disposition', 'Vary')
+
+
+class BackendError(Exception):
+    """The backend could not be reached or did not answer in time"""
+
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _SizedStream:
+    """
+    Wrap the incoming WSGI stream with a known length so requests sends it
+    with Content-Length instead of chunked transfer encoding.
+    """
+
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+
+class BackendClient:
+    def __init__(self, name, base_url, pool_size=BACKEND_POOL_SIZE,
+                 connect_timeout=BACKEND_CONNECT_TIMEOUT, read_timeout=BACKEND_READ_TIMEOUT,
+                 connect_retries=BACKEND_CONNECT_RETRIES):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+
+        # Only retry failures to connect; a POST that reached the backend is
+        # never replayed because the body stream has already been consumed.
+        retry = Retry(total=connect_retries, connect=connect_retries, read=0,
+                      status=0, redirect=0, backoff_factor=0.1)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=retry, pool_block=False)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.requests_sent = 0
+        self.failures = 0
+
+    def forward(self, path, stream, content_type, content_length, params=None, accept_encoding=None,
+                headers=None):
+        """
+        POST the raw request body to the backend and return the streaming
+        upstream response. The caller must close it (or exhaust iter_response).
+        The client's Accept-Encoding is passed on (identity without one) since
+        the encoded body goes back to the client as is; `headers` adds the
+        scheduling class and client.
+        """
+        url = f"{self.base_url}{path}"
+        headers = {'Content-Type': content_type or 'application/octet-stream',
+                   'Accept-Encoding': accept_encoding or 'identity', **(headers or {})}
+        body = _SizedStream(stream, content_length) if content_length else stream.read()
+
+        self.requests_sent += 1
+        try:
+            return self.session.post(url, data=body, headers=headers, params=params,
+                                     timeout=self.timeout, stream=True)
+        except requests.Timeout as e:
+            self.failures += 1
+            raise BackendError(f"{self.name} backend timed out: {e}", status_code=504)
+        except requests.RequestException as e:
+            self.failures += 1
+            raise BackendError(f"{self.name} backend unavailable: {e}", status_code=502)
+
+    def get_json(self, path, timeout=2):
+        """Small JSON GET, used for backend health checks"""
+        response = self.session.get(f"{self.base_url}{path}", timeout=(BACKEND_CONNECT_TIMEOUT, timeout))
+        return response.status_code, response.json()
+
+    def stats(self):
+        return {
+            'url': self.base_url,
+            'requests_sent': self.requests_sent,
+            'failures': self.failures
+        }
+
+
+def iter_response(upstream):
+    """
+    Yield the upstream body as sent (still encoded, so Content-Encoding stays
+    valid) and release the pooled connection afterwards
+    """
+    try:
+        for chunk in upstream.raw.stream(STREAM_CHUNK_SIZE, decode_content=False):
+            yield chunk
+    finally:
+        upstream.close()
+
+
+def response_headers(upstream):
+    return {name: upstream.headers[name] for name in FORWARDED_RESPONSE_HEADERS if name in upstream.headers}
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+from thread_policy import policy as thread_policy  # before numpy/rembg: sets OpenMP/BLAS limits
 import os
 import sys
 from flask import Flask, request, jsonify, send_file
@@ -6,60 +7,183 @@ from flask_cors import CORS
 from PIL import Image
 import io
 import base64
+import numpy as np
 from rembg import remove
 import logging
+from readiness import Readiness
+from admission_control import (AdmissionController, AdmissionRejected, estimate_cost,
+                               rejection_response, REMOVE_BACKGROUND_STEPS)
+from request_coalescing import SingleFlight
+from image_request import ImageRequestError, read_image_payload
+from mask_refinement import lowres_alpha, removal_mode
+from result_store import deliver, serve_result
+from response_compression import init_app as init_compression, compression_stats
+from request_scheduling import init_app as init_scheduling
+from quality_tiers import DegradationController, DEGRADE_LIGHT_MODEL, quality_tier
+from rembg_models import REMBG_MODEL, REMBG_ALLOWED_MODELS, get_session, loaded_models, model_variant
+
+thread_policy.apply_opencv()
 
 app = Flask(__name__)
 CORS(app, origins=['http://localhost:3000', 'http://localhost:3001'])
+init_compression(app)
+init_scheduling(app)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+readiness = Readiness('background-removal')
+admission = AdmissionController()
+coalescer = SingleFlight()
+degradation = DegradationController(admission)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'background-removal',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'ready': readiness.is_ready,
+        'admission': admission.stats(),
+        'coalescing': coalescer.stats(),
+        'compression': compression_stats(),
+        'degradation': degradation.stats(),
+        'models': {
+            'default': REMBG_MODEL,
+            'allowed': REMBG_ALLOWED_MODELS,
+            'loaded': loaded_models()
+        },
+        'threads': thread_policy.report()
     })
 
-@app.route('/remove-background', methods=['POST'])
-def remove_background():
-    try:
-        data = request.get_json()
-        
-        if not data or 'image' not in data:
-            return jsonify({'error': 'No image data provided'}), 400
-        
-        image_data = data['image']
-        if image_data.startswith('data:'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        input_image = Image.open(io.BytesIO(image_bytes))
-        
+@app.route('/results/<key>', methods=['GET'])
+def result_file(key):
+    """Stored result (delivery=url) with ETag and Range support"""
+    return serve_result(key)
+
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    return jsonify(readiness.liveness())
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    payload, status = readiness.readiness()
+    return jsonify(payload), status
+
+def remove_lowres(input_image, session):
+    """
+    Run the model on a bounded copy and refine the mask edge band at full
+    resolution, guided by the luminance of the original
+    """
+    rgb = np.asarray(input_image.convert('RGB'))
+    luminance = np.asarray(input_image.convert('L'))
+    def segment(image_array):
+        # rembg foreground mask (0-255) of the bounded copy
+        return np.asarray(remove(Image.fromarray(image_array), session=session, only_mask=True))
+    
+    alpha, refinement = lowres_alpha(rgb, segment, guide=luminance)
+    output_image = input_image.copy()
+    output_image.putalpha(Image.fromarray(alpha))
+    return output_image, refinement
+
+def run_admitted(image_bytes, mode='full', model=REMBG_MODEL):
+    """Run rembg on encoded image bytes within the worker's admission budget"""
+    input_image = Image.open(io.BytesIO(image_bytes))
+    
+    # PIL only parsed the header so far; price the request before decoding
+    width, height = input_image.size
+    cost = estimate_cost(width, height, REMOVE_BACKGROUND_STEPS)
+    
+    with admission.admit(cost):
         if input_image.mode != 'RGBA':
             input_image = input_image.convert('RGBA')
         
-        output_image = remove(input_image)
+        session = get_session(model)
+        refinement = None
+        if mode == 'lowres':
+            output_image, refinement = remove_lowres(input_image, session)
+        else:
+            output_image = remove(input_image, session=session)
         
         output_buffer = io.BytesIO()
         output_image.save(output_buffer, format='PNG')
         output_buffer.seek(0)
         
         output_base64 = base64.b64encode(output_buffer.getvalue()).decode('utf-8')
+    
+    result = {
+        'success': True,
+        'image': f'data:image/png;base64,{output_base64}',
+        'width': output_image.width,
+        'height': output_image.height,
+        'model': model
+    }
+    if refinement is not None:
+        result['refinement'] = refinement
+    return result
+
+def tier_settings(mode, model, tier):
+    """
+    Mode and model for a quality tier: degraded tiers infer at low
+    resolution, 'minimal' on the light model when it is allowed
+    """
+    if tier == 'full':
+        return mode, model
+    if tier == 'minimal' and DEGRADE_LIGHT_MODEL in REMBG_ALLOWED_MODELS:
+        model = DEGRADE_LIGHT_MODEL
+    return 'lowres', model
+
+def remove_background_bytes(image_bytes, mode=None, model=None, quality=None):
+    """
+    Identical concurrent requests share one inference; under pressure a
+    recent result of the same request is served from the preview cache
+    """
+    try:
+        mode = removal_mode(mode)
+        model = model_variant(model)
+        tier = degradation.tier(quality_tier(quality))
+    except ValueError as e:
+        raise ImageRequestError(str(e))
+    request_key = coalescer.make_key('remove-background', image_bytes, model=model, mode=mode)
+    if tier != 'full':
+        cached = degradation.previews.get(request_key)
+        if cached is not None:
+            cached_tier, result = cached
+            return dict(result, quality=degradation.report(cached_tier, cached=True))
+    
+    mode, model = tier_settings(mode, model, tier)
+    key = coalescer.make_key('remove-background', image_bytes, model=model, mode=mode)
+    with degradation.timed():
+        result = coalescer.do(key, lambda: run_admitted(image_bytes, mode, model))
+    result = dict(result, quality=degradation.report(tier))
+    degradation.previews.put(request_key, tier, result)
+    return result
+
+@app.route('/remove-background', methods=['POST'])
+def remove_background():
+    try:
+        image_bytes, params = read_image_payload(request)
         
-        return jsonify({
-            'success': True,
-            'image': f'data:image/png;base64,{output_base64}',
-            'width': output_image.width,
-            'height': output_image.height
-        })
+        result = remove_background_bytes(image_bytes, params.get('mode'), params.get('model'),
+                                         params.get('quality'))
+        return jsonify(deliver(result, params.get('delivery')))
         
+    except ImageRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
     except Exception as e:
         logger.error(f"Error removing background: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def _warmup_remove(image):
+    remove(Image.fromarray(image).convert('RGBA'), session=get_session())
+
+readiness.start([
+    ('rembg_session', lambda image: get_session()),
+    ('remove_background', _warmup_remove),
+])
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5002))
     logger.info(f"Starting Background Removal Service on port {port}")
@@ -0,0 +1,335 @@
+"""
+Bed nesting: pack many pendant engravings into one engraver job.
+
+Every traced SVG is sized to its source image, so a batch of pendants
+means one machine setup per pendant. Here each engraving is given its
+physical pendant size, the pendant rectangles are packed onto the bed with
+MaxRects (best short side fit, optional 90 degree rotation, first bed that
+fits), and every bed is written as one SVG in millimetres. Strokes are
+ordered for short pen-up travel: pendants by nearest neighbour, then the
+strokes inside each pendant by nearest neighbour, entering open strokes
+from whichever end is closer. The stroke order is found once per artwork
+(from its top-left corner, with a k-d tree) and reused for every copy.
+When the batch does not fit, more beds are opened.
+
+Input SVGs are the tracer outputs, read by svg_paths (straight segments and
+flattened Bezier curves; arcs are rejected, background rectangles ignored).
+
+Configuration (environment):
+    NEST_BED_WIDTH_MM   - default bed width (default 300)
+    NEST_BED_HEIGHT_MM  - default bed height (default 200)
+    NEST_SPACING_MM     - default gap between pendants and to the bed edge (default 2)
+    NEST_MAX_ITEMS      - pendants per request, counting quantities (default 200)
+    NEST_MAX_QUANTITY   - copies of one item (default 50)
+    NEST_MAX_POINTS     - stroke points over all copies in a request (default 2000000)
+"""
+
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from svg_paths import svg_strokes, format_number
+
+NEST_BED_WIDTH_MM = float(os.environ.get('NEST_BED_WIDTH_MM', 300))
+NEST_BED_HEIGHT_MM = float(os.environ.get('NEST_BED_HEIGHT_MM', 200))
+NEST_SPACING_MM = float(os.environ.get('NEST_SPACING_MM', 2))
+NEST_MAX_ITEMS = int(os.environ.get('NEST_MAX_ITEMS', 200))
+NEST_MAX_QUANTITY = int(os.environ.get('NEST_MAX_QUANTITY', 50))
+NEST_MAX_POINTS = int(os.environ.get('NEST_MAX_POINTS', 2000000))
+
+EPSILON = 1e-9
+
+
+class Artwork:
+    """Strokes of one engraving in its own user units"""
+
+    def __init__(self, width, height, strokes):
+        self.width = width
+        self.height = height
+        # (points Nx2 float64, closed, stroke width)
+        self.strokes = strokes
+        self.points = sum(len(s[0]) for s in strokes)
+        self._ordered = None
+
+    def ordered_strokes(self):
+        """Strokes in travel order from the artwork origin, computed once for all copies"""
+        if self._ordered is None:
+            self._ordered, _ = order_strokes(self.strokes, np.zeros(2))
+        return self._ordered
+
+
+def parse_svg(svg_string):
+    """Artwork from an SVG document"""
+    return Artwork(*svg_strokes(svg_string))
+
+
+def pendant_size(artwork, width_mm=None, height_mm=None):
+    """Physical pendant size; a missing side follows the artwork's aspect ratio"""
+    if width_mm and height_mm:
+        return float(width_mm), float(height_mm)
+    if width_mm:
+        return float(width_mm), float(width_mm) * artwork.height / artwork.width
+    if height_mm:
+        return float(height_mm) * artwork.width / artwork.height, float(height_mm)
+    raise ValueError("Each item needs width_mm and/or height_mm")
+
+
+class MaxRectsBed:
+    """Free-rectangle list of one bed (MaxRects, best short side fit)"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.free = [(0.0, 0.0, width, height)]
+        self.used_area = 0.0
+
+    def find(self, width, height, rotate):
+        """Best (score, x, y, rotated) for a rectangle, or None"""
+        best = None
+        orientations = [(width, height, False)]
+        if rotate and abs(width - height) > EPSILON:
+            orientations.append((height, width, True))
+        for fx, fy, fw, fh in self.free:
+            for w, h, rotated in orientations:
+                if w <= fw + EPSILON and h <= fh + EPSILON:
+                    leftover = (min(fw - w, fh - h), max(fw - w, fh - h))
+                    if best is None or leftover < best[0]:
+                        best = (leftover, fx, fy, rotated)
+        return best
+
+    def place(self, x, y, width, height):
+        free = []
+        for fx, fy, fw, fh in self.free:
+            if (x >= fx + fw - EPSILON or x + width <= fx + EPSILON or
+                    y >= fy + fh - EPSILON or y + height <= fy + EPSILON):
+                free.append((fx, fy, fw, fh))
+                continue
+            # Up to four maximal rectangles around the used one
+            if x > fx + EPSILON:
+                free.append((fx, fy, x - fx, fh))
+            if x + width < fx + fw - EPSILON:
+                free.append((x + width, fy, fx + fw - x - width, fh))
+            if y > fy + EPSILON:
+                free.append((fx, fy, fw, y - fy))
+            if y + height < fy + fh - EPSILON:
+                free.append((fx, y + height, fw, fy + fh - y - height))
+
+        # Drop rectangles contained in another one
+        self.free = [a for i, a in enumerate(free) if not any(
+            i != j and a[0] >= b[0] - EPSILON and a[1] >= b[1] - EPSILON and
+            a[0] + a[2] <= b[0] + b[2] + EPSILON and a[1] + a[3] <= b[1] + b[3] + EPSILON and
+            (a != b or i > j)
+            for j, b in enumerate(free))]
+        self.used_area += width * height
+
+
+def pack(sizes, bed_width, bed_height, spacing, rotate=True):
+    """
+    Pack (width, height) rectangles onto as few beds as the heuristic finds.
+    Returns (beds, unplaced): beds is a list of [(index, x, y, rotated)]
+    with x/y the rectangle's top-left corner on the bed.
+    """
+    # Every rectangle is grown by the spacing and the bed by the spacing
+    # minus both margins, so gaps between pendants and to the edge are equal
+    usable_width = bed_width - spacing
+    usable_height = bed_height - spacing
+    order = sorted(range(len(sizes)), key=lambda i: (max(sizes[i]), sizes[i][0] * sizes[i][1]), reverse=True)
+
+    beds, placements, unplaced = [], [], []
+    for index in order:
+        width, height = sizes[index][0] + spacing, sizes[index][1] + spacing
+        for bed_index in range(len(beds) + 1):
+            if bed_index == len(beds):
+                bed = MaxRectsBed(usable_width, usable_height)
+                if bed.find(width, height, rotate) is None:
+                    unplaced.append(index)
+                    break
+                beds.append(bed)
+                placements.append([])
+            bed = beds[bed_index]
+            found = bed.find(width, height, rotate)
+            if found is None:
+                continue
+            _, x, y, rotated = found
+            bed.place(x, y, *((height, width) if rotated else (width, height)))
+            placements[bed_index].append((index, x + spacing, y + spacing, rotated))
+            break
+    return placements, sorted(unplaced)
+
+
+def place_strokes(artwork, width_mm, height_mm, x, y, rotated, ordered=False):
+    """
+    Artwork strokes fitted (centred, aspect kept) into a pendant and moved
+    onto the bed, in travel order with ordered (scaling, rotating and moving
+    keep the order's relative distances)
+    """
+    scale = min(width_mm / artwork.width, height_mm / artwork.height)
+    offset = np.array([(width_mm - artwork.width * scale) / 2, (height_mm - artwork.height * scale) / 2])
+    strokes = []
+    for points, closed, stroke_width in (artwork.ordered_strokes() if ordered else artwork.strokes):
+        local = points * scale + offset
+        if rotated:
+            # 90 degrees clockwise: the pendant becomes height_mm wide
+            local = np.stack([height_mm - local[:, 1], local[:, 0]], axis=1)
+        strokes.append((local + (x, y), closed, stroke_width * scale))
+    return strokes
+
+
+def order_strokes(strokes, position):
+    """
+    Greedy nearest-neighbour stroke order from a head position; open strokes
+    are reversed when their far end is closer. Returns (strokes, position).
+
+    Stroke ends sit in a k-d tree that is queried for the nearest few ends
+    (more when they are all used up) and rebuilt from the remaining ends
+    once half are gone, so ordering is O(N log N) instead of a full scan
+    per stroke.
+    """
+    if not strokes:
+        return strokes, position
+    count = len(strokes)
+    open_indices = [i for i, s in enumerate(strokes) if not s[1]]
+    # Entry points: every start, then the far end of every open stroke
+    entries = np.array([s[0][0] for s in strokes] + [strokes[i][0][-1] for i in open_indices])
+    entry_stroke = np.array(list(range(count)) + open_indices)
+    remaining = np.ones(count, bool)
+
+    alive = np.arange(len(entries))
+    tree = cKDTree(entries)
+    stale = 0  # entries in the tree whose stroke is already ordered
+    ordered = []
+    while len(ordered) < count:
+        k = 8
+        while True:
+            _, found = tree.query(position, k=min(k, len(alive)))
+            found = alive[np.atleast_1d(found)]
+            usable = found[remaining[entry_stroke[found]]]
+            if len(usable) or k >= len(alive):
+                break
+            k *= 4
+        entry = int(usable[0])
+        index = int(entry_stroke[entry])
+        points, closed, stroke_width = strokes[index]
+        ordered.append((points[::-1], closed, stroke_width) if entry >= count else strokes[index])
+        remaining[index] = False
+        position = ordered[-1][0][0] if closed else ordered[-1][0][-1]
+
+        stale += 1 if closed else 2
+        if len(ordered) < count and stale * 2 > len(alive):
+            alive = alive[remaining[entry_stroke[alive]]]
+            tree = cKDTree(entries[alive])
+            stale = 0
+    return ordered, position
+
+
+def travel_length(groups):
+    """Pen-up distance from the bed origin through every stroke in order"""
+    position = np.zeros(2)
+    total = 0.0
+    for strokes in groups:
+        for points, closed, _ in strokes:
+            total += float(np.hypot(*(points[0] - position)))
+            position = points[0] if closed else points[-1]
+    return total
+
+
+def job_svg(bed_width, bed_height, groups):
+    """
+    One SVG in millimetres; each pendant is a group, strokes in job order.
+    Written as text: a bed holds tens of thousands of paths and building
+    them as validated svgwrite elements took most of the request.
+    """
+    width, height = format_number(bed_width), format_number(bed_height)
+    parts = [f'<svg baseProfile="full" height="{height}mm" version="1.1" viewBox="0 0 {width} {height}" '
+             f'width="{width}mm" xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" '
+             f'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />']
+    for item, copy, strokes in groups:
+        parts.append(f'<g id="pendant-{item}-{copy}">')
+        for points, closed, stroke_width in strokes:
+            path_data = "M " + " L ".join(f"{format_number(px)},{format_number(py)}"
+                                          for px, py in points.tolist())
+            if closed:
+                path_data += " Z"
+            parts.append(f'<path d="{path_data}" fill="none" stroke="black" stroke-linecap="round" '
+                         f'stroke-linejoin="round" stroke-width="{format_number(stroke_width)}" />')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def nest_points(items):
+    """Stroke points of all requested copies"""
+    return sum(artwork.points * quantity for artwork, _, _, quantity in items)
+
+
+def nest(items, bed_width=NEST_BED_WIDTH_MM, bed_height=NEST_BED_HEIGHT_MM,
+         spacing=NEST_SPACING_MM, rotate=True):
+    """
+    Nest pendants onto beds. items is a list of (Artwork, width_mm,
+    height_mm, quantity); returns the beds with their job SVG, placements
+    and travel figures, plus the items too large for an empty bed.
+    """
+    pendants = [(item, copy) for item, (_, _, _, quantity) in enumerate(items) for copy in range(quantity)]
+    if len(pendants) > NEST_MAX_ITEMS:
+        raise ValueError(f"{len(pendants)} pendants requested, the limit is {NEST_MAX_ITEMS}")
+    points = nest_points(items)
+    if points > NEST_MAX_POINTS:
+        raise ValueError(f"{points} stroke points requested over all copies, the limit is {NEST_MAX_POINTS}")
+    sizes = [items[item][1:3] for item, _ in pendants]
+
+    placements, unplaced = pack(sizes, bed_width, bed_height, spacing, rotate)
+
+    beds = []
+    for bed_index, bed_placements in enumerate(placements):
+        placed, unoptimized = [], []
+        for index, x, y, rotated in bed_placements:
+            item, copy = pendants[index]
+            artwork, width_mm, height_mm, _ = items[item]
+            placed.append({
+                "item": item,
+                "copy": copy,
+                "x_mm": round(x, 3),
+                "y_mm": round(y, 3),
+                "width_mm": round(height_mm if rotated else width_mm, 3),
+                "height_mm": round(width_mm if rotated else height_mm, 3),
+                "rotated": rotated,
+                "strokes": place_strokes(artwork, width_mm, height_mm, x, y, rotated, ordered=True)
+            })
+            unoptimized.append(place_strokes(artwork, width_mm, height_mm, x, y, rotated))
+
+        # Pendants by nearest neighbour on their centres; the strokes inside
+        # each come in their artwork's travel order
+        centres = np.array([[p["x_mm"] + p["width_mm"] / 2, p["y_mm"] + p["height_mm"] / 2] for p in placed])
+        remaining = list(range(len(placed)))
+        position = np.zeros(2)
+        groups, ordered_placements = [], []
+        while remaining:
+            nearest = min(remaining, key=lambda i: float(np.hypot(*(centres[i] - position))))
+            remaining.remove(nearest)
+            p = placed[nearest]
+            strokes = p.pop("strokes")
+            if strokes:
+                position = strokes[-1][0][0] if strokes[-1][1] else strokes[-1][0][-1]
+            groups.append((p["item"], p["copy"], strokes))
+            ordered_placements.append(dict(p, job_order=len(ordered_placements)))
+
+        used = sum(p["width_mm"] * p["height_mm"] for p in placed)
+        beds.append({
+            "index": bed_index,
+            "svg": job_svg(bed_width, bed_height, groups),
+            "placements": ordered_placements,
+            "pendants": len(placed),
+            "strokes": sum(len(g[2]) for g in groups),
+            "utilization": round(used / (bed_width * bed_height), 4),
+            "travel_mm": round(travel_length(g[2] for g in groups), 1),
+            "travel_mm_unoptimized": round(travel_length(unoptimized), 1)
+        })
+
+    return {
+        "success": True,
+        "bed": {"width_mm": bed_width, "height_mm": bed_height, "spacing_mm": spacing, "rotate": rotate},
+        "beds": beds,
+        "placed": sum(b["pendants"] for b in beds),
+        "unplaced": [{"item": pendants[i][0], "copy": pendants[i][1]} for i in unplaced]
+    }
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Dithering Benchmark
+Measures throughput and tone fidelity of the dither methods, and checks the
+diagonal-parallel Floyd-Steinberg against a serial per-pixel scan
+
+Usage: python benchmark_dithering.py [image] [options]
+"""
+
+import sys
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from dithering import DITHER_METHODS, FS_WEIGHTS, dither, threshold_tile
+
+
+def synthetic_photo(width, height, seed=0):
+    """Smooth random tones with some fine texture, standing in for a pet photo"""
+    rng = np.random.default_rng(seed)
+    base = cv2.resize(cv2.GaussianBlur((rng.random((30, 40)) * 255).astype(np.uint8), (0, 0), 3),
+                      (width, height), interpolation=cv2.INTER_CUBIC)
+    texture = rng.normal(0, 12, (height, width))
+    return np.clip(base + texture, 0, 255).astype(np.uint8)
+
+
+def serial_floyd_steinberg(gray):
+    """Reference scan, one pixel per Python iteration (same float32 arithmetic)"""
+    height, width = gray.shape
+    work = np.zeros((height + 1, width + 2), np.float32)
+    work[:height, 1:width + 1] = gray
+    output = np.zeros((height, width), np.uint8)
+    right, below_left, below, below_right = FS_WEIGHTS
+    for y in range(height):
+        for x in range(width):
+            value = work[y, x + 1]
+            on = value >= 128
+            output[y, x] = 255 if on else 0
+            error = value - (np.float32(255) if on else np.float32(0))
+            work[y, x + 2] += error * right
+            work[y + 1, x] += error * below_left
+            work[y + 1, x + 1] += error * below
+            work[y + 1, x + 2] += error * below_right
+    return output
+
+
+def tone_error(gray, dithered, sigma=2.0):
+    """Mean absolute difference (0-255) between the image and its blurred dither"""
+    perceived = cv2.GaussianBlur(dithered.astype(np.float32), (0, 0), sigma)
+    reference = cv2.GaussianBlur(gray.astype(np.float32), (0, 0), sigma)
+    return float(np.mean(np.abs(perceived - reference)))
+
+
+def benchmark(gray, methods, repeat, scale):
+    results = []
+    megapixels = gray.size / 1e6
+    for method in methods:
+        # First call builds and caches the threshold tile
+        start = time.perf_counter()
+        dithered = dither(gray, method, scale=scale)
+        first_ms = (time.perf_counter() - start) * 1000
+
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            dither(gray, method, scale=scale)
+            latencies.append(time.perf_counter() - start)
+        latencies_ms = np.array(latencies) * 1000
+
+        results.append({
+            'method': method,
+            'first_call_ms': round(first_ms, 1),
+            'latency_ms_mean': round(float(latencies_ms.mean()), 1),
+            'latency_ms_p50': round(float(np.percentile(latencies_ms, 50)), 1),
+            'megapixels_per_second': round(megapixels / (latencies_ms.mean() / 1000), 1),
+            'tone_error': round(tone_error(gray, dithered), 2)
+        })
+    return results
+
+
+def serial_check(gray, crop):
+    """Serial throughput on a crop, and whether the parallel diffusion matches it"""
+    sample = gray[:crop, :crop]
+    start = time.perf_counter()
+    reference = serial_floyd_steinberg(sample)
+    seconds = time.perf_counter() - start
+    return {
+        'crop': list(sample.shape),
+        'megapixels_per_second': round(sample.size / 1e6 / seconds, 3),
+        'matches_parallel': bool(np.array_equal(reference, dither(sample, 'diffusion')))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dithering methods')
+    parser.add_argument('image', nargs='?', help='Grayscale test image (default: synthetic photo)')
+    parser.add_argument('--size', default='4000x3000', help='Synthetic image size WxH (default 4000x3000)')
+    parser.add_argument('--methods', default=','.join(DITHER_METHODS),
+                        help='Comma-separated methods to compare (default: all)')
+    parser.add_argument('--scale', type=int, default=1, help='Image pixels per dither dot')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per method')
+    parser.add_argument('--serial-crop', type=int, default=256,
+                        help='Side of the crop for the serial Floyd-Steinberg reference (0 skips it)')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    methods = [m.strip() for m in args.methods.split(',') if m.strip()]
+    unknown = [m for m in methods if m not in DITHER_METHODS]
+    if unknown:
+        print(f"[ERROR] Unknown methods: {', '.join(unknown)}")
+        print(f"Available: {', '.join(DITHER_METHODS)}")
+        sys.exit(1)
+
+    if args.image:
+        gray = cv2.imread(args.image, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"[ERROR] Could not read {args.image}")
+            sys.exit(1)
+    else:
+        width, height = (int(v) for v in args.size.lower().split('x'))
+        gray = synthetic_photo(width, height)
+
+    print(f"Image: {gray.shape[1]}x{gray.shape[0]} ({gray.size / 1e6:.1f} MP), scale {args.scale}")
+    results = benchmark(gray, methods, args.repeat, args.scale)
+
+    print("\n" + "="*72)
+    print(f"{'method':<14}{'first ms':>10}{'mean ms':>10}{'p50 ms':>10}{'MP/s':>10}{'tone err':>11}")
+    print("-"*72)
+    for r in results:
+        print(f"{r['method']:<14}{r['first_call_ms']:>10}{r['latency_ms_mean']:>10}{r['latency_ms_p50']:>10}"
+              f"{r['megapixels_per_second']:>10}{r['tone_error']:>11}")
+    print("="*72)
+    print("tone err: mean |blur(dither) - blur(image)| on 0-255 (lower is closer)")
+    print(f"blue-noise tile: {threshold_tile('blue_noise').shape[0]}px, cached per process")
+
+    serial = None
+    if args.serial_crop > 0:
+        serial = serial_check(gray, args.serial_crop)
+        print(f"\nSerial Floyd-Steinberg on {serial['crop'][1]}x{serial['crop'][0]}: "
+              f"{serial['megapixels_per_second']} MP/s, "
+              f"parallel result {'identical' if serial['matches_parallel'] else 'DIFFERS'}")
+        diffusion = next((r for r in results if r['method'] == 'diffusion'), None)
+        if diffusion and args.scale == 1:
+            print(f"Diagonal-parallel diffusion speedup: "
+                  f"{diffusion['megapixels_per_second'] / serial['megapixels_per_second']:.0f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'shape': list(gray.shape), 'scale': args.scale, 'repeat': args.repeat,
+                       'results': results, 'serial': serial}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
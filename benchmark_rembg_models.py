@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Background Removal Model Benchmark
+Compares rembg model variants (including INT8) against a full-precision
+reference on a local folder of fixture images
+
+Usage: python benchmark_rembg_models.py <fixtures_dir> [options]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+from rembg import remove
+
+from rembg_models import MODEL_VARIANTS, create_session
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def load_fixtures(folder):
+    paths = sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise ValueError(f"No images found in {folder}")
+    return [(os.path.basename(path), Image.open(path).convert('RGB')) for path in paths]
+
+
+def predict_masks(session, fixtures, repeat):
+    """Binary masks per fixture and the per-call latencies in seconds"""
+    masks, latencies = {}, []
+    for name, image in fixtures:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            mask = remove(image, session=session, only_mask=True)
+            latencies.append(time.perf_counter() - start)
+        masks[name] = np.asarray(mask) >= 128
+    return masks, latencies
+
+
+def iou(a, b):
+    union = np.logical_or(a, b).sum()
+    # Two empty masks agree perfectly
+    return 1.0 if union == 0 else float(np.logical_and(a, b).sum() / union)
+
+
+def benchmark(fixtures, models, reference, repeat, warmup):
+    results = []
+    reference_masks = None
+
+    # The reference runs first so every variant is compared against it
+    for variant in [reference] + [m for m in models if m != reference]:
+        print(f"Loading {variant}...")
+        load_start = time.perf_counter()
+        session = create_session(variant)
+        load_seconds = time.perf_counter() - load_start
+
+        for _ in range(warmup):
+            remove(fixtures[0][1], session=session, only_mask=True)
+
+        print(f"Running {variant} on {len(fixtures)} images x{repeat}...")
+        masks, latencies = predict_masks(session, fixtures, repeat)
+        if reference_masks is None:
+            reference_masks = masks
+
+        scores = [iou(masks[name], reference_masks[name]) for name, _ in fixtures]
+        latencies_ms = np.array(latencies) * 1000
+        results.append({
+            'model': variant,
+            'load_seconds': round(load_seconds, 2),
+            'latency_ms_mean': round(float(latencies_ms.mean()), 1),
+            'latency_ms_p50': round(float(np.percentile(latencies_ms, 50)), 1),
+            'latency_ms_p95': round(float(np.percentile(latencies_ms, 95)), 1),
+            'throughput_ips': round(len(latencies) / float(sum(latencies)), 2),
+            'iou_mean': round(float(np.mean(scores)), 4),
+            'iou_min': round(float(np.min(scores)), 4)
+        })
+    return results
+
+
+def print_table(results, reference):
+    print("\n" + "="*86)
+    print(f"{'model':<20}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>9}"
+          f"{'IoU mean':>11}{'IoU min':>10}{'load s':>8}")
+    print("-"*86)
+    for r in results:
+        print(f"{r['model']:<20}{r['latency_ms_mean']:>10}{r['latency_ms_p50']:>10}{r['latency_ms_p95']:>10}"
+              f"{r['throughput_ips']:>9}{r['iou_mean']:>11}{r['iou_min']:>10}{r['load_seconds']:>8}")
+    print("="*86)
+    print(f"IoU is measured against {reference} on masks thresholded at 128")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark rembg model variants')
+    parser.add_argument('fixtures', help='Folder of test images')
+    parser.add_argument('--models', default=','.join(MODEL_VARIANTS),
+                        help='Comma-separated variants to compare (default: all)')
+    parser.add_argument('--reference', default='u2net', help='Full-precision reference variant')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per image')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed runs before timing')
+    parser.add_argument('--min-iou', type=float, default=0.95,
+                        help='Quality bar for the recommendation (mean IoU)')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    models = [m.strip() for m in args.models.split(',') if m.strip()]
+    unknown = [m for m in models + [args.reference] if m not in MODEL_VARIANTS]
+    if unknown:
+        print(f"[ERROR] Unknown models: {', '.join(unknown)}")
+        print(f"Available: {', '.join(MODEL_VARIANTS)}")
+        sys.exit(1)
+
+    try:
+        fixtures = load_fixtures(args.fixtures)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    results = benchmark(fixtures, models, args.reference, args.repeat, args.warmup)
+    print_table(results, args.reference)
+
+    passing = [r for r in results if r['iou_mean'] >= args.min_iou]
+    if passing:
+        best = min(passing, key=lambda r: r['latency_ms_mean'])
+        print(f"\nFastest model with mean IoU >= {args.min_iou}: {best['model']} "
+              f"({best['latency_ms_mean']} ms, IoU {best['iou_mean']})")
+        print(f"Deploy with: REMBG_MODEL={best['model']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'reference': args.reference, 'fixtures': len(fixtures),
+                       'repeat': args.repeat, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
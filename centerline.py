@@ -0,0 +1,177 @@
+"""
+Centerline (single-stroke) vectorization for line-art engravings.
+
+vectorize_to_svg traces the outline of every black stroke, so a line
+becomes a closed path around it and the laser travels it twice. Here the
+binary style output is skeletonized, the skeleton is turned into a stroke
+graph (endpoints and junctions are nodes, the one-pixel chains between
+them are edges), short spurs are pruned, and each edge is simplified and
+emitted as one open polyline whose stroke width is the measured width of
+the original line.
+"""
+
+import cv2
+import numpy as np
+import svgwrite
+from skimage.morphology import skeletonize
+
+# 8-neighbourhood offsets (dy, dx)
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def ink_mask(image_array):
+    """Binary mask of the strokes (dark lines on light background, or the reverse)"""
+    gray = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY) if len(image_array.shape) == 3 else image_array
+    # Same convention as vectorize_to_svg: trace the minority (line) colour
+    if np.mean(gray) > 127:
+        gray = cv2.bitwise_not(gray)
+    _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+    return binary
+
+
+def _skeleton_graph(skeleton):
+    """Skeleton pixel coordinates and, per pixel, the indices of its skeleton neighbours"""
+    padded = np.pad(skeleton, 1)
+    ys, xs = np.nonzero(padded)
+    index = np.zeros(padded.shape, np.int64)
+    index[ys, xs] = np.arange(1, len(ys) + 1)
+
+    neighbours = np.stack([index[ys + dy, xs + dx] for dy, dx in NEIGHBOURS], axis=1) - 1
+    adjacency = [[n for n in row if n >= 0] for row in neighbours.tolist()]
+    points = np.stack([xs - 1, ys - 1], axis=1)
+    return points, adjacency
+
+
+def trace_strokes(skeleton):
+    """
+    Split a one-pixel skeleton into pixel chains between nodes (pixels with
+    other than two neighbours); closed loops without nodes become one chain.
+    Returns (chains, degrees) where chains are lists of pixel indices.
+    """
+    points, adjacency = _skeleton_graph(skeleton)
+    degree = [len(a) for a in adjacency]
+    visited = [False] * len(adjacency)
+    chains = []
+    seen_node_pairs = set()
+
+    def walk(start, first):
+        chain = [start, first]
+        prev, cur = start, first
+        while degree[cur] == 2:
+            visited[cur] = True
+            nxt = adjacency[cur][0] if adjacency[cur][0] != prev else adjacency[cur][1]
+            if visited[nxt] and degree[nxt] == 2:
+                break
+            chain.append(nxt)
+            prev, cur = cur, nxt
+            if cur == start:
+                break
+        return chain
+
+    for node in range(len(adjacency)):
+        if degree[node] == 2:
+            continue
+        if degree[node] == 0:
+            chains.append([node])
+            continue
+        for first in adjacency[node]:
+            if degree[first] != 2:
+                # Two adjacent nodes: a one-step edge, emitted once
+                pair = (min(node, first), max(node, first))
+                if pair not in seen_node_pairs:
+                    seen_node_pairs.add(pair)
+                    chains.append([node, first])
+            elif not visited[first]:
+                chains.append(walk(node, first))
+
+    # Whatever is left are loops made only of two-neighbour pixels
+    for start in range(len(adjacency)):
+        if degree[start] == 2 and not visited[start]:
+            visited[start] = True
+            chains.append(walk(start, adjacency[start][0]) + [start])
+
+    return points, chains, degree
+
+
+def centerline_strokes(image_array, epsilon=1.5, min_spur=None):
+    """
+    Open polylines along the middle of every stroke.
+    Returns a list of (points Nx2 int array, stroke width) tuples.
+    """
+    binary = ink_mask(image_array)
+    skeleton = skeletonize(binary > 0)
+    if not skeleton.any():
+        return []
+
+    # A centre pixel lies (w + 1) / 2 from the background of a w-pixel line
+    distance = cv2.distanceTransform(binary, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    points, chains, degree = trace_strokes(skeleton)
+
+    widths = np.maximum(2 * distance[points[:, 1], points[:, 0]] - 1, 1)
+    if min_spur is None:
+        min_spur = max(3.0, float(np.median(widths)))
+
+    # Junctions are often a few touching pixels; merge each cluster into
+    # one node at its centroid so strokes meet instead of leaving gaps
+    cluster = np.zeros(len(points), np.int64)
+    junction = np.array(degree) >= 3
+    if junction.any():
+        mask = np.zeros(skeleton.shape, np.uint8)
+        mask[points[junction, 1], points[junction, 0]] = 1
+        _, labels = cv2.connectedComponents(mask, connectivity=8)
+        cluster[junction] = labels[points[junction, 1], points[junction, 0]]
+        centroids = {label: np.round(points[cluster == label].mean(axis=0)).astype(np.int32)
+                     for label in np.unique(cluster[junction])}
+
+    strokes = []
+    for chain in chains:
+        ends = (degree[chain[0]], degree[chain[-1]])
+        start_cluster, end_cluster = cluster[chain[0]], cluster[chain[-1]]
+        # Edges inside one junction cluster carry no stroke
+        if start_cluster and start_cluster == end_cluster and all(cluster[i] for i in chain):
+            continue
+        # A short branch from a junction to a free end is a skeleton artifact
+        if len(chain) < min_spur and 1 in ends and max(ends) >= 3:
+            continue
+        polyline = points[chain].astype(np.int32)
+        if start_cluster:
+            polyline[0] = centroids[start_cluster]
+        if end_cluster:
+            polyline[-1] = centroids[end_cluster]
+        if len(polyline) > 2:
+            closed = chain[0] == chain[-1]
+            polyline = cv2.approxPolyDP(polyline.reshape(-1, 1, 2), epsilon, closed).reshape(-1, 2)
+            if closed:
+                polyline = np.vstack([polyline, polyline[:1]])
+        width = float(np.median(widths[chain]))
+        strokes.append((polyline, max(1.0, round(width * 2) / 2)))
+    return strokes
+
+
+def path_length(polyline):
+    if len(polyline) < 2:
+        return 0.0
+    return float(np.sum(np.hypot(*np.diff(polyline, axis=0).T)))
+
+
+def vectorize_to_centerline_svg(image_array, output_path=None):
+    """Convert a binary line-art image to an SVG of open single-stroke polylines"""
+    strokes = centerline_strokes(image_array)
+    height, width = image_array.shape[:2]
+    dwg = svgwrite.Drawing(size=(width, height))
+
+    # Add white background
+    dwg.add(dwg.rect(insert=(0, 0), size=(width, height), fill='white'))
+
+    for polyline, stroke_width in strokes:
+        points = polyline.tolist()
+        if len(points) == 1:
+            # Isolated dot: a zero-length segment renders as a round dot
+            points = points * 2
+        path_data = f"M {points[0][0]},{points[0][1]} " + " ".join(f"L {x},{y}" for x, y in points[1:])
+        dwg.add(dwg.path(d=path_data, fill='none', stroke='black', stroke_width=stroke_width,
+                         stroke_linecap='round', stroke_linejoin='round'))
+
+    if output_path:
+        dwg.saveas(output_path)
+    return dwg.tostring()
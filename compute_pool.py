@@ -0,0 +1,283 @@
+"""
+Process-pool compute tier with shared-memory image handoff.
+
+The contour loop in vectorize_to_svg and the pixel-graph walk of the
+centerline tracer hold the GIL, so threads do not scale them, and
+pickling multi-megabyte arrays into a ProcessPoolExecutor costs about as
+much as the work itself. Here the request handler copies the decoded image
+into a multiprocessing.shared_memory block once; pool workers receive only
+a small descriptor (name, shape, dtype), attach to the block, and write
+their output into a second shared block the parent allocated.
+
+Lifecycle: every block belongs to a ComputeSession and is unlinked when the
+session exits. The pool keeps a registry of live blocks; blocks older than
+SHM_LEAK_SECONDS are reported as leaks on /health and reaped.
+
+Configuration (environment):
+    COMPUTE_POOL_WORKERS  - process count, 'auto' for the thread policy's
+                            per-worker budget, 0 disables the pool (default 0)
+    SHM_LEAK_SECONDS      - age after which a live block counts as leaked (default 300)
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# Before numpy: in a pool process this pins the OpenMP/BLAS pools to one thread
+from thread_policy import policy as thread_policy
+
+import numpy as np
+
+from filtre_gravure_simple.buffer_arena import request_scope
+
+logger = logging.getLogger(__name__)
+
+COMPUTE_POOL_WORKERS = os.environ.get('COMPUTE_POOL_WORKERS', '0')
+COMPUTE_POOL_WORKERS = (thread_policy.threads_per_worker if COMPUTE_POOL_WORKERS == 'auto'
+                        else int(COMPUTE_POOL_WORKERS))
+SHM_LEAK_SECONDS = float(os.environ.get('SHM_LEAK_SECONDS', 300))
+
+
+class SharedArray:
+    """A numpy array backed by a named shared memory block"""
+
+    def __init__(self, shm, shape, dtype):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+    @property
+    def descriptor(self):
+        """Picklable handle sent to workers instead of the pixels"""
+        return (self.shm.name, self.shape, self.dtype.str)
+
+    @property
+    def nbytes(self):
+        return self.array.nbytes
+
+
+def _attach(descriptor):
+    name, shape, dtype = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _init_worker():
+    # Pool workers import the service modules to unpickle task functions;
+    # they must never start pools of their own. The pool is the parallelism,
+    # so each process keeps OpenCV single-threaded (the services skip their
+    # module-level apply_opencv() in pool processes).
+    global COMPUTE_POOL_WORKERS
+    COMPUTE_POOL_WORKERS = 0
+    thread_policy.apply_opencv(1)
+
+
+def _run_image_task(func, src_descriptor, dst_descriptor, args, kwargs):
+    """Worker side: func(src) is written into the shared dst block"""
+    src_shm, src = _attach(src_descriptor)
+    dst_shm, dst = _attach(dst_descriptor)
+    try:
+        # The worker's own arena: scratch buffers are reused across tasks
+        # once the result is copied out
+        with request_scope(func.__name__):
+            result = func(src, *args, **kwargs)
+            if result.shape != dst.shape:
+                raise ValueError(f"{func.__name__} returned shape {result.shape}, expected {dst.shape}")
+            np.copyto(dst, result, casting='unsafe')
+            del result
+    finally:
+        # Drop the views before closing so the buffers can be released
+        del src, dst
+        src_shm.close()
+        dst_shm.close()
+
+
+def _run_value_task(func, src_descriptor, args, kwargs):
+    """Worker side: func(src) is returned by pickling (for small results like SVG text)"""
+    src_shm, src = _attach(src_descriptor)
+    try:
+        with request_scope(func.__name__):
+            return func(src, *args, **kwargs)
+    finally:
+        del src
+        src_shm.close()
+
+
+class ComputeSession:
+    """Owns the shared blocks of one request and unlinks them on exit"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def allocate(self, shape, dtype=np.uint8):
+        block = self.pool._create(shape, dtype)
+        self.blocks.append(block)
+        return block
+
+    def share(self, array):
+        """Copy an array into a new shared block"""
+        block = self.allocate(array.shape, array.dtype)
+        np.copyto(block.array, array)
+        return block
+
+    def submit_image(self, func, src, *args, **kwargs):
+        """
+        Run func(src) in a worker; the future resolves to a SharedArray
+        holding the (height, width) uint8 result
+        """
+        dst = self.allocate(src.shape[:2], np.uint8)
+        future = self.pool.executor.submit(_run_image_task, func, src.descriptor,
+                                           dst.descriptor, args, kwargs)
+        return _MappedFuture(future, dst)
+
+    def submit_value(self, func, src, *args, **kwargs):
+        """Run func(src) in a worker and return its pickled result"""
+        return self.pool.executor.submit(_run_value_task, func, src.descriptor, args, kwargs)
+
+    def release(self):
+        for block in self.blocks:
+            self.pool._destroy(block)
+        self.blocks = []
+
+
+class _MappedFuture:
+    """Future whose result() is the shared output block once the worker is done"""
+
+    def __init__(self, future, block):
+        self._future = future
+        self._block = block
+
+    def result(self, timeout=None):
+        self._future.result(timeout)
+        return self._block
+
+
+class ComputePool:
+    def __init__(self, workers, leak_seconds=SHM_LEAK_SECONDS):
+        self.workers = workers
+        self.leak_seconds = leak_seconds
+
+        # forkserver avoids forking a multi-threaded gunicorn worker. It
+        # preloads nothing: not __main__, which would run the app's
+        # module-level setup, and not numpy, whose BLAS pool would be sized
+        # from the serving worker's environment before thread_policy runs
+        # in the pool process
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([])
+        else:
+            context = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker
+        )
+
+        self._lock = threading.Lock()
+        self._live = {}
+        self.created = 0
+        self.released = 0
+        self.reaped = 0
+        self.peak_bytes = 0
+        self._live_bytes = 0
+
+        atexit.register(self.shutdown)
+
+    def session(self):
+        return ComputeSession(self)
+
+    def _create(self, shape, dtype):
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        block = SharedArray(shm, shape, dtype)
+        with self._lock:
+            self._live[shm.name] = (time.monotonic(), block, nbytes)
+            self.created += 1
+            self._live_bytes += nbytes
+            self.peak_bytes = max(self.peak_bytes, self._live_bytes)
+        return block
+
+    def _destroy(self, block):
+        with self._lock:
+            entry = self._live.pop(block.shm.name, None)
+            if entry is None:
+                return
+            self.released += 1
+            self._live_bytes -= entry[2]
+        block.array = None
+        try:
+            block.shm.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            block.shm.close()
+        except BufferError:
+            # A caller still holds a view; the mapping goes away with it
+            pass
+
+    def leaked(self):
+        """Live blocks older than the leak threshold"""
+        cutoff = time.monotonic() - self.leak_seconds
+        with self._lock:
+            return [block for created, block, _ in self._live.values() if created < cutoff]
+
+    def reap_leaks(self):
+        for block in self.leaked():
+            logger.warning(f"Reaping leaked shared memory block {block.shm.name} ({block.nbytes} bytes)")
+            self._destroy(block)
+            self.reaped += 1
+
+    def stats(self):
+        leaked = len(self.leaked())
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'live_blocks': len(self._live),
+                'live_bytes': self._live_bytes,
+                'peak_bytes': self.peak_bytes,
+                'created': self.created,
+                'released': self.released,
+                'leaked': leaked,
+                'reaped': self.reaped
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            blocks = [block for _, block, _ in self._live.values()]
+        for block in blocks:
+            self._destroy(block)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_compute_pool():
+    """The per-worker pool, created on first use; None when disabled"""
+    global _pool
+    if COMPUTE_POOL_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ComputePool(COMPUTE_POOL_WORKERS)
+        else:
+            _pool.reap_leaks()
+        return _pool
+
+def compute_pool_stats():
+    """Stats of the pool if it has been started, without starting it"""
+    return _pool.stats() if _pool is not None else None
@@ -0,0 +1,219 @@
+"""
+Tone-mapped crosshatch for engraving.
+
+Darkness is quantized into layers: layer k covers every pixel darker than
+(k + 1) / (layers + 1), and each layer adds one family of parallel hatch
+lines at its own angle (base, base + 90, base + 45, base - 45, ...), so
+darker tones collect more crossing lines.
+
+Each family's direction is snapped to the nearest small-integer vector
+(a, b). That makes the pattern exactly periodic over a square tile of
+spacing * |(a, b)| pixels. The tiles are built once per (spacing, angle,
+width) and tiled over the frame, and compositing a layer is a mask AND plus
+an OR into the ink buffer, independent of image content.
+
+The same layers are available as vector hatch lines: every line of a family
+is sampled across the layer mask with cv2.remap, and the runs inside the
+mask become straight segments. Alternate lines run in opposite directions so
+the engraver head sweeps back and forth. `hatch_strokes()` hands the same
+segments to the G-code/DXF exporters.
+
+Configuration (environment):
+    CROSSHATCH_SPACING  - distance between hatch lines in pixels (default 6)
+    CROSSHATCH_ANGLE    - angle of the first layer in degrees (default 45)
+    CROSSHATCH_LAYERS   - number of tone layers, 1-6 (default 4)
+"""
+
+import os
+import math
+from functools import lru_cache
+
+import cv2
+import numpy as np
+import svgwrite
+
+from filtre_gravure_simple.buffer_arena import scratch, release
+
+CROSSHATCH_SPACING = float(os.environ.get('CROSSHATCH_SPACING', 6))
+CROSSHATCH_ANGLE = float(os.environ.get('CROSSHATCH_ANGLE', 45))
+CROSSHATCH_LAYERS = int(os.environ.get('CROSSHATCH_LAYERS', 4))
+
+MAX_LAYERS = 6
+# Largest component of a snapped direction; bounds the tile size
+MAX_DIRECTION_STEP = 5
+# Lines sampled per block when tracing vector hatch lines
+LINE_BLOCK = 128
+
+# Angle offsets of successive layers relative to the base angle
+LAYER_OFFSETS = [0, 90, 45, -45, 22.5, -67.5]
+
+
+def crosshatch_options(line_spacing=None, angle=None, layers=None):
+    """Hatch parameters with environment defaults, validated"""
+    options = {
+        'line_spacing': CROSSHATCH_SPACING if line_spacing is None else float(line_spacing),
+        'angle': CROSSHATCH_ANGLE if angle is None else float(angle),
+        'layers': CROSSHATCH_LAYERS if layers is None else int(layers),
+    }
+    if options['line_spacing'] < 2:
+        raise ValueError("line_spacing must be at least 2 pixels")
+    if not 1 <= options['layers'] <= MAX_LAYERS:
+        raise ValueError(f"layers must be between 1 and {MAX_LAYERS}")
+    return options
+
+
+@lru_cache(maxsize=64)
+def hatch_direction(angle):
+    """Integer direction (a, b) closest to the angle, with gcd(a, b) = 1"""
+    target = math.radians(angle) % math.pi
+    candidates = [(a, b) for a in range(-MAX_DIRECTION_STEP, MAX_DIRECTION_STEP + 1)
+                  for b in range(0, MAX_DIRECTION_STEP + 1)
+                  if (a, b) != (0, 0) and math.gcd(a, b) == 1 and (b > 0 or a > 0)]
+
+    def error(direction):
+        difference = abs(math.atan2(direction[1], direction[0]) % math.pi - target)
+        return min(difference, math.pi - difference), abs(direction[0]) + direction[1]
+
+    return min(candidates, key=error)
+
+
+def layer_angles(angle, layers):
+    return [angle + offset for offset in LAYER_OFFSETS[:layers]]
+
+
+def layer_thresholds(layers):
+    """uint8 darkness above which each layer is hatched"""
+    return [int(round(255 * (k + 1) / (layers + 1))) for k in range(layers)]
+
+
+@lru_cache(maxsize=64)
+def hatch_tile(spacing, angle, width=1.0):
+    """
+    Tileable square of one hatch family: 255 on the lines, 0 between them.
+    Lines satisfy (b*x - a*y) mod period < width, i.e. run along (a, b).
+    """
+    a, b = hatch_direction(angle)
+    norm = math.hypot(a, b)
+    period = max(2, int(round(spacing * norm)))
+    y, x = np.indices((period, period))
+    tile = np.where((b * x - a * y) % period < max(1, int(round(width * norm))), 255, 0).astype(np.uint8)
+    tile.flags.writeable = False
+    return tile
+
+
+def hatch_texture(shape, spacing, angle, width=1.0):
+    """Hatch family over a whole frame, anchored at the origin"""
+    tile = hatch_tile(spacing, angle, width)
+    period = tile.shape[0]
+    reps = (-(-shape[0] // period), -(-shape[1] // period))
+    return np.tile(tile, reps)[:shape[0], :shape[1]]
+
+
+def tone_darkness(gray, spacing):
+    """Darkness smoothed at about the hatch pitch so layer borders do not fray"""
+    sigma = max(0.8, spacing / 3.0)
+    inverted = cv2.bitwise_not(gray, dst=scratch(gray.shape[:2]))
+    darkness = cv2.GaussianBlur(inverted, (0, 0), sigma, dst=scratch(gray.shape[:2]))
+    release(inverted)
+    return darkness
+
+
+def layer_masks(darkness, layers):
+    """One mask per layer, written into the same buffer: use each before advancing"""
+    mask = scratch(darkness.shape)
+    for threshold in layer_thresholds(layers):
+        yield cv2.compare(darkness, threshold, cv2.CMP_GE, dst=mask)
+    release(mask)
+
+
+def crosshatch(gray, line_spacing=CROSSHATCH_SPACING, angle=CROSSHATCH_ANGLE, layers=CROSSHATCH_LAYERS):
+    """Binary crosshatch (black lines on white) of a grayscale image"""
+    darkness = tone_darkness(gray, line_spacing)
+    ink = scratch(gray.shape[:2], fill=0)
+    layer_ink = scratch(gray.shape[:2])
+    for mask, layer_angle in zip(layer_masks(darkness, layers), layer_angles(angle, layers)):
+        texture = hatch_texture(ink.shape, line_spacing, layer_angle)
+        cv2.bitwise_or(ink, cv2.bitwise_and(texture, mask, dst=layer_ink), dst=ink)
+    release(darkness, layer_ink)
+    # Invert in place: ink becomes the black-on-white output
+    return cv2.bitwise_not(ink, dst=ink)
+
+
+def hatch_segments(mask, spacing, angle, min_length=2.0):
+    """
+    Straight segments of one hatch family inside a layer mask, on the same
+    lines the raster texture draws. Returns an (N, 4) float32 array of
+    x1, y1, x2, y2 in engraving order.
+    """
+    a, b = hatch_direction(angle)
+    norm = math.hypot(a, b)
+    period = max(2, int(round(spacing * norm)))
+    step = period / norm
+    direction = np.array([a, b], np.float32) / norm
+    normal = np.array([b, -a], np.float32) / norm
+
+    height, width = mask.shape
+    corners = np.array([[0, 0], [width - 1, 0], [0, height - 1], [width - 1, height - 1]], np.float32)
+    along = corners @ direction
+    across = corners @ normal
+    offsets = np.arange(math.ceil(across.min() / step), math.floor(across.max() / step) + 1) * step
+    positions = np.arange(math.floor(along.min()), math.ceil(along.max()) + 1, dtype=np.float32)
+
+    segments = []
+    for first in range(0, len(offsets), LINE_BLOCK):
+        block = offsets[first:first + LINE_BLOCK].astype(np.float32)[:, None]
+        map_x = block * normal[0] + positions * direction[0]
+        map_y = block * normal[1] + positions * direction[1]
+        inside = cv2.remap(mask, map_x, map_y, cv2.INTER_NEAREST,
+                           borderMode=cv2.BORDER_CONSTANT, borderValue=0) > 0
+
+        # Run starts and ends along every line at once
+        edges = np.diff(np.pad(inside, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+        line, start = np.nonzero(edges == 1)
+        _, end = np.nonzero(edges == -1)
+        keep = (end - 1 - start) >= min_length
+        line, start, end = line[keep], start[keep], end[keep] - 1
+
+        points = np.stack([map_x[line, start], map_y[line, start], map_x[line, end], map_y[line, end]], axis=1)
+        # Boustrophedon: every other line is engraved backwards
+        backwards = (line + first) % 2 == 1
+        points[backwards] = points[backwards][:, [2, 3, 0, 1]]
+        order = np.lexsort((np.where(backwards, -start, start), line))
+        segments.append(points[order])
+
+    return np.concatenate(segments) if segments else np.zeros((0, 4), np.float32)
+
+
+def hatch_layers(gray, line_spacing=CROSSHATCH_SPACING, angle=CROSSHATCH_ANGLE, layers=CROSSHATCH_LAYERS):
+    """Hatch segments of every tone layer, lightest layer first"""
+    darkness = tone_darkness(gray, line_spacing)
+    segments = [hatch_segments(mask, line_spacing, layer_angle)
+                for mask, layer_angle in zip(layer_masks(darkness, layers), layer_angles(angle, layers))]
+    release(darkness)
+    return segments
+
+
+def hatch_strokes(gray, line_spacing=CROSSHATCH_SPACING, angle=CROSSHATCH_ANGLE, layers=CROSSHATCH_LAYERS):
+    """The hatch lines as open two-point (points, closed, stroke width) strokes in engraving order"""
+    return [(segment.reshape(2, 2), False, 1.0)
+            for segments in hatch_layers(gray, line_spacing, angle, layers) for segment in segments]
+
+
+def crosshatch_svg(gray, line_spacing=CROSSHATCH_SPACING, angle=CROSSHATCH_ANGLE, layers=CROSSHATCH_LAYERS,
+                   output_path=None):
+    """SVG of the crosshatch layers as straight hatch lines, one group per layer"""
+    height, width = gray.shape[:2]
+    dwg = svgwrite.Drawing(size=(width, height))
+
+    # Add white background
+    dwg.add(dwg.rect(insert=(0, 0), size=(width, height), fill='white'))
+
+    for index, segments in enumerate(hatch_layers(gray, line_spacing, angle, layers)):
+        group = dwg.g(id=f"hatch-layer-{index}", stroke='black', stroke_width=1, fill='none')
+        for x1, y1, x2, y2 in segments.tolist():
+            group.add(dwg.path(d=f"M {x1:.1f},{y1:.1f} L {x2:.1f},{y2:.1f}"))
+        dwg.add(group)
+
+    if output_path:
+        dwg.saveas(output_path)
+    return dwg.tostring()
@@ -0,0 +1,202 @@
+"""
+Dithering styles for photographic engravings.
+
+Ordered dithering compares the whole image against a threshold matrix tiled
+over the frame in one array operation:
+    - bayer:      recursive Bayer matrix (2, 4, 8 or 16 wide), regular
+                  crosshatch-like texture
+    - blue_noise: 64 x 64 void-and-cluster matrix, no visible pattern; built
+                  once per process (under half a second) and cached
+Both matrices are cached as uint8 threshold tiles.
+
+Error diffusion (Floyd-Steinberg) is inherently serial along a row, but
+pixel (y, x) only depends on pixels whose x + 2y is smaller, so all pixels
+on one skewed diagonal x + 2y = t are independent. They are processed
+together, one numpy step per diagonal: w + 2h steps instead of w * h
+Python iterations, with the same result as the serial scan.
+
+`scale` dithers at a coarser grid (scale x scale pixels per dot) so the dot
+pitch can match the engraver's resolution.
+
+Configuration (environment):
+    DITHER_METHOD      - bayer, blue_noise (default) or diffusion
+    DITHER_BAYER_SIZE  - Bayer matrix width: 2, 4, 8 (default) or 16
+    DITHER_SCALE       - image pixels per dither dot (default 1)
+"""
+
+import os
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from filtre_gravure_simple.buffer_arena import scratch, release
+
+DITHER_METHOD = os.environ.get('DITHER_METHOD', 'blue_noise').lower()
+DITHER_BAYER_SIZE = int(os.environ.get('DITHER_BAYER_SIZE', 8))
+DITHER_SCALE = int(os.environ.get('DITHER_SCALE', 1))
+
+DITHER_METHODS = ('bayer', 'blue_noise', 'diffusion')
+BAYER_SIZES = (2, 4, 8, 16)
+BLUE_NOISE_SIZE = 64
+MAX_SCALE = 16
+
+# Floyd-Steinberg weights: right, below-left, below, below-right
+FS_WEIGHTS = np.array([7, 3, 5, 1], np.float32) / np.float32(16)
+
+
+def dither_options(method=None, bayer_size=None, scale=None):
+    """Dithering parameters with environment defaults, validated"""
+    options = {
+        'method': (method or DITHER_METHOD).lower(),
+        'bayer_size': DITHER_BAYER_SIZE if bayer_size is None else int(bayer_size),
+        'scale': DITHER_SCALE if scale is None else int(scale),
+    }
+    if options['method'] not in DITHER_METHODS:
+        raise ValueError(f"Unknown dither method '{options['method']}', expected one of {list(DITHER_METHODS)}")
+    if options['bayer_size'] not in BAYER_SIZES:
+        raise ValueError(f"bayer_size must be one of {list(BAYER_SIZES)}")
+    if not 1 <= options['scale'] <= MAX_SCALE:
+        raise ValueError(f"scale must be between 1 and {MAX_SCALE}")
+    return options
+
+
+def bayer_matrix(size):
+    """Bayer index matrix with values 0 .. size*size - 1"""
+    matrix = np.zeros((1, 1), np.int64)
+    while matrix.shape[0] < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2],
+                           [4 * matrix + 3, 4 * matrix + 1]])
+    return matrix
+
+
+def void_and_cluster(size=BLUE_NOISE_SIZE, sigma=1.5, seed=0):
+    """
+    Blue-noise rank matrix (values 0 .. size*size - 1) by Ulichney's
+    void-and-cluster method on a torus, with the Gaussian energy updated
+    incrementally as pixels are added or removed
+    """
+    n = size * size
+    distance = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(distance[:, None] ** 2 + distance[None, :] ** 2) / (2 * sigma ** 2)).ravel()
+    index_y, index_x = np.divmod(np.arange(n), size)
+
+    def energy_at(pixel):
+        # Kernel centred on pixel, wrapped around the torus
+        y, x = index_y[pixel], index_x[pixel]
+        shifted_y = (index_y - y) % size
+        shifted_x = (index_x - x) % size
+        return kernel[shifted_y * size + shifted_x]
+
+    rng = np.random.default_rng(seed)
+    pattern = np.zeros(n, bool)
+    pattern[rng.choice(n, n // 10, replace=False)] = True
+    energy = np.zeros(n)
+    for pixel in np.flatnonzero(pattern):
+        energy += energy_at(pixel)
+
+    # Spread the initial pattern: move the tightest cluster into the largest void
+    while True:
+        cluster = int(np.argmax(np.where(pattern, energy, -np.inf)))
+        pattern[cluster] = False
+        energy -= energy_at(cluster)
+        void = int(np.argmin(np.where(pattern, np.inf, energy)))
+        pattern[void] = True
+        energy += energy_at(void)
+        if void == cluster:
+            break
+
+    ranks = np.zeros(n, np.int64)
+    ones = int(pattern.sum())
+
+    # Ranks below the prototype: remove tightest clusters
+    prototype, prototype_energy = pattern.copy(), energy.copy()
+    for rank in range(ones - 1, -1, -1):
+        cluster = int(np.argmax(np.where(pattern, energy, -np.inf)))
+        pattern[cluster] = False
+        energy -= energy_at(cluster)
+        ranks[cluster] = rank
+
+    # Ranks above: fill the largest voids
+    pattern, energy = prototype, prototype_energy
+    for rank in range(ones, n):
+        void = int(np.argmin(np.where(pattern, np.inf, energy)))
+        pattern[void] = True
+        energy += energy_at(void)
+        ranks[void] = rank
+
+    return ranks.reshape(size, size)
+
+
+@lru_cache(maxsize=8)
+def threshold_tile(method, bayer_size=DITHER_BAYER_SIZE):
+    """uint8 threshold tile: a pixel is white when its gray value exceeds the threshold"""
+    ranks = bayer_matrix(bayer_size) if method == 'bayer' else void_and_cluster()
+    tile = np.floor((ranks + 0.5) * 256 / ranks.size).astype(np.uint8)
+    tile.flags.writeable = False
+    return tile
+
+
+def ordered_dither(gray, tile):
+    """Whole-frame comparison against a tiled threshold matrix"""
+    height, width = gray.shape
+    reps = (-(-height // tile.shape[0]), -(-width // tile.shape[1]))
+    thresholds = np.tile(tile, reps)[:height, :width]
+    return cv2.compare(gray, thresholds, cv2.CMP_GT, dst=scratch(gray.shape))
+
+
+def error_diffusion(gray):
+    """
+    Floyd-Steinberg, processed one skewed diagonal (x + 2y = t) at a time;
+    identical to the serial left-to-right, top-to-bottom scan
+    """
+    height, width = gray.shape
+    stride = width + 2
+    # One column of padding on each side and one row below absorb edge error
+    work = scratch((height + 1, stride), np.float32, fill=0)
+    work[:height, 1:width + 1] = gray
+    flat = work.ravel()
+    output = scratch((height, width))
+    out_flat = output.ravel()
+
+    rows = np.arange(height)
+    right, below_left, below, below_right = FS_WEIGHTS
+    for t in range(width + 2 * (height - 1)):
+        first = max(0, (t - width) // 2 + 1)
+        last = min(height - 1, t // 2)
+        ys = rows[first:last + 1]
+        xs = t - 2 * ys
+        index = ys * stride + xs + 1
+
+        value = flat[index]
+        on = value >= 128
+        out_flat[ys * width + xs] = np.where(on, 255, 0)
+        error = value - np.where(on, np.float32(255), np.float32(0))
+
+        # Row below first: in the serial scan pixel (y - 1, x + 1) passes
+        # its error to (y, x) before (y, x - 1) does
+        flat[index + stride - 1] += error * below_left
+        flat[index + stride] += error * below
+        flat[index + stride + 1] += error * below_right
+        flat[index + 1] += error * right
+    release(work)
+    return output
+
+
+def dither(gray, method=DITHER_METHOD, bayer_size=DITHER_BAYER_SIZE, scale=DITHER_SCALE):
+    """Binary dithered image (0 black, 255 white) of a grayscale image"""
+    height, width = gray.shape[:2]
+    source = gray
+    if scale > 1:
+        source = cv2.resize(gray, (max(1, width // scale), max(1, height // scale)), interpolation=cv2.INTER_AREA)
+
+    if method == 'diffusion':
+        result = error_diffusion(source)
+    else:
+        result = ordered_dither(source, threshold_tile(method, bayer_size))
+
+    if scale > 1:
+        coarse = result
+        result = cv2.resize(coarse, (width, height), dst=scratch((height, width)), interpolation=cv2.INTER_NEAREST)
+        release(coarse)
+    return result
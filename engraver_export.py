@@ -0,0 +1,182 @@
+"""
+G-code and DXF export of traced engravings
+The exporters take the strokes the tracers produce (outline contours,
+centerlines, hatch lines) before any SVG is written, so a machine file
+needs no SVG serialization and re-parse:
+    - gcode: GRBL-style laser program in millimetres; G0 travel between
+             strokes, G1 cuts at the style's feed and power
+    - dxf:   R12 ASCII DXF in millimetres, one POLYLINE per stroke on a
+             layer named after the style
+Strokes are ordered nearest-neighbour from the origin to cut travel
+(hatch lines already come in back-and-forth engraving order); the
+ordering is a k-d tree search and is priced as the 'order' admission step. Image pixels
+map to millimetres at EXPORT_DPI, or so the image spans width_mm; Y is
+flipped so the origin is the bottom-left corner, as on the machine.
+
+The file is generated line by line and streamed in chunks once the
+toolpath is built, so a large job is never held in memory as text.
+
+Configuration (environment):
+    EXPORT_DPI        - image pixels per inch on the engraving (default 300)
+    GCODE_S_MAX       - S value of full laser power, GRBL $30 (default 1000)
+    GCODE_LASER_MODE  - M4 dynamic power (default) or M3 constant power
+"""
+
+import os
+
+import numpy as np
+
+from bed_nesting import order_strokes
+from svg_paths import format_number
+
+EXPORT_DPI = float(os.environ.get('EXPORT_DPI', 300))
+GCODE_S_MAX = int(os.environ.get('GCODE_S_MAX', 1000))
+GCODE_LASER_MODE = os.environ.get('GCODE_LASER_MODE', 'M4').upper()
+
+EXPORT_FORMATS = {
+    'gcode': ('text/x-gcode', 'nc'),
+    'dxf': ('application/dxf', 'dxf'),
+}
+
+# Feed (mm/min) and power (% of GCODE_S_MAX) per traced style: bold
+# outlines burn deeper, fine edge and hatch lines run faster and lighter
+STYLE_SETTINGS = {
+    'standard':   (1500, 60),
+    'detailed':   (1800, 50),
+    'bold':       (1200, 75),
+    'canny':      (2000, 45),
+    'artistic':   (1800, 55),
+    'crosshatch': (3000, 35),
+    'pet':        (1800, 50),
+}
+DEFAULT_SETTINGS = (1500, 60)
+
+# Nearest-neighbour ordering (k-d tree, about 40 us per stroke) is priced
+# by admission control; larger jobs keep the tracer's order
+MAX_ORDERED_STROKES = 20000
+
+# Lines per streamed chunk
+CHUNK_LINES = 2048
+
+
+def export_options(fmt, style, feed=None, power=None, width_mm=None):
+    """Export parameters with the style's defaults, validated"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected json or one of {sorted(EXPORT_FORMATS)}")
+    default_feed, default_power = STYLE_SETTINGS.get(style, DEFAULT_SETTINGS)
+    options = {
+        'format': fmt,
+        'feed': default_feed if feed is None else float(feed),
+        'power': default_power if power is None else float(power),
+        'width_mm': None if width_mm is None else float(width_mm),
+    }
+    if options['feed'] <= 0:
+        raise ValueError("feed must be positive")
+    if not 0 < options['power'] <= 100:
+        raise ValueError("power must be between 0 and 100 percent")
+    if options['width_mm'] is not None and options['width_mm'] <= 0:
+        raise ValueError("width_mm must be positive")
+    return options
+
+
+class Toolpath:
+    """
+    Strokes of one engraving in machine millimetres, ready to stream as
+    G-code or DXF. Built once (and shared by coalesced requests); every
+    call to chunks() generates the file afresh.
+    """
+
+    def __init__(self, width, height, strokes, style, options, ordered=True):
+        scale = options['width_mm'] / width if options['width_mm'] else 25.4 / EXPORT_DPI
+        self.style = style
+        self.options = options
+        self.width_mm = width * scale
+        self.height_mm = height * scale
+
+        strokes = [(np.asarray(points, np.float64), closed) for points, closed, *_ in strokes if len(points)]
+        paths = []
+        for points, closed in strokes:
+            if closed and len(points) > 2:
+                points = np.vstack([points, points[:1]])
+            elif len(points) == 1:
+                # Isolated dot: a zero-length cut
+                points = np.vstack([points, points])
+            paths.append((np.column_stack([points[:, 0] * scale, (height - points[:, 1]) * scale]), False, 0))
+        if ordered and len(paths) <= MAX_ORDERED_STROKES:
+            paths, _ = order_strokes(paths, np.zeros(2))
+        self.paths = [points for points, _, _ in paths]
+
+    @property
+    def mimetype(self):
+        return EXPORT_FORMATS[self.options['format']][0]
+
+    @property
+    def filename(self):
+        return f"engraving-{self.style}.{EXPORT_FORMATS[self.options['format']][1]}"
+
+    def lines(self):
+        return gcode_lines(self) if self.options['format'] == 'gcode' else dxf_lines(self)
+
+    def chunks(self):
+        """The file as text chunks of CHUNK_LINES lines"""
+        batch = []
+        for line in self.lines():
+            batch.append(line)
+            if len(batch) >= CHUNK_LINES:
+                yield '\n'.join(batch) + '\n'
+                batch = []
+        if batch:
+            yield '\n'.join(batch) + '\n'
+
+    def response(self):
+        """Streaming file download of the export"""
+        from flask import Response
+
+        return Response(self.chunks(), mimetype=self.mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{self.filename}"'})
+
+
+def gcode_lines(toolpath):
+    """Laser program: absolute millimetres, laser off for G0, on for G1"""
+    feed = format_number(toolpath.options['feed'])
+    power = int(round(toolpath.options['power'] / 100 * GCODE_S_MAX))
+    dynamic = GCODE_LASER_MODE != 'M3'
+
+    yield f"; PupRing engraving: {toolpath.style}, {len(toolpath.paths)} strokes"
+    size = f"{format_number(toolpath.width_mm)} x {format_number(toolpath.height_mm)} mm"
+    yield f"; {size}, feed {feed} mm/min, power S{power}"
+    yield "G21"
+    yield "G90"
+    # In M4 mode GRBL fires only while moving and never during G0
+    if dynamic:
+        yield "M4 S0"
+    for points in toolpath.paths:
+        coords = [(format_number(x), format_number(y)) for x, y in points.tolist()]
+        yield f"G0 X{coords[0][0]} Y{coords[0][1]}"
+        if not dynamic:
+            yield "M3"
+        yield f"G1 X{coords[1][0]} Y{coords[1][1]} S{power} F{feed}"
+        for x, y in coords[2:]:
+            yield f"G1 X{x} Y{y}"
+        if not dynamic:
+            yield "M5"
+    yield "M5 S0"
+    yield "G0 X0 Y0"
+    yield "M2"
+
+
+def dxf_lines(toolpath):
+    """R12 ASCII DXF: group code and value on alternate lines"""
+    layer = toolpath.style.upper()
+    yield from ("0", "SECTION", "2", "HEADER",
+                "9", "$ACADVER", "1", "AC1009",
+                "9", "$EXTMIN", "10", "0", "20", "0",
+                "9", "$EXTMAX", "10", format_number(toolpath.width_mm), "20", format_number(toolpath.height_mm),
+                "0", "ENDSEC",
+                "0", "SECTION", "2", "ENTITIES")
+    for points in toolpath.paths:
+        yield from ("0", "POLYLINE", "8", layer, "66", "1", "70", "0", "10", "0", "20", "0", "30", "0")
+        for x, y in points.tolist():
+            yield from ("0", "VERTEX", "8", layer, "10", format_number(x), "20", format_number(y), "30", "0")
+        yield from ("0", "SEQEND", "8", layer)
+    yield from ("0", "ENDSEC", "0", "EOF")
@@ -0,0 +1,202 @@
+"""
+Scratch-buffer arena for the image pipelines
+Frame-sized temporaries (grayscale copies, masks, white backgrounds, filter
+outputs) are handed out from free lists keyed by (shape, dtype) instead of
+being allocated by numpy on every request.
+
+Inside `request_scope()` the calling thread owns one arena: `scratch()`
+returns an idle buffer of the right shape when there is one, `release()`
+hands a temporary back as soon as it is dead so the next step can reuse it,
+and everything still checked out goes back to the free lists when the scope
+ends. Outside a scope (scripts, the CLI filters) `scratch()` is a plain
+numpy allocation and `release()` does nothing, so library code can call
+them unconditionally.
+
+Arenas are pooled per worker process: a scope borrows an idle arena (or
+creates one) and returns it at exit, so there is one arena per concurrent
+request and the hot path takes no lock. The idle buffers of all pooled
+arenas together stay under BUFFER_ARENA_MAX_BYTES: when an arena comes back
+over the cap, idle buffers are dropped from the arenas returned longest ago
+first. That memory is held between requests and is not priced by admission
+control, so leave room for it next to ADMISSION_MEMORY_MB. Buffers must not outlive their
+scope: results are encoded, or copied into shared memory, before it closes
+and are never cached.
+
+Per request the scope records how many buffers had to be allocated, how
+many were reused and the peak bytes checked out at once.
+
+Configuration (environment):
+    BUFFER_ARENA_ENABLED    - 0 turns reuse off; buffers are still counted (default 1)
+    BUFFER_ARENA_MAX_BYTES  - idle bytes all arenas of a process keep between requests (default 128 MB)
+"""
+
+import os
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+BUFFER_ARENA_ENABLED = os.environ.get('BUFFER_ARENA_ENABLED', '1').lower() not in ('0', 'false', 'no')
+BUFFER_ARENA_MAX_BYTES = int(os.environ.get('BUFFER_ARENA_MAX_BYTES', 128 * 1024 * 1024))
+
+# Per-request records kept for /health
+RECENT_REQUESTS = 20
+
+
+class BufferArena:
+    """Idle buffers keyed by (shape, dtype) plus the buffers one request has checked out"""
+
+    def __init__(self, enabled=BUFFER_ARENA_ENABLED):
+        self.enabled = enabled
+        self._free = OrderedDict()  # key -> [arrays], least recently used key first
+        self._checked_out = {}      # id(array) -> array
+        self.idle_bytes = 0
+        self.live_bytes = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.reuses = 0
+        self.peak_bytes = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(int(n) for n in shape), np.dtype(dtype).str)
+        free = self._free.get(key)
+        if free:
+            array = free.pop()
+            if not free:
+                del self._free[key]
+            self.idle_bytes -= array.nbytes
+            self.reuses += 1
+        else:
+            array = np.empty(key[0], key[1])
+            self.allocations += 1
+            self.allocated_bytes += array.nbytes
+        self._checked_out[id(array)] = array
+        self.live_bytes += array.nbytes
+        self.peak_bytes = max(self.peak_bytes, self.live_bytes)
+        return array
+
+    def release(self, array):
+        """Return a checked-out buffer; arrays the arena did not hand out are ignored"""
+        if self._checked_out.pop(id(array), None) is None:
+            return
+        self.live_bytes -= array.nbytes
+        if not self.enabled:
+            return
+        key = (array.shape, array.dtype.str)
+        self._free.setdefault(key, []).append(array)
+        self._free.move_to_end(key)
+        self.idle_bytes += array.nbytes
+
+    def release_all(self):
+        for array in list(self._checked_out.values()):
+            self.release(array)
+
+    def trim(self, max_bytes):
+        """Drop the least recently used idle buffers until at most max_bytes are kept"""
+        while self.idle_bytes > max_bytes and self._free:
+            key, arrays = next(iter(self._free.items()))
+            self.idle_bytes -= arrays.pop().nbytes
+            if not arrays:
+                del self._free[key]
+
+
+_local = threading.local()
+_idle_arenas = []
+_arena_count = 0
+_pooled_idle_bytes = 0  # idle bytes of the arenas in _idle_arenas
+_lock = threading.Lock()
+_totals = {'requests': 0, 'allocations': 0, 'allocated_bytes': 0, 'reuses': 0, 'max_peak_bytes': 0}
+_recent = deque(maxlen=RECENT_REQUESTS)
+
+
+def current_arena():
+    return getattr(_local, 'arena', None)
+
+
+@contextmanager
+def request_scope(label=None):
+    """
+    Serve scratch() from a pooled arena until the block exits, then return
+    every buffer and record the request's counters. Nested scopes share the
+    outer one.
+    """
+    if current_arena() is not None:
+        yield current_arena()
+        return
+
+    global _arena_count, _pooled_idle_bytes
+    with _lock:
+        if _idle_arenas:
+            arena = _idle_arenas.pop()
+            _pooled_idle_bytes -= arena.idle_bytes
+        else:
+            arena = BufferArena()
+            _arena_count += 1
+    arena.reset_counters()
+    _local.arena = arena
+    try:
+        yield arena
+    finally:
+        _local.arena = None
+        record = {
+            'label': label,
+            'allocations': arena.allocations,
+            'allocated_bytes': arena.allocated_bytes,
+            'reuses': arena.reuses,
+            'peak_bytes': arena.peak_bytes
+        }
+        arena.release_all()
+        with _lock:
+            _idle_arenas.append(arena)
+            _pooled_idle_bytes += arena.idle_bytes
+            # Keep the process total under the cap, trimming the arenas
+            # returned longest ago first
+            for pooled in _idle_arenas:
+                excess = _pooled_idle_bytes - BUFFER_ARENA_MAX_BYTES
+                if excess <= 0:
+                    break
+                kept = pooled.idle_bytes
+                pooled.trim(max(0, kept - excess))
+                _pooled_idle_bytes -= kept - pooled.idle_bytes
+            _totals['requests'] += 1
+            _totals['allocations'] += record['allocations']
+            _totals['allocated_bytes'] += record['allocated_bytes']
+            _totals['reuses'] += record['reuses']
+            _totals['max_peak_bytes'] = max(_totals['max_peak_bytes'], record['peak_bytes'])
+            _recent.append(record)
+
+
+def scratch(shape, dtype=np.uint8, fill=None):
+    """A buffer of this shape and dtype, uninitialized unless fill is given"""
+    arena = current_arena()
+    array = arena.acquire(shape, dtype) if arena is not None else np.empty(shape, dtype)
+    if fill is not None:
+        array.fill(fill)
+    return array
+
+
+def scratch_like(array, dtype=None, fill=None):
+    return scratch(array.shape, array.dtype if dtype is None else dtype, fill)
+
+
+def release(*arrays):
+    """Hand temporaries back to the current arena before the scope ends"""
+    arena = current_arena()
+    if arena is not None:
+        for array in arrays:
+            arena.release(array)
+
+
+def arena_stats():
+    """Totals since start, the most recent requests and the memory parked in idle arenas"""
+    with _lock:
+        return dict(_totals,
+                    enabled=BUFFER_ARENA_ENABLED,
+                    arenas=_arena_count,
+                    idle_bytes=_pooled_idle_bytes,
+                    max_idle_bytes=BUFFER_ARENA_MAX_BYTES,
+                    recent=list(_recent))
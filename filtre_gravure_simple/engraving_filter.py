@@ -1,147 +1,437 @@
-#!/usr/bin/env python3
-"""
-Simple Engraving Filter - Black and white engraving style effect
-Usage: python engraving_filter.py <image_path>
-"""
-
-import cv2
-import numpy as np
-import sys
-import os
-
-def apply_engraving_filter(image_path):
-    """
-    Apply an engraving style filter to an image with fixed parameters
-    """
-    
-    # Fixed parameters (your preferred settings)
-    blur_size = 7      # Reduced from 9 for less blur
-    contrast = 0.8
-    block_size = 17
-    adapt_c = 3.5      # Reduced from 4.5 for more black
-    
-    try:
-        # Display parameters
-        print("\n" + "="*50)
-        print("ENGRAVING FILTER")
-        print("="*50)
-        print("\nParameters:")
-        print(f"  Blur size: {blur_size}")
-        print(f"  Contrast: {contrast}")
-        print(f"  Block size: {block_size}")
-        print(f"  Adaptive constant: {adapt_c}")
-        print("="*50 + "\n")
-        
-        # 1. Load image
-        print(f"Loading: {os.path.basename(image_path)}")
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Unable to load image: {image_path}")
-        
-        # 2. Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        print(f"Image size: {gray.shape[1]}x{gray.shape[0]} pixels")
-        
-        # 3. Apply Gaussian blur
-        print("Applying Gaussian blur...")
-        if blur_size % 2 == 0:
-            blur_size += 1  # Ensure odd
-        gray = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
-        
-        # 4. Adjust contrast
-        print("Adjusting contrast...")
-        gray_norm = gray.astype(np.float32) / 255.0
-        gray_norm = np.clip((gray_norm - 0.5) * contrast + 0.5, 0, 1)
-        gray = (gray_norm * 255).astype(np.uint8)
-        
-        # 5. Apply adaptive threshold
-        print("Applying adaptive threshold...")
-        if block_size % 2 == 0:
-            block_size += 1  # Ensure odd
-        
-        binary = cv2.adaptiveThreshold(gray, 255, 
-                                      cv2.ADAPTIVE_THRESH_MEAN_C,
-                                      cv2.THRESH_BINARY_INV,
-                                      block_size, adapt_c)
-        
-        # 6. Invert image
-        print("Inverting colors...")
-        result = cv2.bitwise_not(binary)
-        
-        # 7. Save result
-        base_name = os.path.splitext(os.path.basename(image_path))[0]
-        output_path = os.path.join(
-            os.path.dirname(__file__) or '.',
-            f"{base_name}_filtered.png"
-        )
-        
-        cv2.imwrite(output_path, result)
-        print(f"\n[SUCCESS] Saved: {output_path}")
-        
-        # Display statistics
-        white_pixels = np.sum(result == 255)
-        black_pixels = np.sum(result == 0)
-        total_pixels = result.shape[0] * result.shape[1]
-        
-        print(f"\nStatistics:")
-        print(f"  White pixels: {white_pixels} ({white_pixels/total_pixels*100:.1f}%)")
-        print(f"  Black pixels: {black_pixels} ({black_pixels/total_pixels*100:.1f}%)")
-        
-        return True
-        
-    except Exception as e:
-        print(f"\n[ERROR] {e}")
-        return False
-
-def main():
-    """Main function"""
-    
-    # Check arguments
-    if len(sys.argv) < 2:
-        print("\nUsage: python engraving_filter.py <image>")
-        print("Example: python engraving_filter.py \"dog photo 1.jpg\"")
-        sys.exit(1)
-    
-    # Check if it's a help request
-    if sys.argv[1] in ['--help', '-h', 'help', '?']:
-        print("""
-SIMPLE ENGRAVING FILTER
-=======================
-
-Usage:
-------
-python engraving_filter.py <image>
-
-This applies an engraving effect with the following fixed parameters:
-  - Blur size: 7 (less blur, more details)
-  - Contrast: 0.8 (soft contrast)
-  - Block size: 17 (medium line thickness)
-  - Adaptive constant: 3.5 (balanced black/white ratio)
-
-Output:
--------
-The filtered image is saved as <original_name>_filtered.png
-
-Example:
---------
-python engraving_filter.py "dog photo 1.jpg"
-Output: dog photo 1_filtered.png
-""")
-        sys.exit(0)
-    
-    # Get image path
-    image_path = sys.argv[1].strip('"').strip("'")  # Remove quotes if present
-    
-    # Check if image exists
-    if not os.path.exists(image_path):
-        print(f"\n[ERROR] File not found: {image_path}")
-        sys.exit(1)
-    
-    # Apply filter
-    success = apply_engraving_filter(image_path)
-    
-    if not success:
-        sys.exit(1)
-
-if __name__ == "__main__":
+#!/usr/bin/env python3
+"""
+Simple Engraving Filter - Black and white engraving style effect
+Usage: python engraving_filter.py <image_path>
+       python engraving_filter.py <image_path> --sweep
+       python engraving_filter.py <image_path> --target 0.35
+"""
+
+import cv2
+import numpy as np
+import sys
+import os
+import math
+import itertools
+
+try:
+    from .image_kernels import contrast_lut
+except ImportError:
+    # Run as a script from this folder
+    from image_kernels import contrast_lut
+
+# Largest parameter grid a single sweep may render
+MAX_SWEEP_VARIANTS = 100
+
+# Fixed parameters of apply_engraving_filter, the starting point for auto-tuning
+DEFAULT_PARAMS = {
+    'blur_size': 7,
+    'contrast': 0.8,
+    'block_size': 17,
+    'adapt_c': 3.5
+}
+
+# Contrast candidates tried when auto-tuning with tune_contrast=True
+TUNE_CONTRASTS = [0.6, 0.7, 0.8, 0.9, 1.0, 1.2, 1.4]
+
+# Default grid for --sweep: 5 block sizes x 5 adaptive constants
+DEFAULT_SWEEP = {
+    'blur_sizes': [7],
+    'contrasts': [0.8],
+    'block_sizes': [11, 15, 17, 21, 25],
+    'adapt_cs': [2.5, 3.0, 3.5, 4.0, 4.5]
+}
+
+def odd(value):
+    value = int(value)
+    return value + 1 if value % 2 == 0 else value
+
+def padded_integral(gray, pad):
+    """Integral image of the edge-replicated input (matches BORDER_REPLICATE)"""
+    padded = cv2.copyMakeBorder(gray, pad, pad, pad, pad, cv2.BORDER_REPLICATE)
+    return cv2.integral(padded, sdepth=cv2.CV_64F)
+
+def local_mean(integral, pad, shape, block_size):
+    """
+    Rounded block mean of every pixel from a padded integral image; equal to
+    the mean cv2.adaptiveThreshold computes for ADAPTIVE_THRESH_MEAN_C
+    """
+    height, width = shape
+    r = block_size // 2
+    y0 = x0 = pad - r
+    y1 = x1 = pad + r + 1
+    window = (integral[y1:y1 + height, x1:x1 + width]
+              - integral[y0:y0 + height, x1:x1 + width]
+              - integral[y1:y1 + height, x0:x0 + width]
+              + integral[y0:y0 + height, x0:x0 + width])
+    area = block_size * block_size
+    # Sums are exact in float64 and an odd area never rounds on a tie
+    return np.floor((2 * window + area) / (2 * area)).astype(np.int16)
+
+def threshold_from_mean(gray16, mean, adapt_c):
+    """
+    White where the pixel is above its local mean minus C; the same result
+    as adaptiveThreshold(THRESH_BINARY_INV) followed by bitwise_not
+    """
+    return np.where(gray16 - mean > -math.floor(adapt_c), 255, 0).astype(np.uint8)
+
+def engraving_sweep(img, blur_sizes, contrasts, block_sizes, adapt_cs):
+    """
+    Render every (blur, contrast, block_size, adapt_c) combination.
+
+    Each blur is computed once, each contrast once per blur, one integral
+    image per blurred/contrasted image serves every block size, and each
+    local mean serves every adaptive constant, so a 5x5 grid costs little
+    more than a single render. Returns {(blur, contrast, block, c): image}.
+    """
+    blur_sizes = [odd(b) for b in blur_sizes]
+    block_sizes = [odd(b) for b in block_sizes]
+    variants = len(blur_sizes) * len(contrasts) * len(block_sizes) * len(adapt_cs)
+    if variants == 0:
+        raise ValueError("Sweep grid is empty")
+    if variants > MAX_SWEEP_VARIANTS:
+        raise ValueError(f"Sweep grid has {variants} variants, the limit is {MAX_SWEEP_VARIANTS}")
+    
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+    pad = max(block_sizes) // 2
+    results = {}
+    
+    for blur_size in blur_sizes:
+        blurred = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+        for contrast in contrasts:
+            adjusted = cv2.LUT(blurred, contrast_lut(contrast))
+            adjusted16 = adjusted.astype(np.int16)
+            integral = padded_integral(adjusted, pad)
+            for block_size in block_sizes:
+                mean = local_mean(integral, pad, adjusted.shape, block_size)
+                for adapt_c in adapt_cs:
+                    results[(blur_size, contrast, block_size, adapt_c)] = threshold_from_mean(adjusted16, mean, adapt_c)
+    
+    return results
+
+def make_contact_sheet(results, tile_width=256, labels=True):
+    """
+    Tile sweep results into one image: one row per (blur, contrast, block)
+    and one column per adaptive constant. Returns (sheet, index) where the
+    index maps each variant to its tile rectangle.
+    """
+    keys = list(results)
+    columns = sorted({key[3] for key in keys})
+    rows = sorted({key[:3] for key in keys})
+    
+    height, width = next(iter(results.values())).shape
+    tile_w = min(tile_width, width)
+    tile_h = max(1, round(height * tile_w / width))
+    label_h = 18 if labels else 0
+    
+    sheet = np.full((len(rows) * (tile_h + label_h), len(columns) * tile_w), 255, np.uint8)
+    index = []
+    
+    for (row, col_params), (col, adapt_c) in itertools.product(enumerate(rows), enumerate(columns)):
+        key = col_params + (adapt_c,)
+        if key not in results:
+            continue
+        x = col * tile_w
+        y = row * (tile_h + label_h)
+        tile = cv2.resize(results[key], (tile_w, tile_h), interpolation=cv2.INTER_AREA)
+        sheet[y + label_h:y + label_h + tile_h, x:x + tile_w] = tile
+        if labels:
+            text = f"b{key[0]} c{key[1]} bs{key[2]} C{key[3]}"
+            cv2.putText(sheet, text, (x + 3, y + 13), cv2.FONT_HERSHEY_SIMPLEX, 0.38, 0, 1, cv2.LINE_AA)
+        index.append({
+            'blur_size': key[0], 'contrast': key[1], 'block_size': key[2], 'adapt_c': key[3],
+            'x': x, 'y': y + label_h, 'width': tile_w, 'height': tile_h
+        })
+    
+    return sheet, index
+
+def _density_curve(adjusted, block_size):
+    """
+    Black-pixel ratio for every integer adaptive constant at once.
+
+    The threshold only depends on floor(adapt_c) compared with
+    (pixel - local mean), so one histogram of that difference answers every
+    candidate constant without re-thresholding. Returns (constants, ratios)
+    with ratios increasing as the constant decreases.
+    """
+    pad = block_size // 2
+    mean = local_mean(padded_integral(adjusted, pad), pad, adjusted.shape, block_size)
+    diff = adjusted.astype(np.int16) - mean
+    # diff lies in [-255, 255]; a pixel is black when diff <= -floor(C)
+    counts = np.bincount((diff + 255).ravel(), minlength=511)
+    black_at_most = np.cumsum(counts) / diff.size
+    constants = np.arange(-255, 256)
+    ratios = black_at_most[255 - constants]
+    return constants, ratios
+
+def auto_tune_density(img, target_black, tolerance=0.02, tune_contrast=False, **params):
+    """
+    Search the adaptive constant (and optionally contrast) so the engraving's
+    black-pixel ratio lands within tolerance of target_black.
+
+    The image is blurred once and each contrast candidate costs one LUT and
+    one integral image; every constant is then evaluated from a histogram,
+    so the whole search costs about one render per contrast tried. Returns
+    (image, report) where report holds the chosen parameters and the
+    achieved ratio.
+    """
+    if not 0 <= target_black <= 1:
+        raise ValueError(f"target_black must be between 0 and 1, got {target_black}")
+    params = dict(DEFAULT_PARAMS, **params)
+    blur_size = odd(params['blur_size'])
+    block_size = odd(params['block_size'])
+    contrasts = TUNE_CONTRASTS if tune_contrast else [params['contrast']]
+    
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+    blurred = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+    
+    best = None
+    for contrast in contrasts:
+        adjusted = cv2.LUT(blurred, contrast_lut(contrast))
+        constants, ratios = _density_curve(adjusted, block_size)
+        errors = np.abs(ratios - target_black)
+        # Among equally good constants keep the one nearest the default
+        order = np.lexsort((np.abs(constants - params['adapt_c']), errors))
+        i = order[0]
+        # Within tolerance the contrast nearest the configured one wins; only
+        # when none reaches the target does the smallest error decide
+        distance = abs(contrast - params['contrast'])
+        if errors[i] <= tolerance:
+            candidate = (False, distance, errors[i])
+        else:
+            candidate = (True, errors[i], distance)
+        if best is None or candidate < best[0]:
+            best = (candidate, contrast, int(constants[i]), float(ratios[i]), adjusted)
+    
+    _, contrast, adapt_c, ratio, adjusted = best
+    pad = block_size // 2
+    mean = local_mean(padded_integral(adjusted, pad), pad, adjusted.shape, block_size)
+    result = threshold_from_mean(adjusted.astype(np.int16), mean, adapt_c)
+    
+    report = {
+        'blur_size': blur_size,
+        'contrast': contrast,
+        'block_size': block_size,
+        'adapt_c': float(adapt_c),
+        'target_black': target_black,
+        'tolerance': tolerance,
+        'black_ratio': round(ratio, 4),
+        'within_tolerance': abs(ratio - target_black) <= tolerance,
+        'contrasts_tried': len(contrasts)
+    }
+    return result, report
+
+def apply_engraving_autotune(image_path, target_black, tolerance=0.02, tune_contrast=False):
+    """Auto-tune the engraving density for one image and save the result"""
+    try:
+        print(f"Loading: {os.path.basename(image_path)}")
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError(f"Unable to load image: {image_path}")
+        
+        result, report = auto_tune_density(img, target_black, tolerance, tune_contrast)
+        
+        print("\nChosen parameters:")
+        print(f"  Blur size: {report['blur_size']}")
+        print(f"  Contrast: {report['contrast']}")
+        print(f"  Block size: {report['block_size']}")
+        print(f"  Adaptive constant: {report['adapt_c']}")
+        print(f"  Black pixels: {report['black_ratio']*100:.1f}% (target {target_black*100:.1f}%)")
+        if not report['within_tolerance']:
+            print(f"  [WARNING] Target not reached within {tolerance*100:.1f}%")
+        
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        output_path = os.path.join(
+            os.path.dirname(__file__) or '.',
+            f"{base_name}_filtered.png"
+        )
+        cv2.imwrite(output_path, result)
+        print(f"\n[SUCCESS] Saved: {output_path}")
+        return True
+    
+    except Exception as e:
+        print(f"\n[ERROR] {e}")
+        return False
+
+def apply_engraving_sweep(image_path, grid=None):
+    """Render a parameter grid for one image and save it as a contact sheet"""
+    grid = dict(DEFAULT_SWEEP, **(grid or {}))
+    try:
+        print(f"Loading: {os.path.basename(image_path)}")
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError(f"Unable to load image: {image_path}")
+        
+        results = engraving_sweep(img, grid['blur_sizes'], grid['contrasts'],
+                                  grid['block_sizes'], grid['adapt_cs'])
+        print(f"Rendered {len(results)} variants")
+        
+        sheet, _ = make_contact_sheet(results)
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        output_path = os.path.join(
+            os.path.dirname(__file__) or '.',
+            f"{base_name}_sweep.png"
+        )
+        cv2.imwrite(output_path, sheet)
+        print(f"\n[SUCCESS] Saved: {output_path}")
+        return True
+    
+    except Exception as e:
+        print(f"\n[ERROR] {e}")
+        return False
+
+def apply_engraving_filter(image_path):
+    """
+    Apply an engraving style filter to an image with fixed parameters
+    """
+    
+    # Fixed parameters (your preferred settings)
+    blur_size = 7      # Reduced from 9 for less blur
+    contrast = 0.8
+    block_size = 17
+    adapt_c = 3.5      # Reduced from 4.5 for more black
+    
+    try:
+        # Display parameters
+        print("\n" + "="*50)
+        print("ENGRAVING FILTER")
+        print("="*50)
+        print("\nParameters:")
+        print(f"  Blur size: {blur_size}")
+        print(f"  Contrast: {contrast}")
+        print(f"  Block size: {block_size}")
+        print(f"  Adaptive constant: {adapt_c}")
+        print("="*50 + "\n")
+        
+        # 1. Load image
+        print(f"Loading: {os.path.basename(image_path)}")
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError(f"Unable to load image: {image_path}")
+        
+        # 2. Convert to grayscale
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        print(f"Image size: {gray.shape[1]}x{gray.shape[0]} pixels")
+        
+        # 3. Apply Gaussian blur
+        print("Applying Gaussian blur...")
+        if blur_size % 2 == 0:
+            blur_size += 1  # Ensure odd
+        gray = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+        
+        # 4. Adjust contrast
+        print("Adjusting contrast...")
+        gray = cv2.LUT(gray, contrast_lut(contrast))
+        
+        # 5. Apply adaptive threshold
+        print("Applying adaptive threshold...")
+        if block_size % 2 == 0:
+            block_size += 1  # Ensure odd
+        
+        binary = cv2.adaptiveThreshold(gray, 255, 
+                                      cv2.ADAPTIVE_THRESH_MEAN_C,
+                                      cv2.THRESH_BINARY_INV,
+                                      block_size, adapt_c)
+        
+        # 6. Invert image
+        print("Inverting colors...")
+        result = cv2.bitwise_not(binary)
+        
+        # 7. Save result
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        output_path = os.path.join(
+            os.path.dirname(__file__) or '.',
+            f"{base_name}_filtered.png"
+        )
+        
+        cv2.imwrite(output_path, result)
+        print(f"\n[SUCCESS] Saved: {output_path}")
+        
+        # Display statistics
+        white_pixels = np.sum(result == 255)
+        black_pixels = np.sum(result == 0)
+        total_pixels = result.shape[0] * result.shape[1]
+        
+        print(f"\nStatistics:")
+        print(f"  White pixels: {white_pixels} ({white_pixels/total_pixels*100:.1f}%)")
+        print(f"  Black pixels: {black_pixels} ({black_pixels/total_pixels*100:.1f}%)")
+        
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] {e}")
+        return False
+
+def main():
+    """Main function"""
+    
+    # Check arguments
+    if len(sys.argv) < 2:
+        print("\nUsage: python engraving_filter.py <image>")
+        print("Example: python engraving_filter.py \"dog photo 1.jpg\"")
+        sys.exit(1)
+    
+    # Check if it's a help request
+    if sys.argv[1] in ['--help', '-h', 'help', '?']:
+        print("""
+SIMPLE ENGRAVING FILTER
+=======================
+
+Usage:
+------
+python engraving_filter.py <image>
+python engraving_filter.py <image> --sweep
+python engraving_filter.py <image> --target 0.35 [--tune-contrast]
+
+This applies an engraving effect with the following fixed parameters:
+  - Blur size: 7 (less blur, more details)
+  - Contrast: 0.8 (soft contrast)
+  - Block size: 17 (medium line thickness)
+  - Adaptive constant: 3.5 (balanced black/white ratio)
+
+With --sweep, a 5x5 grid of block sizes (11-25) and adaptive constants
+(2.5-4.5) is rendered from one shared integral image and saved as a
+contact sheet <original_name>_sweep.png
+
+With --target, the adaptive constant (and with --tune-contrast also the
+contrast) is chosen so the black pixel ratio is within 2% of the target
+ink coverage, and the chosen parameters are printed
+
+Output:
+-------
+The filtered image is saved as <original_name>_filtered.png
+
+Example:
+--------
+python engraving_filter.py "dog photo 1.jpg"
+Output: dog photo 1_filtered.png
+""")
+        sys.exit(0)
+    
+    # Get image path
+    image_path = sys.argv[1].strip('"').strip("'")  # Remove quotes if present
+    
+    # Check if image exists
+    if not os.path.exists(image_path):
+        print(f"\n[ERROR] File not found: {image_path}")
+        sys.exit(1)
+    
+    # Apply filter
+    options = sys.argv[2:]
+    if '--sweep' in options:
+        success = apply_engraving_sweep(image_path)
+    elif '--target' in options:
+        try:
+            target = float(options[options.index('--target') + 1])
+        except (IndexError, ValueError):
+            print("\n[ERROR] --target needs a black pixel ratio, e.g. --target 0.35")
+            sys.exit(1)
+        success = apply_engraving_autotune(image_path, target,
+                                           tune_contrast='--tune-contrast' in options)
+    else:
+        success = apply_engraving_filter(image_path)
+    
+    if not success:
+        sys.exit(1)
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+uint8 / int16 image kernels shared by the engraving filters
+Tone curves are 256-entry lookup tables applied with cv2.LUT, and gradients
+use int16 Sobel, so no step widens a full frame to float
+"""
+
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# Approximate L2 magnitude (123 * max + 51 * min) / 128 of |gx|, |gy|:
+# within 4% of sqrt(gx^2 + gy^2) for every gradient direction, plus rounding
+L2_APPROX_MAX = 123 / 128
+L2_APPROX_MIN = 51 / 128
+
+NORMS = ('l1', 'l2approx')
+
+
+def _frozen(lut):
+    lut.flags.writeable = False
+    return lut
+
+
+@lru_cache(maxsize=64)
+def contrast_lut(contrast, pivot=0.5):
+    """
+    Linear contrast around a pivot, computed with the same float32
+    arithmetic as the per-pixel version so results are identical
+    """
+    levels = np.arange(256, dtype=np.float32) / 255.0
+    levels = np.clip((levels - pivot) * contrast + pivot, 0, 1)
+    return _frozen((levels * 255).astype(np.uint8))
+
+
+@lru_cache(maxsize=64)
+def gamma_lut(gamma):
+    """out = 255 * (in / 255) ** (1 / gamma); gamma > 1 brightens midtones"""
+    levels = np.arange(256, dtype=np.float64) / 255.0
+    return _frozen(np.round(255 * levels ** (1.0 / gamma)).astype(np.uint8))
+
+
+@lru_cache(maxsize=64)
+def levels_lut(black=0, white=255, gamma=1.0):
+    """Photoshop-style levels: black/white input points stretched to 0-255, then gamma"""
+    if not 0 <= black < white <= 255:
+        raise ValueError("levels need 0 <= black < white <= 255")
+    levels = np.clip((np.arange(256, dtype=np.float64) - black) / (white - black), 0, 1)
+    return _frozen(np.round(255 * levels ** (1.0 / gamma)).astype(np.uint8))
+
+
+def compose_luts(*luts):
+    """One table equivalent to applying the tables left to right"""
+    result = np.arange(256, dtype=np.uint8)
+    for lut in luts:
+        result = lut[result]
+    return _frozen(result)
+
+
+def apply_lut(gray, lut):
+    return cv2.LUT(gray, lut)
+
+
+def sobel_int16(gray, ksize=3):
+    """(gx, gy) Sobel derivatives of a uint8 image as int16 (exact for ksize 3)"""
+    gx = cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=ksize)
+    gy = cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=ksize)
+    return gx, gy
+
+
+def gradient_magnitude(gx, gy, norm='l1'):
+    """
+    Gradient magnitude saturated to uint8: 'l1' is |gx| + |gy|, 'l2approx'
+    is the alpha-max-plus-beta-min estimate of sqrt(gx^2 + gy^2)
+    """
+    if norm not in NORMS:
+        raise ValueError(f"Unknown norm '{norm}', expected one of {list(NORMS)}")
+    ax, ay = cv2.absdiff(gx, 0), cv2.absdiff(gy, 0)
+    if norm == 'l1':
+        return cv2.convertScaleAbs(cv2.add(ax, ay))
+    largest, smallest = cv2.max(ax, ay), cv2.min(ax, ay)
+    return cv2.convertScaleAbs(cv2.addWeighted(largest, L2_APPROX_MAX, smallest, L2_APPROX_MIN, 0,
+                                               dtype=cv2.CV_16S))
+
+
+def gradient_above(gx, gy, threshold):
+    """
+    255 where sqrt(gx^2 + gy^2) > threshold, without square roots: the
+    squared magnitude is compared in int32. Matches thresholding the uint8
+    (truncated) float magnitude at an integer threshold exactly.
+    """
+    squared = cv2.add(cv2.multiply(gx, gx, dtype=cv2.CV_32S), cv2.multiply(gy, gy, dtype=cv2.CV_32S))
+    # floor(sqrt(s)) > t  <=>  s >= (t + 1)^2
+    return cv2.compare(squared, (int(threshold) + 1) ** 2 - 1, cv2.CMP_GT)
@@ -8,6 +8,17 @@ import cv2
 import numpy as np
 import sys
 import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    from .image_kernels import contrast_lut
+    from .buffer_arena import scratch
+except ImportError:
+    # Run as a script from this folder
+    from image_kernels import contrast_lut
+    from buffer_arena import scratch
 
 def enhance_pet_face(image):
     """
@@ -39,21 +50,301 @@ def detect_and_enhance_edges(image):
     
     return enhanced_edges
 
+# Parameters optimized for pet faces
+DEFAULT_PARAMS = {
+    'blur_pre': 3,          # Light pre-blur to reduce noise
+    'blur_post': 5,         # Post-blur for smoothness
+    'contrast': 1.2,        # Moderate contrast enhancement
+    'block_size': 15,       # Smaller block for finer details
+    'adapt_c': 2.5,         # Lower constant for more detail
+    'edge_weight': 0.3,     # Edge enhancement weight
+    'detail_preserve': 0.7  # Detail preservation factor
+}
+
+# Stage cache budget in MB; 0 disables caching of intermediates
+STAGE_CACHE_MB = float(os.environ.get('PRO_STAGE_CACHE_MB', 128))
+
+# Pipeline stages and the parameters each one depends on directly; a stage's
+# cache key is its own parameters plus the keys of the stages it consumes
+STAGE_PARAMS = {
+    'enhanced': ('blur_pre',),
+    'edges': (),
+    'binary': ('contrast', 'block_size', 'adapt_c'),
+    'engraving': ('edge_weight', 'blur_post'),
+}
+
+class StageCache:
+    """
+    Byte-bounded LRU of pipeline intermediates with hit/miss counters per
+    stage. Cached arrays are read-only so a consumer cannot corrupt them.
+    """
+    
+    def __init__(self, max_mb=STAGE_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = {stage: 0 for stage in STAGE_PARAMS}
+        self.misses = {stage: 0 for stage in STAGE_PARAMS}
+        self.evictions = 0
+    
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+    
+    def get_or_compute(self, stage, key, compute):
+        if not self.enabled:
+            return compute()
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits[stage] += 1
+                return value
+            self.misses[stage] += 1
+        
+        value = compute()
+        value.setflags(write=False)
+        with self._lock:
+            if key not in self._entries and value.nbytes <= self.max_bytes:
+                self._entries[key] = value
+                self._bytes += value.nbytes
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+                    self.evictions += 1
+        return value
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+                'used_mb': round(self._bytes / (1024 * 1024), 1),
+                'entries': len(self._entries),
+                'evictions': self.evictions,
+                'stages': {stage: {'hits': self.hits[stage], 'misses': self.misses[stage]}
+                           for stage in STAGE_PARAMS}
+            }
+
+stage_cache = StageCache()
+
+def stage_key(stage, upstream, params):
+    """Cache key of a stage from its upstream keys and its own parameters"""
+    own = tuple((name, params[name]) for name in STAGE_PARAMS[stage])
+    return (stage, upstream, own)
+
+def image_digest(gray):
+    """Content hash of the input image"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(gray.shape).encode())
+    digest.update(np.ascontiguousarray(gray).data)
+    return digest.hexdigest()
+
+def log(message, verbose):
+    if verbose:
+        print(message)
+
+def normalize_params(params=None):
+    """Defaults merged with overrides; kernel and block sizes forced odd"""
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    for name in ('blur_pre', 'blur_post', 'block_size'):
+        if params[name] % 2 == 0:
+            params[name] += 1
+    return params
+
+def stage_enhanced(gray, params, verbose=False):
+    # Step 1: Pre-process with light blur
+    log("Pre-processing image...", verbose)
+    pre_blurred = cv2.GaussianBlur(gray, (params['blur_pre'], params['blur_pre']), 0)
+    
+    # Step 2: Enhance facial features
+    log("Enhancing facial features...", verbose)
+    return enhance_pet_face(pre_blurred)
+
+def stage_binary(enhanced, params, verbose=False):
+    # Step 4: Adjust contrast
+    log("Adjusting contrast...", verbose)
+    contrast_adjusted = cv2.LUT(enhanced, contrast_lut(params['contrast']))
+    
+    # Step 5: Apply adaptive threshold
+    log("Applying adaptive threshold...", verbose)
+    
+    # Use Gaussian adaptive threshold for smoother results
+    return cv2.adaptiveThreshold(
+        contrast_adjusted, 255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY_INV,
+        params['block_size'], params['adapt_c']
+    )
+
+def stage_engraving(binary, edges, params, verbose=False):
+    # Step 6: Combine with edge information
+    log("Combining with edge details...", verbose)
+    edge_enhanced = cv2.addWeighted(
+        binary, 1 - params['edge_weight'],
+        edges, params['edge_weight'],
+        0
+    )
+    
+    # Step 7: Post-process
+    log("Post-processing...", verbose)
+    
+    # Apply morphological operations to clean up
+    kernel_clean = np.ones((2,2), np.uint8)
+    cleaned = cv2.morphologyEx(edge_enhanced, cv2.MORPH_OPEN, kernel_clean)
+    
+    # Light blur for smoothness
+    smoothed = cv2.GaussianBlur(cleaned, (params['blur_post'], params['blur_post']), 0)
+    
+    # Final threshold to ensure binary output
+    _, final = cv2.threshold(smoothed, 127, 255, cv2.THRESH_BINARY)
+    
+    # Step 8: Invert for engraving style
+    log("Finalizing engraving style...", verbose)
+    return cv2.bitwise_not(final)
+
+# Gap between the circular crop and the nearest image edge, in pixels
+PENDANT_MARGIN = 10
+
+def pendant_circle(width, height):
+    """Centre and radius of the circular pendant crop"""
+    return (width // 2, height // 2), min(width, height) // 2 - PENDANT_MARGIN
+
+# Pendant crop mask budget in MB, shared by the circle and the other pendant
+# shapes; 0 disables caching of masks
+MASK_CACHE_MB = float(os.environ.get('PENDANT_MASK_CACHE_MB', 64))
+# Masks above this share of the budget are rebuilt per request instead of
+# evicting every smaller one
+MASK_CACHE_MAX_SHARE = 0.25
+
+class MaskCache:
+    """
+    Byte-bounded LRU of read-only full-frame crop masks keyed by
+    (shape key, width, height)
+    """
+    
+    def __init__(self, max_mb=MASK_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+    
+    def get_or_build(self, key, build):
+        with self._lock:
+            mask = self._entries.get(key)
+            if mask is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return mask
+            self.misses += 1
+        
+        mask = build()
+        mask.flags.writeable = False
+        with self._lock:
+            if mask.nbytes > self.max_bytes * MASK_CACHE_MAX_SHARE:
+                self.uncached += 1
+            elif key not in self._entries:
+                self._entries[key] = mask
+                self._bytes += mask.nbytes
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+        return mask
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+                'used_mb': round(self._bytes / (1024 * 1024), 1),
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'uncached': self.uncached
+            }
+
+mask_cache = MaskCache()
+
+def draw_circle_outside(height, width):
+    """Mask, 255 outside the pendant circle"""
+    outside = np.full((height, width), 255, np.uint8)
+    center, radius = pendant_circle(width, height)
+    cv2.circle(outside, center, radius, 0, -1)
+    return outside
+
+def circle_outside_mask(height, width):
+    """Read-only mask, 255 outside the pendant circle; cached per image size"""
+    return mask_cache.get_or_build(('circle', width, height), lambda: draw_circle_outside(height, width))
+
+def apply_pendant_mask(result, verbose=False, outside=None):
+    # Step 9: Crop to the pendant shape (circle unless another outside mask is given)
+    log("Applying pendant mask...", verbose)
+    if outside is None:
+        outside = circle_outside_mask(*result.shape)
+    
+    # White outside the shape, the engraving inside: one OR
+    return cv2.bitwise_or(result, outside, dst=scratch(result.shape))
+
+def professional_engraving(img, params=None, verbose=False, cache=None, pendant=True):
+    """
+    Apply the professional engraving filter to a BGR or grayscale array
+    and return the single-channel engraving.
+    
+    `pendant` crops the result: True for the built-in circle, an outside
+    mask (255 outside the shape, image-sized) for another shape, False to
+    return the full frame.
+    
+    Intermediates are cached per stage by (input hash, upstream params), so
+    re-rendering the same image with only late-stage options changed (e.g.
+    edge_weight) skips the CLAHE/NL-means and edge detection stages.
+    """
+    params = normalize_params(params)
+    cache = stage_cache if cache is None else cache
+    
+    # Convert to grayscale
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+    height, width = gray.shape
+    log(f"Image size: {width}x{height} pixels", verbose)
+    
+    source = image_digest(gray) if cache.enabled else None
+    
+    enhanced_key = stage_key('enhanced', (source,), params)
+    enhanced = cache.get_or_compute('enhanced', enhanced_key,
+                                    lambda: stage_enhanced(gray, params, verbose))
+    
+    # Step 3: Detect edges
+    edges_key = stage_key('edges', (enhanced_key,), params)
+    def compute_edges():
+        log("Detecting facial edges...", verbose)
+        return detect_and_enhance_edges(enhanced)
+    edges = cache.get_or_compute('edges', edges_key, compute_edges)
+    
+    binary_key = stage_key('binary', (enhanced_key,), params)
+    binary = cache.get_or_compute('binary', binary_key,
+                                  lambda: stage_binary(enhanced, params, verbose))
+    
+    engraving_key = stage_key('engraving', (binary_key, edges_key), params)
+    result = cache.get_or_compute('engraving', engraving_key,
+                                  lambda: stage_engraving(binary, edges, params, verbose))
+    
+    if pendant is False:
+        return result.copy()
+    return apply_pendant_mask(result, verbose, None if pendant is True else pendant)
+
 def apply_professional_engraving(image_path):
     """
     Apply professional engraving filter optimized for pet faces
     """
     
-    # Parameters optimized for pet faces
-    params = {
-        'blur_pre': 3,          # Light pre-blur to reduce noise
-        'blur_post': 5,         # Post-blur for smoothness
-        'contrast': 1.2,        # Moderate contrast enhancement
-        'block_size': 15,       # Smaller block for finer details
-        'adapt_c': 2.5,         # Lower constant for more detail
-        'edge_weight': 0.3,     # Edge enhancement weight
-        'detail_preserve': 0.7  # Detail preservation factor
-    }
+    params = dict(DEFAULT_PARAMS)
     
     try:
         print("\n" + "="*60)
@@ -70,87 +361,7 @@ def apply_professional_engraving(image_path):
         if img is None:
             raise ValueError(f"Unable to load image: {image_path}")
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        height, width = gray.shape
-        print(f"Image size: {width}x{height} pixels")
-        
-        # Step 1: Pre-process with light blur
-        print("Pre-processing image...")
-        if params['blur_pre'] % 2 == 0:
-            params['blur_pre'] += 1
-        pre_blurred = cv2.GaussianBlur(gray, (params['blur_pre'], params['blur_pre']), 0)
-        
-        # Step 2: Enhance facial features
-        print("Enhancing facial features...")
-        enhanced = enhance_pet_face(pre_blurred)
-        
-        # Step 3: Detect edges
-        print("Detecting facial edges...")
-        edges = detect_and_enhance_edges(enhanced)
-        
-        # Step 4: Adjust contrast
-        print("Adjusting contrast...")
-        gray_norm = enhanced.astype(np.float32) / 255.0
-        gray_norm = np.clip((gray_norm - 0.5) * params['contrast'] + 0.5, 0, 1)
-        contrast_adjusted = (gray_norm * 255).astype(np.uint8)
-        
-        # Step 5: Apply adaptive threshold
-        print("Applying adaptive threshold...")
-        if params['block_size'] % 2 == 0:
-            params['block_size'] += 1
-        
-        # Use Gaussian adaptive threshold for smoother results
-        binary = cv2.adaptiveThreshold(
-            contrast_adjusted, 255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY_INV,
-            params['block_size'], params['adapt_c']
-        )
-        
-        # Step 6: Combine with edge information
-        print("Combining with edge details...")
-        edge_enhanced = cv2.addWeighted(
-            binary, 1 - params['edge_weight'],
-            edges, params['edge_weight'],
-            0
-        )
-        
-        # Step 7: Post-process
-        print("Post-processing...")
-        if params['blur_post'] % 2 == 0:
-            params['blur_post'] += 1
-        
-        # Apply morphological operations to clean up
-        kernel_clean = np.ones((2,2), np.uint8)
-        cleaned = cv2.morphologyEx(edge_enhanced, cv2.MORPH_OPEN, kernel_clean)
-        
-        # Light blur for smoothness
-        smoothed = cv2.GaussianBlur(cleaned, (params['blur_post'], params['blur_post']), 0)
-        
-        # Final threshold to ensure binary output
-        _, final = cv2.threshold(smoothed, 127, 255, cv2.THRESH_BINARY)
-        
-        # Step 8: Invert for engraving style
-        print("Finalizing engraving style...")
-        result = cv2.bitwise_not(final)
-        
-        # Step 9: Ensure circular crop for pendant
-        print("Applying circular mask for pendant...")
-        center = (width // 2, height // 2)
-        radius = min(width, height) // 2 - 10
-        
-        # Create circular mask
-        mask = np.zeros((height, width), dtype=np.uint8)
-        cv2.circle(mask, center, radius, 255, -1)
-        
-        # Apply mask
-        result_masked = cv2.bitwise_and(result, mask)
-        
-        # Add white background outside circle
-        background = np.ones((height, width), dtype=np.uint8) * 255
-        background[mask == 255] = result_masked[mask == 255]
-        result = background
+        result = professional_engraving(img, params, verbose=True)
         
         # Step 10: Save result
         base_name = os.path.splitext(os.path.basename(image_path))[0]
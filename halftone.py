@@ -0,0 +1,119 @@
+"""
+Amplitude-modulated (AM) halftone screen for engraving.
+
+The image is covered by a square screen rotated by `angle` with a pitch of
+dpi / lpi pixels, and every screen cell gets one round dot whose area
+matches the cell's mean darkness. The tone is box-filtered at the screen
+pitch and sampled at each cell centre with cv2.remap, and a precomputed
+table maps darkness to dot radius. The table also covers the range where
+dots grow past their cell edges and merge, so tones stay linear into the
+shadows.
+
+Every step is an array operation over pixels, so the runtime depends on the
+image size only, not on how much texture or how many edges it has. Rows are
+processed in strips to keep the float temporaries small.
+
+Configuration (environment):
+    HALFTONE_LPI       - screen lines per inch (default 50)
+    HALFTONE_DPI       - image pixels per inch at the engraved size (default 300)
+    HALFTONE_ANGLE     - screen angle in degrees (default 45)
+    HALFTONE_DOT_SIZE  - largest dot relative to one that fills its cell
+                         (default 1.0; below 1 shadows keep separate dots)
+"""
+
+import os
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from filtre_gravure_simple.buffer_arena import scratch, release
+
+HALFTONE_LPI = float(os.environ.get('HALFTONE_LPI', 50))
+HALFTONE_DPI = float(os.environ.get('HALFTONE_DPI', 300))
+HALFTONE_ANGLE = float(os.environ.get('HALFTONE_ANGLE', 45))
+HALFTONE_DOT_SIZE = float(os.environ.get('HALFTONE_DOT_SIZE', 1.0))
+
+STRIP_ROWS = 256
+
+# Smallest screen pitch in pixels that still resolves a round dot
+MIN_CELL_PIXELS = 2.0
+
+
+def dot_coverage(radius):
+    """Fraction of a unit cell covered by a centred dot of this radius (in cells)"""
+    r = np.asarray(radius, np.float64)
+    area = np.pi * r ** 2
+    # Past r = 0.5 the dot is clipped by the four cell edges
+    clipped = np.maximum(r, 0.5)
+    segments = clipped ** 2 * np.arccos(0.5 / clipped) - 0.5 * np.sqrt(clipped ** 2 - 0.25)
+    return np.minimum(np.where(r > 0.5, area - 4 * segments, area), 1.0)
+
+
+@lru_cache(maxsize=16)
+def radius_table(dot_size=1.0):
+    """Squared dot radius (in cells) for each uint8 darkness, tone-linear up to the largest dot"""
+    radii = np.linspace(0, dot_size * np.sqrt(0.5), 2048)
+    coverage = dot_coverage(radii)
+    target = np.arange(256) / 255.0 * coverage[-1]
+    table = (np.interp(target, coverage, radii) ** 2).astype(np.float32)
+    table.flags.writeable = False
+    return table
+
+
+def halftone_options(lpi=None, angle=None, dot_size=None, dpi=None):
+    """Screen parameters with environment defaults, validated"""
+    options = {
+        'lpi': HALFTONE_LPI if lpi is None else float(lpi),
+        'angle': HALFTONE_ANGLE if angle is None else float(angle),
+        'dot_size': HALFTONE_DOT_SIZE if dot_size is None else float(dot_size),
+        'dpi': HALFTONE_DPI if dpi is None else float(dpi),
+    }
+    if options['lpi'] <= 0 or options['dpi'] <= 0:
+        raise ValueError("lpi and dpi must be positive")
+    if options['dpi'] / options['lpi'] < MIN_CELL_PIXELS:
+        raise ValueError(f"Screen too fine: dpi / lpi must be at least {MIN_CELL_PIXELS:g} pixels")
+    if not 0 < options['dot_size'] <= 1:
+        raise ValueError("dot_size must be in (0, 1]")
+    return options
+
+
+def am_halftone(gray, lpi=HALFTONE_LPI, angle=HALFTONE_ANGLE, dot_size=HALFTONE_DOT_SIZE, dpi=HALFTONE_DPI):
+    """Binary AM halftone (black dots on white) of a grayscale image"""
+    cell = dpi / lpi
+    height, width = gray.shape[:2]
+
+    # Mean darkness over one screen cell around every pixel
+    size = max(1, int(round(cell)))
+    darkness = cv2.bitwise_not(gray, dst=scratch(gray.shape[:2]))
+    tone = cv2.blur(darkness, (size, size), dst=scratch(gray.shape[:2]), borderType=cv2.BORDER_REPLICATE)
+    release(darkness)
+    radius2 = radius_table(round(dot_size, 4))
+
+    theta = np.deg2rad(angle)
+    cos, sin = np.float32(np.cos(theta)), np.float32(np.sin(theta))
+    xs = np.arange(width, dtype=np.float32) + 0.5
+
+    output = scratch((height, width))
+    for top in range(0, height, STRIP_ROWS):
+        bottom = min(height, top + STRIP_ROWS)
+        ys = np.arange(top, bottom, dtype=np.float32)[:, None] + 0.5
+
+        # Screen coordinates in cells, the containing cell and the offset to its centre
+        u = (xs * cos + ys * sin) / np.float32(cell)
+        v = (ys * cos - xs * sin) / np.float32(cell)
+        cell_u = np.floor(u) + np.float32(0.5)
+        cell_v = np.floor(v) + np.float32(0.5)
+        u -= cell_u
+        v -= cell_v
+        distance2 = u * u + v * v
+
+        # Cell centre back in image pixels, where the cell's tone is sampled
+        map_x = (cell_u * cos - cell_v * sin) * np.float32(cell) - np.float32(0.5)
+        map_y = (cell_u * sin + cell_v * cos) * np.float32(cell) - np.float32(0.5)
+        sampled = cv2.remap(tone, map_x, map_y, cv2.INTER_NEAREST, borderMode=cv2.BORDER_REPLICATE)
+
+        inside = distance2 <= radius2[sampled]
+        output[top:bottom] = np.where(inside, 0, 255)
+    release(tone)
+    return output
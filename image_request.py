@@ -0,0 +1,73 @@
+"""
+Shared parsing of image upload requests.
+
+The services accept the image in any of three shapes so the gateway can
+forward the client's body untouched:
+    - JSON:      {"image": "<base64 or data URL>", ...params}
+    - multipart: an "image" file field plus form fields as params
+    - raw body:  Content-Type image/*, params in the query string
+
+Batch endpoints that carry several images (e.g. /nest) take a plain JSON
+object instead, read with read_json_payload.
+"""
+
+import base64
+import binascii
+
+
+class ImageRequestError(ValueError):
+    """The request did not carry a usable image"""
+
+
+def base64_to_bytes(base64_string):
+    """Strip an optional data URL prefix and return the raw encoded image bytes"""
+    if not isinstance(base64_string, str):
+        raise ImageRequestError('Image must be a base64 string')
+    if ',' in base64_string:
+        base64_string = base64_string.split(',')[1]
+    try:
+        # Line breaks of wrapped base64 are allowed, any other stray character is not
+        return base64.b64decode(''.join(base64_string.split()), validate=True)
+    except (binascii.Error, ValueError):
+        raise ImageRequestError('Image is not valid base64')
+
+
+def read_image_payload(req):
+    """Return (image_bytes, params) from a Flask request"""
+    content_type = (req.mimetype or '').lower()
+
+    if content_type.startswith('multipart/'):
+        file = req.files.get('image')
+        if file is None or file.filename == '':
+            raise ImageRequestError('No image file provided')
+        params = req.form.to_dict()
+        params.update(req.args.to_dict())
+        return file.read(), params
+
+    if content_type.startswith('image/') or content_type == 'application/octet-stream':
+        image_bytes = req.get_data()
+        if not image_bytes:
+            raise ImageRequestError('Empty image body')
+        return image_bytes, req.args.to_dict()
+
+    data = req.get_json(silent=True)
+    if data is None:
+        raise ImageRequestError('No image provided')
+    if not isinstance(data, dict):
+        raise ImageRequestError('Expected a JSON object body')
+    image_base64 = data.pop('image', None)
+    if not image_base64:
+        raise ImageRequestError('No image provided')
+    params = req.args.to_dict()
+    params.update(data)
+    return base64_to_bytes(image_base64), params
+
+
+def read_json_payload(req):
+    """Return (None, params) from a JSON request without a single image"""
+    data = req.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ImageRequestError('Expected a JSON object body')
+    params = req.args.to_dict()
+    params.update(data)
+    return None, params
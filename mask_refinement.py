@@ -0,0 +1,150 @@
+"""
+Low-resolution segmentation with full-resolution edge refinement.
+
+Background removal only needs full resolution where foreground meets
+background. The segmentation (rembg model or OpenCV threshold) runs on a
+copy bounded to BG_INFERENCE_MAX_SIDE; the coarse mask is upsampled, and a
+trimap is derived from it: eroded interior is sure foreground, outside the
+dilated mask is sure background, and only the band in between is refined
+at full resolution with a guided filter on the original image. The band
+is processed tile by tile, so refinement cost follows the length of the
+mask boundary rather than the image area.
+
+Configuration (environment):
+    BG_REMOVAL_MODE        - 'full' (default) or 'lowres'
+    BG_INFERENCE_MAX_SIDE  - longest side of the inference copy (default 1024)
+    BG_REFINE_BAND         - half-width of the refined edge band in pixels (default 12)
+    BG_GUIDED_RADIUS       - guided filter radius in pixels (default 8)
+    BG_GUIDED_EPS          - guided filter regularization (default 1e-4)
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+BG_REMOVAL_MODE = os.environ.get('BG_REMOVAL_MODE', 'full').lower()
+BG_INFERENCE_MAX_SIDE = int(os.environ.get('BG_INFERENCE_MAX_SIDE', 1024))
+BG_REFINE_BAND = int(os.environ.get('BG_REFINE_BAND', 12))
+BG_GUIDED_RADIUS = int(os.environ.get('BG_GUIDED_RADIUS', 8))
+BG_GUIDED_EPS = float(os.environ.get('BG_GUIDED_EPS', 1e-4))
+
+REMOVAL_MODES = ('full', 'lowres')
+
+# Side of the square tiles the edge band is refined in
+TILE_SIZE = 64
+
+
+def removal_mode(requested=None):
+    """Validated mode from a request parameter, falling back to BG_REMOVAL_MODE"""
+    mode = (requested or BG_REMOVAL_MODE).lower()
+    if mode not in REMOVAL_MODES:
+        raise ValueError(f"Unknown background removal mode '{mode}', expected one of {REMOVAL_MODES}")
+    return mode
+
+
+def inference_copy(image, max_side=BG_INFERENCE_MAX_SIDE):
+    """Downscaled copy whose longest side is at most max_side, and the scale used"""
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width)) if max_side > 0 else 1.0
+    if scale >= 1.0:
+        return image, 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+
+def _box(array, radius):
+    return cv2.boxFilter(array, cv2.CV_32F, (2 * radius + 1, 2 * radius + 1),
+                         borderType=cv2.BORDER_REFLECT)
+
+
+def guided_filter(guide, source, radius, eps):
+    """Gray-guide guided filter (He et al.); guide and source are float32 in [0, 1]"""
+    mean_i = _box(guide, radius)
+    mean_p = _box(source, radius)
+    var_i = _box(guide * guide, radius) - mean_i * mean_i
+    cov_ip = _box(guide * source, radius) - mean_i * mean_p
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    return _box(a, radius) * guide + _box(b, radius)
+
+
+def refine_mask(image, coarse_mask, band=BG_REFINE_BAND, radius=BG_GUIDED_RADIUS, eps=BG_GUIDED_EPS,
+                guide=None):
+    """
+    Upsample a coarse 0-255 mask to the image size and refine its edge band.
+    The filter is guided by the luminance of image (BGR or gray) unless a
+    grayscale guide is given.
+
+    Returns (alpha, stats): alpha is uint8 at full resolution, stats reports
+    how much of the frame the refinement actually touched.
+    """
+    height, width = image.shape[:2]
+    mask = cv2.resize(coarse_mask, (width, height), interpolation=cv2.INTER_LINEAR)
+
+    # Trimap: sure foreground / sure background from the binarized mask,
+    # everything within `band` pixels of the boundary is unknown
+    binary = (mask >= 128).astype(np.uint8)
+    # Square kernel: separable, so the trimap costs two cheap passes
+    kernel = np.ones((2 * band + 1, 2 * band + 1), np.uint8)
+    sure_fg = cv2.erode(binary, kernel)
+    maybe_fg = cv2.dilate(binary, kernel)
+    unknown = maybe_fg - sure_fg
+
+    alpha = sure_fg * np.uint8(255)
+
+    # Only tiles touched by the band are filtered; each crop is padded so the
+    # filter's box windows see the same neighbourhood as on the full frame
+    tiles_y, tiles_x = -(-height // TILE_SIZE), -(-width // TILE_SIZE)
+    padded = np.zeros((tiles_y * TILE_SIZE, tiles_x * TILE_SIZE), np.uint8)
+    padded[:height, :width] = unknown
+    touched = padded.reshape(tiles_y, TILE_SIZE, tiles_x, TILE_SIZE).max(axis=(1, 3)) > 0
+
+    if guide is not None:
+        gray = guide
+    else:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    pad = 2 * radius
+    band_pixels = 0
+
+    for ty, tx in zip(*np.nonzero(touched)):
+        y0, x0 = ty * TILE_SIZE, tx * TILE_SIZE
+        y1, x1 = min(y0 + TILE_SIZE, height), min(x0 + TILE_SIZE, width)
+        cy0, cx0 = max(0, y0 - pad), max(0, x0 - pad)
+        cy1, cx1 = min(height, y1 + pad), min(width, x1 + pad)
+
+        guide = gray[cy0:cy1, cx0:cx1].astype(np.float32) / 255.0
+        source = mask[cy0:cy1, cx0:cx1].astype(np.float32) / 255.0
+        refined = guided_filter(guide, source, radius, eps)[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+
+        tile_unknown = unknown[y0:y1, x0:x1].astype(bool)
+        tile_alpha = alpha[y0:y1, x0:x1]
+        tile_alpha[tile_unknown] = np.clip(refined[tile_unknown] * 255 + 0.5, 0, 255).astype(np.uint8)
+        band_pixels += int(tile_unknown.sum())
+
+    stats = {
+        'band_pixels': band_pixels,
+        'band_fraction': round(band_pixels / float(height * width), 4),
+        'tiles_refined': int(touched.sum()),
+        'tiles_total': int(tiles_y * tiles_x)
+    }
+    return alpha, stats
+
+
+def lowres_alpha(image, segment, max_side=BG_INFERENCE_MAX_SIDE, guide=None):
+    """
+    Run segment(small_image) -> 0-255 mask on a bounded copy and refine the
+    upsampled mask at full resolution. Returns (alpha, stats), or
+    (None, None) when segment finds no subject and returns None.
+    """
+    small, scale = inference_copy(image, max_side)
+    coarse = segment(small)
+    if coarse is None:
+        return None, None
+    alpha, stats = refine_mask(image, coarse, guide=guide)
+    stats.update({
+        'mode': 'lowres',
+        'inference_size': [int(small.shape[1]), int(small.shape[0])],
+        'scale': round(scale, 4)
+    })
+    return alpha, stats
@@ -0,0 +1,361 @@
+"""
+Pendant shapes: the outline an engraving is cropped to.
+
+Built-in shapes are circle, heart, bone and tag (a rounded rectangle with a
+ring hole); 'custom' takes the closed subpaths of an SVG outline. Every
+shape is a set of closed rings in its own units, scaled uniformly to fit the
+image minus a margin and centred. Inside is decided by the even-odd rule
+over all rings, so outlines may have holes. The circle keeps the
+professional filter's exact geometry.
+
+Raster: the mask of everything outside the shape is rasterized once per
+(shape, width, height) and composited with a single bitwise OR (white
+outside, engraving inside). Masks are kept read-only in the professional
+filter's mask cache, which the circle crop also uses, bounded by
+PENDANT_MASK_CACHE_MB; masks over a quarter of that budget (very large
+uploads) are rebuilt per request instead.
+
+Vector: instead of masking the raster before tracing (which traces the mask
+edge as an extra path and leaves jagged stroke ends), traced SVGs are
+clipped geometrically. Every polyline is split where it crosses the
+outline and only the pieces inside are kept; closed paths that stay fully
+inside remain closed.
+
+Configuration (environment):
+    PENDANT_SHAPE         - default shape of /professional-engraving (default circle)
+    PENDANT_MASK_CACHE_MB - rasterized mask budget per worker in MB, 0 disables (default 64)
+"""
+
+import os
+import hashlib
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from svg_paths import svg_strokes, element_strokes, format_number
+from filtre_gravure_simple.professional_pet_engraving import (PENDANT_MARGIN, pendant_circle, draw_circle_outside,
+                                                              mask_cache)
+
+PENDANT_SHAPE = os.environ.get('PENDANT_SHAPE', 'circle').lower()
+
+SHAPE_NAMES = ('circle', 'heart', 'bone', 'tag', 'custom', 'none')
+
+CIRCLE_SEGMENTS = 360
+CURVE_SEGMENTS = 256
+# Sub-pixel bits used when rasterizing outlines
+FILL_SHIFT = 4
+MAX_CUSTOM_SVG_BYTES = 512 * 1024
+# Clipped pieces shorter than this (pixels) are dropped
+MIN_PIECE_LENGTH = 1.0
+# Segment x edge pairs evaluated per block while clipping
+CLIP_BLOCK_PAIRS = 2_000_000
+# Half-width of the band around the raster outline where clipping is exact
+BAND_PIXELS = 2
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+ET.register_namespace('', SVG_NS)
+ET.register_namespace('xlink', 'http://www.w3.org/1999/xlink')
+
+
+class PendantShape:
+    """Closed rings in the shape's own units, fitted to an image on demand"""
+
+    def __init__(self, name, rings, key=None):
+        self.name = name
+        self.key = key or name
+        self.rings = [np.asarray(ring, np.float64) for ring in rings]
+        points = np.concatenate(self.rings)
+        self.origin = points.min(axis=0)
+        self.size = np.maximum(points.max(axis=0) - self.origin, 1e-9)
+
+    def __eq__(self, other):
+        return isinstance(other, PendantShape) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def outline(self, width, height):
+        """Rings in image pixels: uniformly scaled into the margin box and centred"""
+        box = np.array([width, height], np.float64) - 2 * PENDANT_MARGIN
+        scale = float(np.min(box / self.size))
+        offset = (np.array([width, height], np.float64) - self.size * scale) / 2
+        return [(ring - self.origin) * scale + offset for ring in self.rings]
+
+    def rasterize(self, width, height):
+        outside = np.full((height, width), 255, np.uint8)
+        rings = [np.round(ring * (1 << FILL_SHIFT)).astype(np.int32) for ring in self.outline(width, height)]
+        cv2.fillPoly(outside, rings, 0, lineType=cv2.LINE_8, shift=FILL_SHIFT)
+        return outside
+
+
+class CircleShape(PendantShape):
+    """The professional filter's circle: same centre, radius and raster"""
+
+    def __init__(self):
+        t = np.linspace(0, 2 * np.pi, CIRCLE_SEGMENTS, endpoint=False)
+        super().__init__('circle', [np.stack([np.cos(t), np.sin(t)], axis=1)])
+
+    def outline(self, width, height):
+        (cx, cy), radius = pendant_circle(width, height)
+        return [self.rings[0] * radius + (cx, cy)]
+
+    def rasterize(self, width, height):
+        return draw_circle_outside(height, width)
+
+
+def heart_rings():
+    # Classic parametric heart, y flipped so the lobes are at the top
+    t = np.linspace(0, 2 * np.pi, CURVE_SEGMENTS, endpoint=False)
+    x = 16 * np.sin(t) ** 3
+    y = -(13 * np.cos(t) - 5 * np.cos(2 * t) - 2 * np.cos(3 * t) - np.cos(4 * t))
+    return [np.stack([x, y], axis=1)]
+
+
+def bone_rings():
+    # Union of a shaft and four end knobs, outlined from a fine raster
+    width, height = 1200, 600
+    canvas = np.zeros((height, width), np.uint8)
+    knob = int(height * 0.25)
+    for cx in (knob + 4, width - knob - 4):
+        for cy in (int(height * 0.27), int(height * 0.73)):
+            cv2.circle(canvas, (cx, cy), knob, 255, -1, lineType=cv2.LINE_AA)
+    cv2.rectangle(canvas, (knob, int(height * 0.33)), (width - knob, int(height * 0.67)), 255, -1)
+    contours, _ = cv2.findContours(canvas, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    contour = max(contours, key=cv2.contourArea)
+    return [cv2.approxPolyDP(contour, 1.0, True).reshape(-1, 2).astype(np.float64)]
+
+
+def rounded_rectangle(width, height, radius, segments=16):
+    corners = [(width - radius, radius, -90), (width - radius, height - radius, 0),
+               (radius, height - radius, 90), (radius, radius, 180)]
+    points = []
+    for cx, cy, start in corners:
+        angles = np.radians(start + np.linspace(0, 90, segments))
+        points.append(np.stack([cx + radius * np.cos(angles), cy + radius * np.sin(angles)], axis=1))
+    return np.concatenate(points)
+
+
+def tag_rings():
+    # Portrait dog tag with a ring hole near the top
+    t = np.linspace(0, 2 * np.pi, 64, endpoint=False)
+    hole = np.stack([31 + 5 * np.cos(t), 12 + 5 * np.sin(t)], axis=1)
+    return [rounded_rectangle(62, 100, 14), hole]
+
+
+BUILTIN_SHAPES = {
+    'circle': CircleShape(),
+    'heart': PendantShape('heart', heart_rings()),
+    'bone': PendantShape('bone', bone_rings()),
+    'tag': PendantShape('tag', tag_rings()),
+}
+
+
+@lru_cache(maxsize=32)
+def custom_shape(svg_string):
+    """Shape from the closed subpaths of an SVG outline (open ones are closed implicitly)"""
+    if len(svg_string) > MAX_CUSTOM_SVG_BYTES:
+        raise ValueError(f"Pendant SVG is larger than {MAX_CUSTOM_SVG_BYTES // 1024} KB")
+    _, _, strokes = svg_strokes(svg_string)
+    rings = [points for points, _, _ in strokes if len(points) >= 3]
+    if not rings:
+        raise ValueError("Pendant SVG has no outline with at least three points")
+    digest = hashlib.sha256(svg_string.encode('utf-8')).hexdigest()[:16]
+    return PendantShape('custom', rings, key=f"custom:{digest}")
+
+
+def pendant_shape(name=None, svg=None):
+    """Shape by name, or from an SVG outline; None for 'none'"""
+    name = (name or ('custom' if svg else PENDANT_SHAPE)).lower()
+    if name not in SHAPE_NAMES:
+        raise ValueError(f"Unknown pendant shape '{name}', expected one of {list(SHAPE_NAMES)}")
+    if name == 'none':
+        return None
+    if name == 'custom':
+        if not svg:
+            raise ValueError("pendant_shape=custom needs a pendant_svg outline")
+        return custom_shape(svg)
+    return BUILTIN_SHAPES[name]
+
+
+def outside_mask(shape, width, height):
+    """Read-only uint8 mask, 255 outside the shape; cached per (shape, size)"""
+    # The circle's key matches circle_outside_mask, so both crops share one entry
+    return mask_cache.get_or_build((shape.key, width, height), lambda: shape.rasterize(width, height))
+
+
+def composite(image, shape, dst=None):
+    """White outside the shape, the image inside, in one OR (dst may be image itself)"""
+    outside = outside_mask(shape, image.shape[1], image.shape[0])
+    return cv2.bitwise_or(image, outside, dst=dst)
+
+
+def inside(points, rings):
+    """Even-odd point-in-polygon test of an (N, 2) array against the rings"""
+    starts = np.concatenate(rings)
+    ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+    result = np.zeros(len(points), bool)
+    block = max(1, CLIP_BLOCK_PAIRS // len(starts))
+    for first in range(0, len(points), block):
+        px = points[first:first + block, 0:1]
+        py = points[first:first + block, 1:2]
+        straddles = (starts[:, 1] > py) != (ends[:, 1] > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_at = starts[:, 0] + (py - starts[:, 1]) * (ends[:, 0] - starts[:, 0]) / (ends[:, 1] - starts[:, 1])
+        result[first:first + block] = np.count_nonzero(straddles & (px < x_at), axis=1) % 2 == 1
+    return result
+
+
+def _crossings(p0, p1, rings):
+    """(segment index, t) of every proper crossing of the segments with the outline"""
+    a = np.concatenate(rings)
+    e = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings]) - a
+    segment_ids, params = [], []
+    block = max(1, CLIP_BLOCK_PAIRS // len(a))
+    for first in range(0, len(p0), block):
+        start = p0[first:first + block, None, :]
+        d = p1[first:first + block, None, :] - start
+        offset = a[None] - start
+        denominator = d[..., 0] * e[:, 1] - d[..., 1] * e[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (offset[..., 0] * e[:, 1] - offset[..., 1] * e[:, 0]) / denominator
+            u = (offset[..., 0] * d[..., 1] - offset[..., 1] * d[..., 0]) / denominator
+        hit = (denominator != 0) & (t > 0) & (t < 1) & (u >= 0) & (u < 1)
+        rows, _ = np.nonzero(hit)
+        segment_ids.append(rows + first)
+        params.append(t[hit])
+    if not segment_ids:
+        return np.zeros(0, np.int64), np.zeros(0)
+    return np.concatenate(segment_ids), np.concatenate(params)
+
+
+def near_outline(p0, p1, outside):
+    """
+    Segments whose bounding box comes within BAND_PIXELS of the raster
+    outline; all others lie entirely on one side of it
+    """
+    size = 2 * BAND_PIXELS + 1
+    band = cv2.morphologyEx(outside, cv2.MORPH_GRADIENT, np.ones((size, size), np.uint8))
+    sums = cv2.integral(band)
+    height, width = outside.shape
+    low = np.floor(np.minimum(p0, p1)).astype(np.int64) - 1
+    high = np.ceil(np.maximum(p0, p1)).astype(np.int64) + 2
+    x0, x1 = np.clip(low[:, 0], 0, width), np.clip(high[:, 0], 0, width)
+    y0, y1 = np.clip(low[:, 1], 0, height), np.clip(high[:, 1], 0, height)
+    return (sums[y1, x1] - sums[y0, x1] - sums[y1, x0] + sums[y0, x0]) > 0
+
+
+def clip_strokes(strokes, rings, outside=None):
+    """
+    Clip (points, closed) polylines to the inside of the rings. Returns one
+    list of (points, closed) pieces per input stroke, in the original order
+    and direction; a stroke entirely inside comes back unchanged.
+
+    With the shape's raster `outside` mask only segments near the outline
+    are intersected exactly; the others take their side from the mask.
+    """
+    result = [[] for _ in strokes]
+    valid = [index for index, (points, _) in enumerate(strokes) if len(points) >= 2]
+    if not valid:
+        return result
+    # Closed strokes get their closing segment explicitly
+    paths = []
+    for index in valid:
+        points, closed = np.asarray(strokes[index][0], np.float64), strokes[index][1]
+        paths.append(np.vstack([points, points[:1]]) if closed else points)
+    owner = np.repeat(np.arange(len(paths)), [len(path) - 1 for path in paths])
+    p0 = np.concatenate([path[:-1] for path in paths])
+    p1 = np.concatenate([path[1:] for path in paths])
+
+    # Break every segment at its crossings; each piece is inside or outside as a whole
+    count = len(p0)
+    near = np.ones(count, bool) if outside is None else near_outline(p0, p1, outside)
+    near_ids = np.flatnonzero(near)
+    cross_ids, cross_t = _crossings(p0[near_ids], p1[near_ids], rings)
+    cross_ids = near_ids[cross_ids]
+    segment_ids = np.concatenate([np.arange(count), np.arange(count), cross_ids])
+    params = np.concatenate([np.zeros(count), np.ones(count), cross_t])
+    order = np.lexsort((params, segment_ids))
+    segment_ids, params = segment_ids[order], params[order]
+    pairs = np.flatnonzero((segment_ids[:-1] == segment_ids[1:]) & (params[1:] - params[:-1] > 1e-9))
+    piece_segment = segment_ids[pairs]
+    t0, t1 = params[pairs][:, None], params[pairs + 1][:, None]
+    direction = p1[piece_segment] - p0[piece_segment]
+    starts = p0[piece_segment] + direction * t0
+    ends = p0[piece_segment] + direction * t1
+    middles = (starts + ends) / 2
+    exact = near[piece_segment]
+    keep = np.zeros(len(pairs), bool)
+    keep[exact] = inside(middles[exact], rings)
+    if not exact.all():
+        height, width = outside.shape
+        x = np.clip(np.round(middles[~exact, 0]).astype(np.int64), 0, width - 1)
+        y = np.clip(np.round(middles[~exact, 1]).astype(np.int64), 0, height - 1)
+        keep[~exact] = outside[y, x] == 0
+
+    # Pieces are sorted by segment, so each stroke's pieces are one contiguous range
+    bounds = np.searchsorted(owner[piece_segment], np.arange(len(paths) + 1))
+    for path, index in enumerate(valid):
+        pieces = np.arange(bounds[path], bounds[path + 1])
+        kept = keep[pieces]
+        if kept.all():
+            result[index] = [strokes[index]]
+            continue
+        runs, current = [], None
+        for piece, is_inside in zip(pieces, kept):
+            if not is_inside:
+                current = None
+                continue
+            if current is None:
+                current = [starts[piece]]
+                runs.append(current)
+            current.append(ends[piece])
+        if strokes[index][1] and len(runs) > 1 and kept[0] and kept[-1]:
+            # The run through the closing point continues into the first one
+            runs[0] = runs.pop() + runs[0][1:]
+        for run in runs:
+            run = np.array(run)
+            if np.sum(np.hypot(*np.diff(run, axis=0).T)) >= MIN_PIECE_LENGTH:
+                result[index].append((run, False))
+    return result
+
+
+def path_data(strokes):
+    parts = []
+    for points, closed in strokes:
+        coordinates = [f"{format_number(x, 2)},{format_number(y, 2)}" for x, y in points]
+        parts.append("M " + " L ".join(coordinates) + (" Z" if closed else ""))
+    return " ".join(parts)
+
+
+def clip_svg(svg_string, shape, width, height):
+    """Traced SVG with every path, polyline, polygon and line clipped to the shape"""
+    root = ET.fromstring(svg_string)
+    elements = []
+    for parent in root.iter():
+        for element in parent:
+            strokes = element_strokes(element)
+            if strokes is not None:
+                elements.append((parent, element, strokes))
+
+    # One clipping pass over the strokes of all elements
+    clipped = clip_strokes([stroke for _, _, strokes in elements for stroke in strokes],
+                           shape.outline(width, height), outside_mask(shape, width, height))
+    position = 0
+    for parent, element, strokes in elements:
+        pieces = clipped[position:position + len(strokes)]
+        position += len(strokes)
+        if all(len(stroke_pieces) == 1 and stroke_pieces[0] is stroke
+               for stroke_pieces, stroke in zip(pieces, strokes)):
+            continue
+        pieces = [piece for stroke_pieces in pieces for piece in stroke_pieces]
+        if not pieces:
+            parent.remove(element)
+            continue
+        # Keep the styling, replace the geometry with an equivalent path
+        for name in ('points', 'x1', 'y1', 'x2', 'y2'):
+            element.attrib.pop(name, None)
+        element.tag = f"{{{SVG_NS}}}path"
+        element.set('d', path_data(pieces))
+    return ET.tostring(root, encoding='unicode')
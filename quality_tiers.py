@@ -0,0 +1,250 @@
+"""
+Quality-tier degradation for the interactive endpoints.
+
+When a worker is saturated, rendering every style at full resolution only
+makes every request time out. A DegradationController per service watches
+two signals and picks the tier new requests are rendered at:
+
+    - queue depth: requests in flight plus interactive requests waiting
+      for admission budget (queued batch work does not count)
+    - latency: p95 of the requests completed in the last DEGRADE_WINDOW
+      seconds against the DEGRADE_LATENCY_SLO target
+
+Tiers, cheapest last:
+    full     - as requested
+    reduced  - working resolution capped at DEGRADE_REDUCED_MAX_SIDE (JPEGs
+               are decoded at reduced scale), smaller bilateral denoise
+               neighbourhoods, background removal at low resolution
+    minimal  - capped at DEGRADE_MINIMAL_MAX_SIDE, optional dashboard styles
+               skipped, the lighter DEGRADE_LIGHT_MODEL for background removal
+
+Under pressure a recent result for the same request (any tier) is served
+from a small cache instead of rendering again. The cache is bounded by the
+approximate size of the results (their encoded images and SVG text). The tier rises as soon as a
+signal crosses its threshold and drops one step at a time once pressure
+has stayed lower for DEGRADE_COOLDOWN seconds. Every response reports its
+tier under "quality", so the frontend can ask for a full render later.
+G-code/DXF exports are machine files and batch requests can wait, so
+neither is ever degraded.
+
+Configuration (environment):
+    DEGRADE_ENABLED            - 0 always renders at full quality (default 1)
+    DEGRADE_LATENCY_SLO        - p95 seconds target; above it 'reduced', above 2x 'minimal' (default 20)
+    DEGRADE_QUEUE_REDUCED      - queue depth that selects 'reduced' (default 4)
+    DEGRADE_QUEUE_MINIMAL      - queue depth that selects 'minimal' (default 8)
+    DEGRADE_WINDOW             - seconds of latencies considered (default 60)
+    DEGRADE_COOLDOWN           - seconds of lower pressure before stepping down (default 30)
+    DEGRADE_REDUCED_MAX_SIDE   - longest side in 'reduced' (default 1600)
+    DEGRADE_MINIMAL_MAX_SIDE   - longest side in 'minimal' (default 1024)
+    DEGRADE_LIGHT_MODEL        - rembg variant in 'minimal' when enabled (default u2netp)
+    DEGRADE_PREVIEW_CACHE_MB   - MB of recent results kept per worker for serving under pressure (default 32)
+"""
+
+import os
+import time
+import math
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from request_scheduling import current_request
+
+DEGRADE_ENABLED = os.environ.get('DEGRADE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+DEGRADE_LATENCY_SLO = float(os.environ.get('DEGRADE_LATENCY_SLO', 20))
+DEGRADE_QUEUE_REDUCED = int(os.environ.get('DEGRADE_QUEUE_REDUCED', 4))
+DEGRADE_QUEUE_MINIMAL = int(os.environ.get('DEGRADE_QUEUE_MINIMAL', 8))
+DEGRADE_WINDOW = float(os.environ.get('DEGRADE_WINDOW', 60))
+DEGRADE_COOLDOWN = float(os.environ.get('DEGRADE_COOLDOWN', 30))
+DEGRADE_REDUCED_MAX_SIDE = int(os.environ.get('DEGRADE_REDUCED_MAX_SIDE', 1600))
+DEGRADE_MINIMAL_MAX_SIDE = int(os.environ.get('DEGRADE_MINIMAL_MAX_SIDE', 1024))
+DEGRADE_LIGHT_MODEL = os.environ.get('DEGRADE_LIGHT_MODEL', 'u2netp')
+DEGRADE_PREVIEW_CACHE_MB = float(os.environ.get('DEGRADE_PREVIEW_CACHE_MB', 32))
+
+TIERS = ('full', 'reduced', 'minimal')
+
+# What each tier changes; the services read these instead of the tier name
+TIER_SETTINGS = {
+    'full':    {'max_side': None, 'fast_denoise': False, 'optional_styles': True},
+    'reduced': {'max_side': DEGRADE_REDUCED_MAX_SIDE, 'fast_denoise': True, 'optional_styles': True},
+    'minimal': {'max_side': DEGRADE_MINIMAL_MAX_SIDE, 'fast_denoise': True, 'optional_styles': False},
+}
+
+# Latency samples needed before the p95 counts
+MIN_LATENCY_SAMPLES = 5
+
+
+def quality_tier(requested=None):
+    """Validated 'quality' request parameter: auto (None) or a tier to cap quality at"""
+    if requested in (None, '', 'auto'):
+        return None
+    if requested not in TIERS:
+        raise ValueError(f"Unknown quality '{requested}', expected auto or one of {list(TIERS)}")
+    return requested
+
+
+def scaled_size(width, height, max_side=None):
+    """(width, height) fitted within max_side, aspect kept (unchanged when it already fits)"""
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+# Results above this share of the preview cache are not kept
+PREVIEW_MAX_SHARE = 0.25
+
+
+def approximate_bytes(value):
+    """Size of a result: the strings and bytes it holds plus a little per other value"""
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(approximate_bytes(k) + approximate_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(approximate_bytes(v) for v in value)
+    return getattr(value, 'nbytes', 16)
+
+
+class PreviewCache:
+    """Most recent results by request key (without the tier), bounded by their approximate bytes"""
+
+    def __init__(self, max_mb=DEGRADE_PREVIEW_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._items = OrderedDict()  # key -> (tier, result, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[:2]
+
+    def put(self, key, tier, result):
+        size = approximate_bytes(result)
+        if self.max_bytes <= 0 or size > self.max_bytes * PREVIEW_MAX_SHARE:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._items[key] = (tier, result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._items), 'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+                    'used_mb': round(self._bytes / (1024 * 1024), 1), 'hits': self.hits}
+
+
+class DegradationController:
+    """Picks the quality tier from admission queue depth and recent latency"""
+
+    def __init__(self, admission, latency_slo=DEGRADE_LATENCY_SLO, queue_reduced=DEGRADE_QUEUE_REDUCED,
+                 queue_minimal=DEGRADE_QUEUE_MINIMAL, window=DEGRADE_WINDOW, cooldown=DEGRADE_COOLDOWN,
+                 enabled=DEGRADE_ENABLED):
+        self.admission = admission
+        self.latency_slo = latency_slo
+        self.queue_reduced = queue_reduced
+        self.queue_minimal = queue_minimal
+        self.window = window
+        self.cooldown = cooldown
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._latencies = deque()  # (completed at, seconds)
+        self._level = 0
+        self._changed = time.monotonic()
+        self.previews = PreviewCache()
+        self.served = {tier: 0 for tier in TIERS}
+        self.transitions = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._latencies.append((time.monotonic(), seconds))
+
+    @contextmanager
+    def timed(self):
+        """Record the block's duration as a request latency when it completes"""
+        start = time.monotonic()
+        yield
+        self.record(time.monotonic() - start)
+
+    def _p95(self, now):
+        while self._latencies and now - self._latencies[0][0] > self.window:
+            self._latencies.popleft()
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(seconds for _, seconds in self._latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def _pressure(self, now):
+        """Tier level the current signals call for"""
+        depth = self.admission.queue_depth('interactive')
+        level = 2 if depth >= self.queue_minimal else 1 if depth >= self.queue_reduced else 0
+        p95 = self._p95(now)
+        if p95 is not None:
+            level = max(level, 2 if p95 > 2 * self.latency_slo else 1 if p95 > self.latency_slo else 0)
+        return level
+
+    def tier(self, requested=None):
+        """
+        Tier for a new request: the controller's (batch requests always
+        'full'), or lower if the request asks for it
+        """
+        batch = current_request()[0] == 'batch'
+        with self._lock:
+            if self.enabled and not batch:
+                now = time.monotonic()
+                target = self._pressure(now)
+                if target >= self._level:
+                    # Pressure at or above the current tier restarts the cooldown
+                    if target > self._level:
+                        self.transitions += 1
+                    self._level = target
+                    self._changed = now
+                elif now - self._changed >= self.cooldown:
+                    self._level -= 1
+                    self._changed = now
+                    self.transitions += 1
+            level = self._level if self.enabled and not batch else 0
+            if requested is not None:
+                level = max(level, TIERS.index(requested))
+            tier = TIERS[level]
+            self.served[tier] += 1
+            return tier
+
+    def report(self, tier, cached=False, working_size=None, skipped_styles=None):
+        """The "quality" entry of a response"""
+        report = {'tier': tier, 'degraded': tier != 'full'}
+        if working_size is not None:
+            report['working_size'] = list(working_size)
+        if skipped_styles:
+            report['skipped_styles'] = list(skipped_styles)
+        if cached:
+            report['cached'] = True
+        if tier != 'full':
+            # Earliest the tier can drop if load eases now
+            report['retry_full_after'] = int(self.cooldown)
+        return report
+
+    def stats(self):
+        with self._lock:
+            p95 = self._p95(time.monotonic())
+            return {
+                'enabled': self.enabled,
+                'tier': TIERS[self._level],
+                'queue_depth': self.admission.queue_depth('interactive'),
+                'latency_p95_seconds': round(p95, 2) if p95 is not None else None,
+                'latency_slo_seconds': self.latency_slo,
+                'served': dict(self.served),
+                'transitions': self.transitions,
+                'preview_cache': self.previews.stats()
+            }
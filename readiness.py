@@ -0,0 +1,153 @@
+"""
+Liveness/readiness tracking and boot-time warm-up for the PupRing services.
+
+A worker is *live* as soon as Flask can answer requests, but it is only
+*ready* once the warm-up pass has pushed a synthetic image through every
+processing step, so OpenCV kernels, allocator pools and model files are
+already loaded when the first customer request arrives.
+
+Configuration (environment):
+    WARMUP_ENABLED   - "false" to skip warm-up and report ready immediately
+    WARMUP_SIZE      - edge length in pixels of the synthetic image (default 512)
+    WARMUP_STEPS     - comma separated subset of step names to run (default: all)
+    WARMUP_BLOCKING  - "true" to warm up synchronously at import time
+"""
+
+import os
+import threading
+import multiprocessing
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', 'true').lower() == 'true'
+WARMUP_SIZE = int(os.environ.get('WARMUP_SIZE', 512))
+WARMUP_STEPS = [s.strip() for s in os.environ.get('WARMUP_STEPS', '').split(',') if s.strip()]
+WARMUP_BLOCKING = os.environ.get('WARMUP_BLOCKING', 'false').lower() == 'true'
+
+
+def make_synthetic_image(size=WARMUP_SIZE):
+    """
+    Build a deterministic RGB test card with gradients, edges and texture so
+    every style exercises its real code paths (edges, thresholds, contours).
+    """
+    # Imported lazily so the minimal gateway can use this module without numpy
+    import numpy as np
+
+    size = max(int(size), 64)
+    y, x = np.mgrid[0:size, 0:size]
+    gradient = ((x + y) * 255 // (2 * size - 2)).astype(np.uint8)
+
+    image = np.dstack([gradient, gradient[::-1], gradient[:, ::-1]]).copy()
+
+    # A filled "face" and a few strokes give Canny/contours something to find
+    center = size // 2
+    radius = size // 4
+    mask = (x - center) ** 2 + (y - center) ** 2 <= radius ** 2
+    image[mask] = (200, 180, 160)
+    image[size // 8:size // 8 + 4, :] = 0
+    image[:, size // 8:size // 8 + 4] = 0
+
+    rng = np.random.default_rng(0)
+    noise = rng.integers(-12, 12, size=image.shape)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+class Readiness:
+    """
+    Tracks the warm-up state of one worker process.
+
+    States: 'starting' -> 'warming' -> 'ready'. A failing warm-up step is
+    recorded but does not keep the worker out of rotation forever; the
+    worker still becomes ready so a broken optional dependency cannot take
+    the whole service down.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.state = 'starting'
+        self.started_at = time.time()
+        self.ready_at = None
+        self.steps = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def is_ready(self):
+        return self.state == 'ready'
+
+    def mark_ready(self):
+        with self._lock:
+            self.state = 'ready'
+            self.ready_at = time.time()
+
+    def run_warmup(self, steps, image=None):
+        """Run each (name, callable) step once on the synthetic image"""
+        with self._lock:
+            self.state = 'warming'
+
+        if image is None:
+            image = make_synthetic_image()
+
+        for name, step in steps:
+            if WARMUP_STEPS and name not in WARMUP_STEPS:
+                continue
+            start = time.perf_counter()
+            try:
+                step(image)
+                self.steps[name] = round((time.perf_counter() - start) * 1000, 1)
+            except Exception as e:
+                logger.error(f"Warm-up step '{name}' failed: {e}")
+                self.errors[name] = str(e)
+
+        self.mark_ready()
+        logger.info(f"{self.service} warm-up finished in "
+                    f"{self.ready_at - self.started_at:.2f}s ({len(self.steps)} steps)")
+
+    def start(self, steps):
+        """
+        Kick off warm-up according to the environment configuration.
+
+        Runs in a daemon thread by default so gunicorn can bind and answer
+        liveness probes while the worker warms up.
+        """
+        # Compute-pool children re-import the service modules; only the
+        # serving process needs warming up
+        if not WARMUP_ENABLED or not steps or multiprocessing.parent_process() is not None:
+            self.mark_ready()
+            return
+
+        if WARMUP_BLOCKING:
+            self.run_warmup(steps)
+            return
+
+        self._thread = threading.Thread(
+            target=self.run_warmup, args=(steps,),
+            name=f"{self.service}-warmup", daemon=True
+        )
+        self._thread.start()
+
+    def liveness(self):
+        return {
+            'status': 'alive',
+            'service': self.service,
+            'uptime_seconds': round(time.time() - self.started_at, 1)
+        }
+
+    def readiness(self):
+        """Return (payload, http_status) for the readiness endpoint"""
+        payload = {
+            'status': 'ready' if self.is_ready else self.state,
+            'service': self.service,
+            'warmup': {
+                'enabled': WARMUP_ENABLED,
+                'steps_ms': dict(self.steps),
+                'errors': dict(self.errors),
+                'duration_seconds': round(self.ready_at - self.started_at, 2) if self.ready_at else None
+            },
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        return payload, 200 if self.is_ready else 503
@@ -0,0 +1,107 @@
+"""
+Selectable rembg model variants, including INT8-quantized ONNX models.
+
+rembg ships full-precision models only. For the u2net family (u2net, u2netp,
+silueta), which share one pre/post-processing, an INT8 variant is produced
+by dynamic quantization of the downloaded ONNX file with
+onnxruntime.quantization and loaded through rembg's u2net_custom session.
+The quantized file is written next to the original in U2NET_HOME once and
+reused afterwards.
+
+Configuration (environment):
+    REMBG_MODEL           - default variant (default u2net)
+    REMBG_ALLOWED_MODELS  - comma-separated variants a request may select
+                            (default: all variants); every selected variant
+                            keeps its own ONNX session in memory
+"""
+
+import os
+import logging
+import threading
+
+from rembg.sessions import sessions_class
+
+from thread_policy import policy as thread_policy
+
+logger = logging.getLogger(__name__)
+
+# variant -> (rembg model the weights come from, quantize to INT8)
+MODEL_VARIANTS = {
+    'u2net': ('u2net', False),
+    'u2netp': ('u2netp', False),
+    'silueta': ('silueta', False),
+    'u2net_human_seg': ('u2net_human_seg', False),
+    'isnet-general-use': ('isnet-general-use', False),
+    'u2net-int8': ('u2net', True),
+    'u2netp-int8': ('u2netp', True),
+    'silueta-int8': ('silueta', True),
+}
+
+REMBG_MODEL = os.environ.get('REMBG_MODEL', 'u2net')
+REMBG_ALLOWED_MODELS = [m.strip() for m in
+                        os.environ.get('REMBG_ALLOWED_MODELS', ','.join(MODEL_VARIANTS)).split(',')
+                        if m.strip()]
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def model_variant(requested=None):
+    """Validated variant name from a request parameter, falling back to REMBG_MODEL"""
+    variant = requested or REMBG_MODEL
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model '{variant}', expected one of {sorted(MODEL_VARIANTS)}")
+    if requested and variant != REMBG_MODEL and variant not in REMBG_ALLOWED_MODELS:
+        raise ValueError(f"Model '{variant}' is not enabled on this deployment")
+    return variant
+
+
+def quantized_model_path(base_model):
+    """
+    Path of the INT8 copy of a rembg model, quantizing it on first use.
+    Weights are quantized to uint8, activations stay float (dynamic quantization).
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    session_class = _session_class(base_model)
+    # Downloads the full-precision weights if they are not cached yet
+    source = session_class.download_models()
+    target = os.path.splitext(source)[0] + '-int8.onnx'
+    if not os.path.exists(target):
+        logger.info(f"Quantizing {source} to INT8")
+        partial = f"{target}.{os.getpid()}.tmp"
+        quantize_dynamic(source, partial, weight_type=QuantType.QUInt8)
+        # Other workers may quantize concurrently; the rename is atomic
+        os.replace(partial, target)
+    return target
+
+
+def _session_class(model_name):
+    return next(sc for sc in sessions_class if sc.name() == model_name)
+
+
+def create_session(variant):
+    base_model, quantized = MODEL_VARIANTS[variant]
+    # Built directly instead of through rembg.new_session, which cannot take
+    # SessionOptions and leaves onnxruntime sized to the whole host
+    options = thread_policy.onnx_session_options()
+    if quantized:
+        return _session_class('u2net_custom')('u2net_custom', options,
+                                              model_path=quantized_model_path(base_model))
+    return _session_class(base_model)(base_model, options)
+
+
+def get_session(variant=None):
+    """ONNX session of a variant, created once per worker"""
+    variant = model_variant(variant)
+    with _sessions_lock:
+        session = _sessions.get(variant)
+        if session is None:
+            session = create_session(variant)
+            _sessions[variant] = session
+        return session
+
+
+def loaded_models():
+    with _sessions_lock:
+        return sorted(_sessions)
@@ -0,0 +1,318 @@
+"""
+Single-flight coalescing of identical processing requests.
+
+Frontend retries and dashboard double-clicks send the same image with the
+same parameters several times at once. Requests are keyed by a hash of the
+input bytes and parameters; the first one computes, concurrent duplicates
+in the same worker wait for it and share its result.
+
+Across gunicorn workers the same happens through a lock file per key in
+COALESCE_DIR: the worker holding the lock computes, workers that find the
+lock taken leave a waiter marker next to it and wait. Only when a marker
+is there does the leader publish the JSON result for them to read, so the
+common case without duplicates never writes a result to disk. Published
+results are deleted after COALESCE_RESULT_TTL seconds, and a leader that
+published nothing removes the key's lock file before releasing it. Every
+COALESCE_SWEEP_INTERVAL seconds a sweep removes what failed workers left
+behind: expired results and markers, and lock files nobody holds. Results that are
+not JSON objects (G-code/DXF toolpaths) are only shared within the worker.
+
+Configuration (environment):
+    COALESCE_ENABLED      - "false" disables coalescing entirely
+    COALESCE_DIR          - shared directory for lock/result files
+    COALESCE_RESULT_TTL   - seconds a published result stays reusable (default 10)
+    COALESCE_WAIT_TIMEOUT - max seconds to wait on another worker (default 120)
+    COALESCE_SWEEP_INTERVAL - seconds between sweeps of COALESCE_DIR (default 60)
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COALESCE_ENABLED = os.environ.get('COALESCE_ENABLED', 'true').lower() == 'true'
+COALESCE_DIR = os.environ.get('COALESCE_DIR', os.path.join(tempfile.gettempdir(), 'pupring-coalesce'))
+COALESCE_RESULT_TTL = float(os.environ.get('COALESCE_RESULT_TTL', 10))
+COALESCE_WAIT_TIMEOUT = float(os.environ.get('COALESCE_WAIT_TIMEOUT', 120))
+COALESCE_SWEEP_INTERVAL = float(os.environ.get('COALESCE_SWEEP_INTERVAL', 60))
+
+
+class _Call:
+    """One in-flight computation that local duplicates can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, shared_dir=COALESCE_DIR, result_ttl=COALESCE_RESULT_TTL,
+                 wait_timeout=COALESCE_WAIT_TIMEOUT, enabled=COALESCE_ENABLED,
+                 sweep_interval=COALESCE_SWEEP_INTERVAL):
+        self.enabled = enabled
+        self.shared_dir = shared_dir if fcntl is not None else None
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {
+            'leaders': 0,
+            'coalesced_local': 0,
+            'coalesced_remote': 0,
+            'published': 0,
+            'errors': 0
+        }
+
+        if self.enabled and self.shared_dir:
+            try:
+                os.makedirs(self.shared_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"Cross-worker coalescing disabled, cannot create {self.shared_dir}: {e}")
+                self.shared_dir = None
+
+    @staticmethod
+    def make_key(operation, payload, **params):
+        """Hash the operation, input bytes and parameters into a cache key"""
+        digest = hashlib.sha256()
+        digest.update(operation.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(payload)
+        digest.update(b'\0')
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key, fn):
+        """
+        Return fn()'s result, computing it at most once for concurrent
+        callers with the same key. Errors are propagated to every local
+        waiter but are never published to other workers.
+        """
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._counters['coalesced_local'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._counters['leaders'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+        except Exception as e:
+            call.error = e
+            self._count('errors')
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result
+
+    def _paths(self, key):
+        base = os.path.join(self.shared_dir, key)
+        return base + '.lock', base + '.json', base + '.wait'
+
+    def _read_published(self, result_path):
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.result_ttl:
+                return None
+            with open(result_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _publish(self, result_path, result):
+        try:
+            tmp_path = f"{result_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(result, f)
+            os.replace(tmp_path, result_path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not publish coalesced result: {e}")
+            return
+        self._count('published')
+        # Waiters read it right after the lock is released; nobody needs it later
+        timer = threading.Timer(self.result_ttl, self._unlink, (result_path,))
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _acquire(self, lock_file, wait_path):
+        """
+        Take the key's file lock; returns True if another worker held it
+        first, after leaving a marker asking it to publish its result
+        """
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return False
+        except BlockingIOError:
+            pass
+
+        try:
+            with open(wait_path, 'a'):
+                pass
+        except OSError:
+            pass
+
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("Timed out waiting for a duplicate request in another worker")
+                time.sleep(0.05)
+
+    def _do_shared(self, key, fn):
+        """Cross-worker single flight through a lock file and a published result"""
+        if not self.shared_dir:
+            return fn()
+
+        lock_path, result_path, wait_path = self._paths(key)
+        while True:
+            with open(lock_path, 'a') as lock_file:
+                self._acquire(lock_file, wait_path)
+                keep_lock = False
+                try:
+                    if not self._is_current(lock_file, lock_path):
+                        # The previous holder removed the file while we waited
+                        # on it; lock the key's current file instead
+                        keep_lock = True
+                        continue
+                    published = self._read_published(result_path)
+                    if published is not None:
+                        self._count('coalesced_remote')
+                        keep_lock = True
+                        return published
+
+                    result = fn()
+                    # Publish only for workers waiting on this key (a worker that
+                    # registers after this check recomputes); streamed exports are
+                    # not JSON and stay within this worker
+                    if os.path.exists(wait_path):
+                        self._unlink(wait_path)
+                        if isinstance(result, dict):
+                            self._publish(result_path, result)
+                            keep_lock = True
+                    return result
+                finally:
+                    # Nothing published (or read): the lock file is not needed
+                    # after this request, remove it while still holding it
+                    if not keep_lock:
+                        self._unlink(lock_path)
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    self._maybe_sweep()
+
+    @staticmethod
+    def _is_current(lock_file, lock_path):
+        """Whether the locked file is still the one at lock_path"""
+        try:
+            return os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+        except OSError:
+            return False
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self._cleanup_expired()
+
+    def _cleanup_expired(self):
+        """
+        Drop published results and markers older than the TTL, and lock
+        files older than the TTL that nobody holds, so the directory stays small
+        """
+        now = time.time()
+        try:
+            entries = os.listdir(self.shared_dir)
+        except OSError:
+            return
+        for name in entries:
+            if name.endswith('.wait'):
+                # Markers of waiters whose leader failed
+                self._unlink_expired(os.path.join(self.shared_dir, name), now)
+                continue
+            if name.endswith('.lock'):
+                # Left by workers that died or by keys whose result was published
+                self._unlink_unheld(os.path.join(self.shared_dir, name), now)
+                continue
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.shared_dir, name)
+            try:
+                if now - os.path.getmtime(path) <= self.result_ttl:
+                    continue
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _unlink_unheld(self, lock_path, now):
+        """
+        Remove an expired lock file if it can be locked right away. A worker
+        that opened it meanwhile notices it is gone and locks the new file.
+        """
+        try:
+            if now - os.path.getmtime(lock_path) <= self.result_ttl:
+                return
+            with open(lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if self._is_current(lock_file, lock_path):
+                    os.unlink(lock_path)
+        except OSError:
+            pass
+
+    def _unlink_expired(self, path, now):
+        try:
+            if now - os.path.getmtime(path) > self.result_ttl:
+                os.unlink(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._calls)
+        stats['enabled'] = self.enabled
+        stats['cross_worker'] = bool(self.shared_dir)
+        return stats
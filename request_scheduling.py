@@ -0,0 +1,257 @@
+"""
+Priority scheduling of requests waiting for admission budget.
+
+Live dashboard previews and bulk re-render batches share the same workers.
+Each request belongs to a priority class, taken from the `priority` query
+parameter or the X-Priority header (default SCHEDULER_DEFAULT_PRIORITY):
+
+    - interactive: dashboard previews, waits at most ADMISSION_QUEUE_TIMEOUT
+    - batch:       bulk jobs, may wait up to SCHEDULER_BATCH_TIMEOUT
+
+Requests that do not fit the admission budget right away queue in a
+FairQueue and are let in by weighted fair queuing: every request gets a
+virtual finish tag of its CPU cost divided by its class weight, and the
+lowest tag among the waiters goes next. With the default weights a
+waiting interactive request overtakes a batch backlog, but batch work
+still gets its share instead of starving.
+
+A client may run at most SCHEDULER_CLIENT_CONCURRENCY requests per worker;
+its further requests wait in the queue. The client is the X-Client-Id
+header. Without it, requests are only capped per client when
+SCHEDULER_PROXY_HOPS says how many trusted proxies append to
+X-Forwarded-For (werkzeug's ProxyFix then recovers the caller's address).
+Behind a proxy the remote address is the proxy's, and using it would put
+every user under one cap. When SCHEDULER_MAX_QUEUED requests are already
+waiting, a new request preempts the most recently queued request of a
+lower class (shed with 429 + Retry-After) or is refused itself.
+
+Queue wait per class (mean, p95, max), preemptions and the running
+requests per client are reported with the admission stats on /health.
+
+Configuration (environment):
+    SCHEDULER_DEFAULT_PRIORITY   - class of requests without one (default interactive)
+    SCHEDULER_WEIGHTS            - class weights (default interactive=8,batch=1)
+    SCHEDULER_CLIENT_CONCURRENCY - running requests per client and worker, 0 for no cap (default 2)
+    SCHEDULER_PROXY_HOPS         - trusted proxies setting X-Forwarded-For; 0 caps only requests
+                                   with X-Client-Id (default 0)
+    SCHEDULER_MAX_QUEUED         - waiting requests per worker before preempting (default 16)
+    SCHEDULER_BATCH_TIMEOUT      - seconds a batch request may wait for budget (default 60)
+"""
+
+import os
+import math
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+PRIORITY_CLASSES = ('interactive', 'batch')  # highest priority first
+
+SCHEDULER_DEFAULT_PRIORITY = os.environ.get('SCHEDULER_DEFAULT_PRIORITY', 'interactive').lower()
+SCHEDULER_WEIGHTS = os.environ.get('SCHEDULER_WEIGHTS', 'interactive=8,batch=1')
+SCHEDULER_CLIENT_CONCURRENCY = int(os.environ.get('SCHEDULER_CLIENT_CONCURRENCY', 2))
+SCHEDULER_PROXY_HOPS = int(os.environ.get('SCHEDULER_PROXY_HOPS', 0))
+SCHEDULER_MAX_QUEUED = int(os.environ.get('SCHEDULER_MAX_QUEUED', 16))
+SCHEDULER_BATCH_TIMEOUT = float(os.environ.get('SCHEDULER_BATCH_TIMEOUT', 60))
+
+# Queue waits kept per class for the percentiles
+RECENT_WAITS = 256
+
+
+def parse_weights(spec):
+    """{'interactive': 8.0, 'batch': 1.0} from 'interactive=8,batch=1'"""
+    weights = {name: 1.0 for name in PRIORITY_CLASSES}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        name, value = (part.strip() for part in item.split('=', 1))
+        if name in weights and float(value) > 0:
+            weights[name] = float(value)
+    return weights
+
+
+def request_priority(value=None):
+    """Validated priority class (None: the default class)"""
+    if value in (None, ''):
+        return SCHEDULER_DEFAULT_PRIORITY
+    value = value.lower()
+    if value not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority '{value}', expected one of {list(PRIORITY_CLASSES)}")
+    return value
+
+
+_local = threading.local()
+
+
+def current_request():
+    """(priority class, client) of the request the thread is serving"""
+    return getattr(_local, 'priority', SCHEDULER_DEFAULT_PRIORITY), getattr(_local, 'client', None)
+
+
+@contextmanager
+def scheduling_scope(priority=None, client=None):
+    """Schedule the block's admissions under this class and client"""
+    previous = current_request()
+    _local.priority, _local.client = request_priority(priority), client
+    try:
+        yield
+    finally:
+        _local.priority, _local.client = previous
+
+
+def client_identity(req):
+    """
+    X-Client-Id, else the caller's address as recovered from trusted
+    proxies; None (not capped) when neither is known
+    """
+    client = req.headers.get('X-Client-Id')
+    if client:
+        return client
+    return req.remote_addr if SCHEDULER_PROXY_HOPS > 0 else None
+
+
+def scheduling_headers():
+    """Headers carrying the current class and client to a backend"""
+    priority, client = current_request()
+    headers = {'X-Priority': priority}
+    if client is not None:
+        headers['X-Client-Id'] = client
+    return headers
+
+
+def init_app(app):
+    """Take each request's class and client from the query string and headers"""
+    from flask import request, jsonify
+
+    if SCHEDULER_PROXY_HOPS > 0:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=SCHEDULER_PROXY_HOPS)
+
+    @app.before_request
+    def _schedule():
+        try:
+            _local.priority = request_priority(request.args.get('priority') or request.headers.get('X-Priority'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        _local.client = client_identity(request)
+
+    @app.teardown_request
+    def _unschedule(error=None):
+        _local.priority, _local.client = SCHEDULER_DEFAULT_PRIORITY, None
+
+
+class Ticket:
+    """One request waiting for admission"""
+    __slots__ = ('priority', 'client', 'start', 'finish', 'enqueued', 'preempted')
+
+    def __init__(self, priority, client, start, finish, enqueued):
+        self.priority = priority
+        self.client = client
+        self.start = start
+        self.finish = finish
+        self.enqueued = enqueued
+        self.preempted = False
+
+
+class FairQueue:
+    """
+    Waiting requests in weighted fair order plus per-client running counts.
+    Not locked itself: the AdmissionController calls it under its condition.
+    """
+
+    def __init__(self, weights=None, client_cap=SCHEDULER_CLIENT_CONCURRENCY, max_queued=SCHEDULER_MAX_QUEUED,
+                 batch_timeout=SCHEDULER_BATCH_TIMEOUT):
+        self.weights = weights or parse_weights(SCHEDULER_WEIGHTS)
+        self.client_cap = client_cap
+        self.max_queued = max_queued
+        self.batch_timeout = batch_timeout
+
+        self._waiters = []
+        self._virtual_time = 0.0
+        self._last_finish = {name: 0.0 for name in PRIORITY_CLASSES}
+        self._running = {}
+        self._waits = {name: deque(maxlen=RECENT_WAITS) for name in PRIORITY_CLASSES}
+        self.counts = {name: {'admitted': 0, 'rejected': 0, 'preempted': 0} for name in PRIORITY_CLASSES}
+
+    def timeout(self, priority, interactive_timeout):
+        """Longest wait for budget in this class"""
+        return self.batch_timeout if priority == 'batch' else interactive_timeout
+
+    def push(self, priority, client, cpu_units, now):
+        """
+        Queue a request; returns (ticket, preempted ticket or None), or
+        (None, None) when the queue is full of equal or higher priority work
+        """
+        victim = None
+        if self.max_queued and len(self._waiters) >= self.max_queued:
+            rank = PRIORITY_CLASSES.index(priority)
+            lower = [t for t in self._waiters if PRIORITY_CLASSES.index(t.priority) > rank]
+            if not lower:
+                self.counts[priority]['rejected'] += 1
+                return None, None
+            # Lowest class first, most recently queued within it
+            victim = max(lower, key=lambda t: (PRIORITY_CLASSES.index(t.priority), t.enqueued))
+            victim.preempted = True
+            self._waiters.remove(victim)
+            self.counts[victim.priority]['preempted'] += 1
+
+        start = max(self._virtual_time, self._last_finish[priority])
+        finish = start + max(cpu_units, 1e-3) / self.weights[priority]
+        self._last_finish[priority] = finish
+        ticket = Ticket(priority, client, start, finish, now)
+        self._waiters.append(ticket)
+        return ticket, victim
+
+    def waiting(self, priority=None):
+        return sum(1 for t in self._waiters if priority is None or t.priority == priority)
+
+    def _under_cap(self, client):
+        return not self.client_cap or client is None or self._running.get(client, 0) < self.client_cap
+
+    def next_eligible(self):
+        """The waiter to admit next: lowest finish tag whose client is under its cap"""
+        eligible = [t for t in self._waiters if self._under_cap(t.client)]
+        return min(eligible, key=lambda t: t.finish) if eligible else None
+
+    def remove(self, ticket, rejected=False):
+        if ticket in self._waiters:
+            self._waiters.remove(ticket)
+        if rejected:
+            self.counts[ticket.priority]['rejected'] += 1
+
+    def started(self, ticket, now):
+        self.remove(ticket)
+        self._virtual_time = max(self._virtual_time, ticket.start)
+        if ticket.client is not None:
+            self._running[ticket.client] = self._running.get(ticket.client, 0) + 1
+        self._waits[ticket.priority].append(now - ticket.enqueued)
+        self.counts[ticket.priority]['admitted'] += 1
+
+    def finished(self, ticket):
+        if ticket.client is None:
+            return
+        running = self._running.get(ticket.client, 0) - 1
+        if running > 0:
+            self._running[ticket.client] = running
+        else:
+            self._running.pop(ticket.client, None)
+
+    def stats(self):
+        classes = {}
+        for name in PRIORITY_CLASSES:
+            waits = sorted(self._waits[name])
+            classes[name] = dict(
+                self.counts[name],
+                weight=self.weights[name],
+                waiting=self.waiting(name),
+                queue_wait_mean_seconds=round(sum(waits) / len(waits), 3) if waits else None,
+                queue_wait_p95_seconds=round(waits[min(len(waits) - 1, math.ceil(0.95 * len(waits)) - 1)], 3)
+                if waits else None,
+                queue_wait_max_seconds=round(waits[-1], 3) if waits else None
+            )
+        return {
+            'classes': classes,
+            'client_cap': self.client_cap,
+            'max_queued': self.max_queued,
+            'clients_running': len(self._running),
+            'busiest_client_running': max(self._running.values(), default=0)
+        }
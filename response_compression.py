@@ -0,0 +1,225 @@
+"""
+Negotiated, streamed response compression.
+
+/vectorize answers with an SVG document plus several base64 PNGs in one
+JSON body of often several MB; SVG, JSON and G-code shrink several times
+under compression, the base64 PNGs by about a quarter. Every Flask app
+registers `init_app()`, which compresses eligible responses after the view:
+
+    - the encoding is negotiated from Accept-Encoding: zstd, br or gzip,
+      highest q-value first and COMPRESSION_ENCODINGS order on ties; zstd
+      and br are offered only when the zstandard / brotli packages are
+      installed
+    - the level is chosen by payload size: small bodies get a high level,
+      multi-MB bodies a fast one so compression stays a small part of the
+      request; streamed bodies of unknown size get the middle tier
+    - the body is fed through the compressor in COMPRESSION_CHUNK_SIZE
+      pieces and sent chunked as it is produced, so the compressed body is
+      never held as a whole (streamed G-code/DXF exports are compressed on
+      the fly the same way)
+
+Responses that are small, already encoded, not text-like, byte-range
+capable (stored results) or marked Cache-Control: no-transform are sent
+as they are. Per encoding the module counts responses, bytes in and out
+and the seconds spent compressing, reported on /health.
+
+Configuration (environment):
+    RESPONSE_COMPRESSION     - 0 disables compression (default 1)
+    COMPRESSION_ENCODINGS    - offered encodings in preference order (default zstd,br,gzip)
+    COMPRESSION_MIN_BYTES    - smaller bodies are sent uncompressed (default 1024)
+    COMPRESSION_CHUNK_SIZE   - bytes fed to the compressor per step (default 65536)
+"""
+
+import os
+import time
+import zlib
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', '1').lower() not in ('0', 'false', 'no')
+COMPRESSION_ENCODINGS = [e.strip().lower() for e in os.environ.get('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',')
+                         if e.strip()]
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+COMPRESSION_CHUNK_SIZE = int(os.environ.get('COMPRESSION_CHUNK_SIZE', 64 * 1024))
+
+# (largest body in bytes, level per encoding): bigger bodies get cheaper levels
+LEVEL_TIERS = [
+    (256 * 1024,       {'gzip': 6, 'br': 5, 'zstd': 6}),
+    (4 * 1024 * 1024,  {'gzip': 4, 'br': 4, 'zstd': 3}),
+    (None,             {'gzip': 1, 'br': 2, 'zstd': 1}),
+]
+# Level tier for streamed bodies whose size is not known up front
+STREAMED_TIER = 1
+
+COMPRESSIBLE_TYPES = ('application/json', 'image/svg+xml', 'application/xml', 'application/javascript',
+                      'application/dxf')
+
+
+def _gzip(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _brotli(level):
+    compressor = brotli.Compressor(quality=level)
+    return compressor.process, compressor.finish
+
+
+def _zstd(level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, compressor.flush
+
+
+# Encoding -> factory returning (compress(chunk), finish()) for a level
+ENCODERS = {'gzip': _gzip}
+if brotli is not None:
+    ENCODERS['br'] = _brotli
+if zstandard is not None:
+    ENCODERS['zstd'] = _zstd
+
+_lock = threading.Lock()
+_stats = {}
+_skipped = {'not_accepted': 0, 'too_small': 0, 'not_compressible': 0}
+
+
+def available_encodings():
+    return [encoding for encoding in COMPRESSION_ENCODINGS if encoding in ENCODERS]
+
+
+def negotiate(accept_encodings):
+    """
+    Encoding to use for a werkzeug Accept-Encoding header (None for
+    identity): the highest q-value among the available encodings, server
+    preference order on ties
+    """
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compression_level(encoding, size=None):
+    """Level for a body of this many bytes (None: streamed, size unknown)"""
+    if size is None:
+        return LEVEL_TIERS[STREAMED_TIER][1][encoding]
+    for limit, levels in LEVEL_TIERS:
+        if limit is None or size <= limit:
+            return levels[encoding]
+
+
+def compress_chunks(chunks, encoding, level):
+    """Compress an iterable of byte/str chunks as it is consumed, recording the ratio and time"""
+    compress, finish = ENCODERS[encoding](level)
+    bytes_in = bytes_out = 0
+    seconds = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            bytes_in += len(chunk)
+            start = time.perf_counter()
+            compressed = compress(chunk)
+            seconds += time.perf_counter() - start
+            if compressed:
+                bytes_out += len(compressed)
+                yield compressed
+        start = time.perf_counter()
+        compressed = finish()
+        seconds += time.perf_counter() - start
+        bytes_out += len(compressed)
+        yield compressed
+    finally:
+        _record(encoding, bytes_in, bytes_out, seconds)
+
+
+def _record(encoding, bytes_in, bytes_out, seconds):
+    with _lock:
+        stats = _stats.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0})
+        stats['responses'] += 1
+        stats['bytes_in'] += bytes_in
+        stats['bytes_out'] += bytes_out
+        stats['seconds'] += seconds
+
+
+def _skip(reason):
+    with _lock:
+        _skipped[reason] += 1
+
+
+def _slices(data, size=COMPRESSION_CHUNK_SIZE):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def compressible(response):
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def compress_response(response, accept_encodings):
+    """Compress a Flask response in place when it is eligible; returns it"""
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers or response.direct_passthrough
+            or 'Accept-Ranges' in response.headers or response.cache_control.no_transform):
+        return response
+    if not compressible(response):
+        _skip('not_compressible')
+        return response
+    response.vary.add('Accept-Encoding')
+
+    size = None if response.is_streamed else response.content_length
+    if size is not None and size < COMPRESSION_MIN_BYTES:
+        _skip('too_small')
+        return response
+    encoding = negotiate(accept_encodings)
+    if encoding is None:
+        _skip('not_accepted')
+        return response
+
+    source = response.iter_encoded() if response.is_streamed else _slices(response.get_data())
+    response.response = compress_chunks(source, encoding, compression_level(encoding, size))
+    response.headers['Content-Encoding'] = encoding
+    response.headers.pop('Content-Length', None)
+    etag, weak = response.get_etag()
+    if etag:
+        # A different representation needs its own validator
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+
+def init_app(app):
+    """Compress the app's eligible responses for the client's Accept-Encoding"""
+    if not RESPONSE_COMPRESSION:
+        return
+
+    from flask import request
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, request.accept_encodings)
+
+
+def compression_stats():
+    """Per encoding: responses, bytes in/out, ratio and compression time"""
+    with _lock:
+        encodings = {}
+        for encoding, stats in _stats.items():
+            encodings[encoding] = dict(
+                stats,
+                seconds=round(stats['seconds'], 3),
+                ratio=round(stats['bytes_in'] / stats['bytes_out'], 2) if stats['bytes_out'] else None,
+                ms_per_mb=round(stats['seconds'] * 1000 / (stats['bytes_in'] / 1e6), 1) if stats['bytes_in'] else None
+            )
+        return {'enabled': RESPONSE_COMPRESSION, 'available': available_encodings(),
+                'encodings': encodings, 'skipped': dict(_skipped)}
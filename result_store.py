@@ -0,0 +1,323 @@
+"""
+Content-addressed storage for rendered results.
+
+Instead of inlining every PNG as a base64 data URL in the JSON response,
+results can be written to a store under the SHA-256 of their bytes and
+returned as stable URLs (/results/<sha256>.<ext>). Identical renders map to
+the same URL, so browsers and CDNs cache them once: the handler serves
+them with a strong ETag (the hash), If-None-Match (304), an immutable
+Cache-Control and byte ranges. Stored SVGs can also be downloaded as SVGZ
+(?format=svgz), gzip-compressed while they stream.
+
+Stores implement a small S3-shaped interface (put_object / head_object /
+get_object) so the local directory backend and an S3-compatible bucket
+(AWS, MinIO, R2 via RESULT_S3_ENDPOINT) are interchangeable.
+
+The local directory is swept after writes (at most every
+RESULT_SWEEP_INTERVAL seconds, in the background): files older than
+RESULT_LOCAL_RETENTION are deleted, then the oldest ones until the store
+is under RESULT_LOCAL_MAX_BYTES. Storing a result again refreshes its age.
+The S3 backend does not expire anything itself; configure a lifecycle
+rule on the bucket (or RESULT_S3_PREFIX) to delete old results.
+
+Configuration (environment):
+    RESULT_DELIVERY       - 'inline' (data URLs, default) or 'url'; requests may
+                            override it with delivery=url|inline
+    RESULT_STORE          - 'local' (default) or 's3'
+    RESULT_DIR            - local store directory (default <tmp>/pupring-results);
+                            must be shared if the gateway serves results for
+                            remote backends
+    RESULT_BASE_URL       - prefix for returned URLs (default /results/)
+    RESULT_MAX_AGE        - Cache-Control max-age in seconds (default 31536000)
+    RESULT_LOCAL_MAX_BYTES  - size cap of the local store (default 1073741824, 1 GB)
+    RESULT_LOCAL_RETENTION  - seconds a local result is kept (default 604800, 7 days)
+    RESULT_SWEEP_INTERVAL   - minimum seconds between local sweeps (default 300)
+    RESULT_S3_BUCKET      - bucket for RESULT_STORE=s3
+    RESULT_S3_PREFIX      - key prefix inside the bucket (default results/)
+    RESULT_S3_ENDPOINT    - endpoint URL of an S3-compatible service
+"""
+
+import io
+import os
+import re
+import base64
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+
+from image_request import ImageRequestError
+from response_compression import compress_chunks, compression_level, COMPRESSION_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+RESULT_DELIVERY = os.environ.get('RESULT_DELIVERY', 'inline').lower()
+RESULT_STORE = os.environ.get('RESULT_STORE', 'local').lower()
+RESULT_DIR = os.environ.get('RESULT_DIR', os.path.join(tempfile.gettempdir(), 'pupring-results'))
+RESULT_BASE_URL = os.environ.get('RESULT_BASE_URL', '/results/')
+RESULT_MAX_AGE = int(os.environ.get('RESULT_MAX_AGE', 31536000))
+RESULT_LOCAL_MAX_BYTES = int(os.environ.get('RESULT_LOCAL_MAX_BYTES', 1024 ** 3))
+RESULT_LOCAL_RETENTION = float(os.environ.get('RESULT_LOCAL_RETENTION', 7 * 24 * 3600))
+RESULT_SWEEP_INTERVAL = float(os.environ.get('RESULT_SWEEP_INTERVAL', 300))
+RESULT_S3_BUCKET = os.environ.get('RESULT_S3_BUCKET', '')
+RESULT_S3_PREFIX = os.environ.get('RESULT_S3_PREFIX', 'results/')
+RESULT_S3_ENDPOINT = os.environ.get('RESULT_S3_ENDPOINT') or None
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'svg': 'image/svg+xml',
+}
+EXTENSIONS = {content_type: ext for ext, content_type in CONTENT_TYPES.items()}
+
+# <sha256>.<ext>; anything else is rejected before touching the store
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}\.(png|jpg|svg)$')
+
+DATA_URL_PATTERN = re.compile(r'^data:(image/[a-z+]+);base64,')
+
+# Response keys whose string values are SVG documents
+SVG_KEYS = ('svg',)
+
+
+class ObjectMeta:
+    def __init__(self, key, size, content_type):
+        self.key = key
+        self.size = size
+        self.content_type = content_type
+
+    @property
+    def etag(self):
+        # Content-addressed: the hash in the key is a strong validator
+        return self.key.split('.')[0]
+
+
+class LocalStore:
+    """
+    Directory backend: <RESULT_DIR>/<first two hash chars>/<key>, swept by
+    age and total size after writes
+    """
+
+    def __init__(self, root=RESULT_DIR, max_bytes=RESULT_LOCAL_MAX_BYTES, retention=RESULT_LOCAL_RETENTION,
+                 sweep_interval=RESULT_SWEEP_INTERVAL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.retention = retention
+        self.sweep_interval = sweep_interval
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.evicted = 0
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def put_object(self, key, data, content_type):
+        path = self.path(key)
+        if os.path.exists(path):
+            try:
+                # Recently produced again: keep it through the next sweeps
+                os.utime(path)
+            except OSError:
+                pass
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._sweep_lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        threading.Thread(target=self.sweep, daemon=True).start()
+
+    def sweep(self):
+        """Delete results past the retention, then the oldest until under max_bytes"""
+        now = time.time()
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # Includes partial writes left behind by crashed workers
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if now - mtime <= self.retention and total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            self.evicted += removed
+            logger.info(f"Result store sweep removed {removed} files, {total} bytes remain")
+        return removed
+
+    def head_object(self, key):
+        try:
+            size = os.path.getsize(self.path(key))
+        except OSError:
+            return None
+        return ObjectMeta(key, size, CONTENT_TYPES[key.rsplit('.', 1)[1]])
+
+    def get_object(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+
+class S3Store:
+    """S3-compatible bucket backend (boto3 is only needed when this is selected)"""
+
+    def __init__(self, bucket=RESULT_S3_BUCKET, prefix=RESULT_S3_PREFIX, endpoint_url=RESULT_S3_ENDPOINT):
+        import boto3
+
+        if not bucket:
+            raise ValueError("RESULT_STORE=s3 requires RESULT_S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+
+    def put_object(self, key, data, content_type):
+        if self.head_object(key) is not None:
+            return
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data,
+                               ContentType=content_type,
+                               CacheControl=f'public, max-age={RESULT_MAX_AGE}, immutable')
+
+    def head_object(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError:
+            return None
+        return ObjectMeta(key, head['ContentLength'], head['ContentType'])
+
+    def get_object(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body'].read()
+
+
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = S3Store() if RESULT_STORE == 's3' else LocalStore()
+    return _store
+
+
+def put_result(data, content_type):
+    """Store bytes under their content hash and return the public URL"""
+    key = f"{hashlib.sha256(data).hexdigest()}.{EXTENSIONS[content_type]}"
+    get_store().put_object(key, data, content_type)
+    return RESULT_BASE_URL + key
+
+
+def delivery_mode(requested=None):
+    mode = (requested or RESULT_DELIVERY).lower()
+    if mode not in ('inline', 'url'):
+        raise ImageRequestError(f"Unknown delivery '{mode}', expected 'inline' or 'url'")
+    return mode
+
+
+def _externalize_value(key, value):
+    if isinstance(value, dict):
+        return {k: _externalize_value(k, v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_externalize_value(key, v) for v in value]
+    if not isinstance(value, str):
+        return value
+
+    match = DATA_URL_PATTERN.match(value)
+    if match and match.group(1) in EXTENSIONS:
+        return put_result(base64.b64decode(value[match.end():]), match.group(1))
+    if key in SVG_KEYS and value.lstrip().startswith('<'):
+        return put_result(value.encode('utf-8'), 'image/svg+xml')
+    return value
+
+
+def deliver(result, requested=None):
+    """
+    Apply the delivery mode to a service result: with 'url' every image
+    data URL and SVG document is stored and replaced by its URL
+    """
+    if delivery_mode(requested) == 'inline':
+        return result
+    delivered = _externalize_value(None, result)
+    delivered['delivery'] = 'url'
+    return delivered
+
+
+def serve_result(key):
+    """
+    Flask response for GET /results/<key> with ETag, If-None-Match,
+    Cache-Control and Range support
+    """
+    from flask import Response, request, send_file
+
+    if not KEY_PATTERN.match(key):
+        return Response('Not found', status=404)
+    store = get_store()
+    meta = store.head_object(key)
+    if meta is None:
+        return Response('Not found', status=404)
+    if request.args.get('format') == 'svgz' and meta.content_type == 'image/svg+xml':
+        return svgz_response(store, key, meta)
+
+    if isinstance(store, LocalStore):
+        # send_file handles If-None-Match, If-Modified-Since and Range itself
+        response = send_file(store.path(key), mimetype=meta.content_type, conditional=True,
+                             etag=meta.etag, max_age=RESULT_MAX_AGE)
+    else:
+        response = Response(io.BytesIO(store.get_object(key)), mimetype=meta.content_type,
+                            direct_passthrough=True)
+        response.set_etag(meta.etag)
+        response.make_conditional(request, accept_ranges=True, complete_length=meta.size)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = RESULT_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+def _object_chunks(store, key):
+    if isinstance(store, LocalStore):
+        with open(store.path(key), 'rb') as f:
+            yield from iter(lambda: f.read(COMPRESSION_CHUNK_SIZE), b'')
+    else:
+        data = store.get_object(key)
+        for start in range(0, len(data), COMPRESSION_CHUNK_SIZE):
+            yield data[start:start + COMPRESSION_CHUNK_SIZE]
+
+
+def svgz_response(store, key, meta):
+    """
+    Stored SVG as an .svgz download, gzip-compressed as it streams. The
+    gzip output is deterministic, so it keeps a strong ETag of its own.
+    """
+    from flask import Response, request
+
+    chunks = compress_chunks(_object_chunks(store, key), 'gzip', compression_level('gzip', meta.size))
+    response = Response(chunks, mimetype=meta.content_type, headers={
+        'Content-Disposition': f'attachment; filename="{key.rsplit(".", 1)[0]}.svgz"'
+    })
+    response.set_etag(f"{meta.etag}-svgz")
+    response.cache_control.public = True
+    response.cache_control.max_age = RESULT_MAX_AGE
+    response.cache_control.immutable = True
+    # Already compressed: the response compression must leave it alone
+    response.cache_control.no_transform = True
+    return response.make_conditional(request)
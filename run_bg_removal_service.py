@@ -44,7 +44,7 @@ def start_service():
 def check_health():
     """Check if service is healthy"""
     try:
-        response = requests.get('http://localhost:5001/health', timeout=2)
+        response = requests.get('http://localhost:5001/health/live', timeout=2)
         return response.status_code == 200
     except:
         return False
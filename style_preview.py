@@ -0,0 +1,74 @@
+"""
+Contact-sheet previews of the engraving styles.
+
+The dashboard's style picker only shows thumbnails, so /style-preview
+downscales the upload once while decoding (JPEGs at reduced DCT scale),
+renders every style at thumbnail size and tiles the results into one
+sprite: one PNG encode and one small transfer instead of a full-resolution
+render and encode per style. The JSON index gives each style's tile
+rectangle in the sprite; the full render is requested from /vectorize only
+for the style the customer picks.
+
+Thumbnails are rendered at their own size, so pixel-sized texture (halftone
+dots, hatch spacing, dither grain) is coarser relative to the subject than
+in the full render.
+
+Configuration (environment):
+    PREVIEW_TILE_SIZE  - longest side of a thumbnail in pixels (default 192)
+    PREVIEW_COLUMNS    - tiles per sprite row (default 3)
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+PREVIEW_TILE_SIZE = int(os.environ.get('PREVIEW_TILE_SIZE', 192))
+PREVIEW_COLUMNS = int(os.environ.get('PREVIEW_COLUMNS', 3))
+
+MIN_TILE_SIZE = 32
+MAX_TILE_SIZE = 512
+MAX_COLUMNS = 12
+# Label strip above each tile
+LABEL_HEIGHT = 16
+# White gutter between tiles
+GUTTER = 4
+
+
+def preview_layout(tile_size=None, columns=None, labels=None):
+    """Sprite layout parameters with environment defaults, validated"""
+    layout = {
+        'tile_size': PREVIEW_TILE_SIZE if tile_size is None else int(tile_size),
+        'columns': PREVIEW_COLUMNS if columns is None else int(columns),
+        'labels': True if labels is None else str(labels).lower() not in ('0', 'false', 'no'),
+    }
+    if not MIN_TILE_SIZE <= layout['tile_size'] <= MAX_TILE_SIZE:
+        raise ValueError(f"tile_size must be between {MIN_TILE_SIZE} and {MAX_TILE_SIZE}")
+    if not 1 <= layout['columns'] <= MAX_COLUMNS:
+        raise ValueError(f"columns must be between 1 and {MAX_COLUMNS}")
+    return layout
+
+
+def style_sprite(rendered, columns=PREVIEW_COLUMNS, labels=True):
+    """
+    Tile same-sized style thumbnails into one grayscale sprite, row by row in
+    the order given. Returns (sprite, index) where the index maps each style
+    to its tile rectangle.
+    """
+    names = list(rendered)
+    tile_h, tile_w = next(iter(rendered.values())).shape[:2]
+    label_h = LABEL_HEIGHT if labels else 0
+    columns = min(columns, len(names))
+    rows = -(-len(names) // columns)
+    cell_w, cell_h = tile_w + GUTTER, tile_h + label_h + GUTTER
+
+    sprite = np.full((rows * cell_h - GUTTER, columns * cell_w - GUTTER), 255, np.uint8)
+    index = []
+    for position, name in enumerate(names):
+        row, col = divmod(position, columns)
+        x, y = col * cell_w, row * cell_h + label_h
+        sprite[y:y + tile_h, x:x + tile_w] = rendered[name]
+        if labels:
+            cv2.putText(sprite, name, (x + 2, y - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.38, 0, 1, cv2.LINE_AA)
+        index.append({'style': name, 'x': x, 'y': y, 'width': tile_w, 'height': tile_h})
+    return sprite, index
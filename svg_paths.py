@@ -0,0 +1,157 @@
+"""
+SVG geometry as polylines, shared by bed nesting and the pendant shapes.
+
+Reads the tracer outputs and pendant outlines: straight segments in absolute
+or relative M/L/H/V/Z path commands, polylines, polygons and lines.
+Quadratic and cubic Bezier curves (including the smooth S/T forms) are
+flattened into CURVE_STEPS segments each, arcs are rejected, and other
+elements such as background rectangles are ignored. format_number writes
+coordinates back compactly (SVG here, G-code and DXF in engraver_export).
+"""
+
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# Straight segments per flattened Bezier curve
+CURVE_STEPS = 16
+
+PATH_TOKEN = re.compile(r'[A-Za-z]|[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?')
+NUMBER = re.compile(r'[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?')
+
+
+def format_number(value, decimals=3):
+    """Fixed-point text without trailing zeros ('12.5', '3', '-0.125')"""
+    return f"{value:.{decimals}f}".rstrip('0').rstrip('.')
+
+
+def _length(value):
+    """Leading number of an SVG length ('300', '300px', '30mm')"""
+    match = NUMBER.match((value or '').strip())
+    return float(match.group()) if match else None
+
+
+def _bezier(points, steps=CURVE_STEPS):
+    """Points along a quadratic or cubic Bezier (control points in order), start excluded"""
+    t = np.linspace(0, 1, steps + 1)[1:, None]
+    p = np.asarray(points, np.float64)
+    if len(p) == 3:
+        return (1 - t) ** 2 * p[0] + 2 * (1 - t) * t * p[1] + t ** 2 * p[2]
+    return (1 - t) ** 3 * p[0] + 3 * (1 - t) ** 2 * t * p[1] + 3 * (1 - t) * t ** 2 * p[2] + t ** 3 * p[3]
+
+
+# Coordinates taken by each path command
+PATH_ARGUMENTS = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2}
+
+
+def path_strokes(d):
+    """
+    Subpaths of a path 'd' attribute as (points, closed) tuples; Bezier
+    curves are flattened into CURVE_STEPS straight segments each
+    """
+    tokens = PATH_TOKEN.findall(d)
+    strokes, points = [], []
+    x = y = start_x = start_y = 0.0
+    # Reflected control point for S/T, and the command it came from
+    control, previous = None, None
+    command, i = None, 0
+
+    def flush(closed=False):
+        if points:
+            strokes.append((np.array(points, np.float64), closed))
+        points.clear()
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            command = tokens[i]
+            i += 1
+            if command in 'Zz':
+                flush(closed=True)
+                x, y = start_x, start_y
+                previous = 'Z'
+                continue
+        if command is None or command.upper() not in PATH_ARGUMENTS:
+            raise ValueError(f"Unsupported SVG path command '{command}' (straight segments and Bezier curves only)")
+
+        upper = command.upper()
+        count = PATH_ARGUMENTS[upper]
+        values = [float(v) for v in tokens[i:i + count]]
+        if len(values) < count:
+            raise ValueError(f"Truncated SVG path command '{command}'")
+        i += count
+        if command.islower():
+            # Relative coordinates: offset every x (or the lone H/V value) from the current point
+            if upper == 'H':
+                values[0] += x
+            elif upper == 'V':
+                values[0] += y
+            else:
+                values = [v + (x if k % 2 == 0 else y) for k, v in enumerate(values)]
+
+        if upper == 'H':
+            x = values[0]
+        elif upper == 'V':
+            y = values[0]
+        elif upper in 'ML':
+            x, y = values
+        else:
+            if upper in 'ST':
+                # Smooth curves reflect the last control point of a curve of the same kind
+                same_kind = previous in (('C', 'S') if upper == 'S' else ('Q', 'T'))
+                reflected = [2 * x - control[0], 2 * y - control[1]] if same_kind else [x, y]
+                values = reflected + values
+            controls = np.array(values, np.float64).reshape(-1, 2)
+            points.extend(_bezier(np.vstack([[x, y], controls])).tolist())
+            control = controls[-2]
+            x, y = controls[-1]
+
+        if upper == 'M':
+            flush()
+            start_x, start_y = x, y
+            # Further pairs after a moveto are implicit linetos
+            command = 'l' if command == 'm' else 'L'
+        if upper not in 'CSQT':
+            points.append((x, y))
+        previous = upper
+    flush()
+    return strokes
+
+
+def element_strokes(element):
+    """(points, closed) strokes of one SVG path, polyline, polygon or line; None for other elements"""
+    tag = element.tag.rsplit('}', 1)[-1]
+    if tag == 'path':
+        return path_strokes(element.get('d', ''))
+    if tag in ('polyline', 'polygon'):
+        values = [float(v) for v in NUMBER.findall(element.get('points', ''))]
+        if len(values) < 2:
+            return []
+        return [(np.array(values[:len(values) // 2 * 2], np.float64).reshape(-1, 2), tag == 'polygon')]
+    if tag == 'line':
+        points = [[float(element.get(k, 0)) for k in ('x1', 'y1')],
+                  [float(element.get(k, 0)) for k in ('x2', 'y2')]]
+        return [(np.array(points, np.float64), False)]
+    return None
+
+
+def svg_strokes(svg_string):
+    """(width, height, [(points, closed, stroke width)]) of an SVG document, in its user units"""
+    try:
+        root = ET.fromstring(svg_string)
+    except ET.ParseError as e:
+        raise ValueError(f"Invalid SVG: {e}")
+
+    view_box = root.get('viewBox')
+    if view_box:
+        _, _, width, height = [float(v) for v in NUMBER.findall(view_box)[:4]]
+    else:
+        width, height = _length(root.get('width')), _length(root.get('height'))
+    if not width or not height:
+        raise ValueError("SVG needs a viewBox or width and height")
+
+    strokes = []
+    for element in root.iter():
+        stroke_width = _length(element.get('stroke-width')) or 1.0
+        strokes += [(points, closed, stroke_width) for points, closed in element_strokes(element) or []]
+    return width, height, strokes
@@ -0,0 +1,46 @@
+"""
+Compute-pool processes stay single-threaded: the pool is the parallelism,
+so neither OpenCV nor the OpenMP/BLAS runtimes may size themselves to the
+serving worker's thread budget, even after a task re-imports the service
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compute_pool import ComputePool
+from thread_policy import THREAD_ENV_VARS
+
+
+def _pool_threads(src):
+    """Runs in a pool process, after the service module is imported as task unpickling would"""
+    import cv2
+    import vectorization_service  # noqa: F401  (module-level thread setup)
+    from thread_policy import policy
+
+    return cv2.getNumThreads(), {name: os.environ.get(name) for name in THREAD_ENV_VARS}, policy.threads_per_worker
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # A serving worker with a 4-thread budget whose environment the pool inherits
+    monkeypatch.setenv('THREADS_PER_WORKER', '4')
+    for name in THREAD_ENV_VARS:
+        monkeypatch.setenv(name, '4')
+    pool = ComputePool(1)
+    yield pool
+    pool.executor.shutdown(wait=True)
+
+
+def test_pool_process_is_single_threaded(pool):
+    with pool.session() as session:
+        opencv_threads, env, budget = session.submit_value(
+            _pool_threads, session.share(np.zeros((4, 4), np.uint8))).result(timeout=120)
+
+    assert opencv_threads == 1
+    assert budget == 1
+    assert env == {name: '1' for name in THREAD_ENV_VARS}
@@ -0,0 +1,106 @@
+"""
+image_kernels against the float pipelines they replaced: tone curves and
+the Sobel/threshold path must be bit-identical, the approximate L2
+magnitude within 4% plus rounding
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filtre_gravure_simple.image_kernels import (contrast_lut, gamma_lut, levels_lut, compose_luts, apply_lut,
+                                                 sobel_int16, gradient_magnitude, gradient_above)
+
+ALL_LEVELS = np.arange(256, dtype=np.uint8).reshape(16, 16)
+
+
+@pytest.fixture(scope='module')
+def gray():
+    """Noise, hard edges and smooth ramps, so gradients cover every direction and size"""
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (240, 320), dtype=np.uint8)
+    image[40:120, 40:200] = 255
+    image[150:230, 60:300] = np.linspace(0, 255, 240, dtype=np.uint8)
+    cv2.circle(image, (260, 80), 50, 0, -1)
+    return image
+
+
+@pytest.mark.parametrize('contrast', [0.5, 1.0, 1.3, 1.7, 2.5])
+def test_contrast_lut_matches_float32_pipeline(contrast):
+    gray_norm = ALL_LEVELS.astype(np.float32) / 255.0
+    gray_norm = np.clip((gray_norm - 0.5) * contrast + 0.5, 0, 1)
+    expected = (gray_norm * 255).astype(np.uint8)
+
+    np.testing.assert_array_equal(apply_lut(ALL_LEVELS, contrast_lut(contrast)), expected)
+
+
+@pytest.mark.parametrize('gamma', [0.5, 1.0, 1.8, 2.2])
+def test_gamma_lut_matches_float64_curve(gamma):
+    expected = np.round(255 * (ALL_LEVELS / 255.0) ** (1.0 / gamma)).astype(np.uint8)
+
+    np.testing.assert_array_equal(apply_lut(ALL_LEVELS, gamma_lut(gamma)), expected)
+
+
+def test_levels_lut_matches_float64_curve():
+    expected = np.clip((ALL_LEVELS.astype(np.float64) - 20) / (230 - 20), 0, 1)
+    expected = np.round(255 * expected ** (1.0 / 1.4)).astype(np.uint8)
+
+    np.testing.assert_array_equal(apply_lut(ALL_LEVELS, levels_lut(20, 230, 1.4)), expected)
+    with pytest.raises(ValueError):
+        levels_lut(200, 100)
+
+
+def test_composed_lut_equals_tables_in_turn(gray):
+    tables = (levels_lut(10, 240), contrast_lut(1.5), gamma_lut(2.2))
+    expected = gray
+    for lut in tables:
+        expected = apply_lut(expected, lut)
+
+    np.testing.assert_array_equal(apply_lut(gray, compose_luts(*tables)), expected)
+
+
+def test_sobel_int16_is_exact(gray):
+    gx, gy = sobel_int16(gray)
+
+    assert gx.dtype == gy.dtype == np.int16
+    np.testing.assert_array_equal(gx, cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3))
+    np.testing.assert_array_equal(gy, cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3))
+
+
+@pytest.mark.parametrize('threshold', [0, 1, 30, 100, 254])
+def test_gradient_above_matches_float64_threshold(gray, threshold):
+    sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+    sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    magnitude = np.uint8(np.clip(np.sqrt(sobelx ** 2 + sobely ** 2), 0, 255))
+    _, expected = cv2.threshold(magnitude, threshold, 255, cv2.THRESH_BINARY)
+
+    np.testing.assert_array_equal(gradient_above(*sobel_int16(gray), threshold), expected)
+
+
+def test_gradient_magnitude_l1_is_exact(gray):
+    gx, gy = sobel_int16(gray)
+    expected = np.clip(np.abs(gx.astype(np.int32)) + np.abs(gy.astype(np.int32)), 0, 255)
+
+    np.testing.assert_array_equal(gradient_magnitude(gx, gy, 'l1'), expected)
+
+
+def test_gradient_magnitude_l2approx_within_four_percent(gray):
+    gx, gy = sobel_int16(gray)
+    exact = np.sqrt(gx.astype(np.float64) ** 2 + gy.astype(np.float64) ** 2)
+    approx = gradient_magnitude(gx, gy, 'l2approx').astype(np.float64)
+
+    # Compare below saturation only, with one level for rounding
+    unsaturated = exact < 255
+    error = np.abs(approx - exact)[unsaturated]
+    assert np.all(error <= 0.04 * exact[unsaturated] + 1)
+    assert np.all(approx[exact >= 255 * 1.04] == 255)
+
+
+def test_gradient_magnitude_rejects_unknown_norm(gray):
+    with pytest.raises(ValueError):
+        gradient_magnitude(*sobel_int16(gray), norm='l2')
@@ -0,0 +1,138 @@
+"""
+CPU-topology-aware threading policy shared by the services.
+
+Each gunicorn worker otherwise lets OpenCV, onnxruntime and the OpenMP/BLAS
+runtimes size their thread pools to the host's core count, so N workers on
+a container with a CPU quota run N x cores threads and thrash. The policy
+divides the CPUs the container may actually use (affinity mask, capped by
+the cgroup v2/v1 quota) between the gunicorn workers and gives every
+library the same per-worker budget. Compute-pool processes (started by
+multiprocessing, so they have a parent process) run single-threaded, since
+the pool itself provides the parallelism: their budget is 1 and the
+OpenMP/BLAS variables are overwritten rather than inherited from the worker.
+
+Import this module before numpy, cv2 or rembg: the OpenMP/BLAS variables it
+sets are only read when those libraries load.
+
+Configuration (environment):
+    WEB_CONCURRENCY     - gunicorn worker count (gunicorn's own --workers default, default 1)
+    THREADS_PER_WORKER  - override the computed per-worker thread count
+"""
+
+import os
+import math
+import multiprocessing
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def cgroup_cpu_quota():
+    """CPUs allowed by the cgroup quota (may be fractional), or None if unlimited"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        quota, period = _read('/sys/fs/cgroup/cpu.max').split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: quota is -1 when unlimited
+        quota = int(_read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us'))
+        period = int(_read('/sys/fs/cgroup/cpu/cpu.cfs_period_us'))
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def affinity_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def usable_cpus():
+    """CPUs this container can keep busy: affinity capped by the quota, at least 1"""
+    cpus = affinity_cpus()
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, int(math.floor(quota))))
+    return cpus
+
+
+class ThreadPolicy:
+    def __init__(self):
+        self.host_cpus = os.cpu_count() or 1
+        self.affinity_cpus = affinity_cpus()
+        self.cgroup_quota = cgroup_cpu_quota()
+        self.cpus = usable_cpus()
+        self.workers = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+        # Gunicorn forks its workers directly; only compute-pool processes
+        # are multiprocessing children. While a child is still unpickling its
+        # process object (which imports compute_pool and with it this
+        # module) parent_process() is not set yet, but its name already is.
+        self.pool_process = (multiprocessing.parent_process() is not None or
+                             multiprocessing.current_process().name != 'MainProcess')
+
+        override = os.environ.get('THREADS_PER_WORKER')
+        if self.pool_process:
+            self.threads_per_worker = 1
+        else:
+            self.threads_per_worker = (max(1, int(override)) if override
+                                       else max(1, self.cpus // self.workers))
+        self.opencv_threads = None
+        self.onnx_threads = None
+
+    def apply_env(self):
+        for name in THREAD_ENV_VARS:
+            if self.pool_process:
+                # Inherited from the serving worker, sized for a whole worker
+                os.environ[name] = '1'
+            else:
+                # setdefault: an explicit OMP_NUM_THREADS etc. from the deployment wins
+                os.environ.setdefault(name, str(self.threads_per_worker))
+
+    def apply_opencv(self, threads=None):
+        """Size OpenCV's pool; call after importing cv2"""
+        import cv2
+
+        threads = self.threads_per_worker if threads is None else threads
+        cv2.setNumThreads(threads)
+        self.opencv_threads = cv2.getNumThreads()
+        return self.opencv_threads
+
+    def onnx_session_options(self):
+        """onnxruntime SessionOptions using the per-worker thread budget"""
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads_per_worker
+        # One request runs one model graph at a time; parallel branches would
+        # only compete with intra-op threads for the same cores
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        self.onnx_threads = {'intra_op': options.intra_op_num_threads,
+                             'inter_op': options.inter_op_num_threads}
+        return options
+
+    def report(self):
+        return {
+            'host_cpus': self.host_cpus,
+            'affinity_cpus': self.affinity_cpus,
+            'cgroup_quota': round(self.cgroup_quota, 2) if self.cgroup_quota is not None else None,
+            'usable_cpus': self.cpus,
+            'workers': self.workers,
+            'threads_per_worker': self.threads_per_worker,
+            'pool_process': self.pool_process,
+            'opencv_threads': self.opencv_threads,
+            'onnxruntime_threads': self.onnx_threads,
+            'env': {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+        }
+
+
+policy = ThreadPolicy()
+policy.apply_env()
@@ -1,3 +1,4 @@
+from thread_policy import policy as thread_policy  # before numpy/cv2: sets OpenMP/BLAS limits
 import cv2
 import numpy as np
 from flask import Flask, request, jsonify
@@ -11,19 +12,77 @@ from skimage import feature, filters, morphology
 import os
 import tempfile
 import traceback
+from readiness import Readiness
+from admission_control import (AdmissionController, AdmissionRejected, estimate_cost, nest_cost,
+                               probe_image_size, rejection_response, vectorize_steps, sweep_steps, trace_step,
+                               export_steps, preview_steps, REMOVE_BACKGROUND_STEPS, PET_STEPS, PET_EXPORT_STEPS,
+                               PET_MINIMAL_STEPS, PROFESSIONAL_STEPS)
+from request_coalescing import SingleFlight
+from quality_tiers import DegradationController, TIER_SETTINGS, quality_tier, scaled_size
+from style_preview import preview_layout, style_sprite
+from image_request import ImageRequestError, base64_to_bytes, read_image_payload, read_json_payload
+from filtre_gravure_simple.professional_pet_engraving import (professional_engraving, stage_cache, mask_cache,
+                                                              DEFAULT_PARAMS as PROFESSIONAL_PARAMS)
+from filtre_gravure_simple.image_kernels import sobel_int16, gradient_above
+from filtre_gravure_simple.buffer_arena import scratch, request_scope, arena_stats
+from filtre_gravure_simple.engraving_filter import (engraving_sweep, make_contact_sheet, auto_tune_density,
+                                                    DEFAULT_PARAMS, DEFAULT_SWEEP, MAX_SWEEP_VARIANTS,
+                                                    TUNE_CONTRASTS)
+from compute_pool import get_compute_pool, compute_pool_stats
+from mask_refinement import lowres_alpha, removal_mode
+from result_store import deliver, serve_result
+from response_compression import init_app as init_compression, compression_stats
+from request_scheduling import init_app as init_scheduling
+from centerline import centerline_strokes, vectorize_to_centerline_svg
+from halftone import (am_halftone, halftone_options, HALFTONE_LPI, HALFTONE_DPI, HALFTONE_ANGLE,
+                      HALFTONE_DOT_SIZE)
+from dithering import dither, dither_options, DITHER_METHOD, DITHER_BAYER_SIZE, DITHER_SCALE
+from crosshatch import (crosshatch, crosshatch_svg, crosshatch_options, hatch_strokes, CROSSHATCH_SPACING,
+                        CROSSHATCH_ANGLE, CROSSHATCH_LAYERS)
+from pendant_shapes import pendant_shape, composite, outside_mask, clip_svg, clip_strokes, BUILTIN_SHAPES
+from engraver_export import Toolpath, export_options
+from bed_nesting import (nest, nest_points, parse_svg, pendant_size, NEST_BED_WIDTH_MM, NEST_BED_HEIGHT_MM,
+                         NEST_SPACING_MM, NEST_MAX_QUANTITY)
+
+# Compute-pool processes re-import this module to unpickle tasks; they keep
+# the single OpenCV thread the pool initializer set
+if not thread_policy.pool_process:
+    thread_policy.apply_opencv()
 
 app = Flask(__name__)
 CORS(app, origins=['http://localhost:3000', 'http://localhost:3001', 'http://localhost:3002'])
+init_compression(app)
+init_scheduling(app)
+
+readiness = Readiness('vectorization')
+admission = AdmissionController()
+coalescer = SingleFlight()
+degradation = DegradationController(admission)
+
+_face_cascade = None
+
+def get_face_cascade():
+    """Load the Haar cascade once per worker instead of once per request"""
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _face_cascade
 
 def decode_base64_image(base64_string):
     """Decode base64 image string to numpy array"""
+    return decode_image_bytes(base64_to_bytes(base64_string))
+
+def decode_image_bytes(img_data, max_side=None):
+    """Decode raw encoded image bytes to numpy array, fitted within max_side if given"""
     try:
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-        
-        img_data = base64.b64decode(base64_string)
         img = Image.open(io.BytesIO(img_data))
         
+        if max_side and max(img.size) > max_side:
+            size = scaled_size(*img.size, max_side)
+            # JPEGs decode straight at a reduced DCT scale, the rest is resampled
+            img.draft(None, size)
+            img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        
         if img.mode == 'RGBA':
             img = img.convert('RGB')
         
@@ -35,10 +94,12 @@ def decode_base64_image(base64_string):
 def encode_image_to_base64(image_array):
     """Encode numpy array to base64 string"""
     try:
-        if len(image_array.shape) == 2:
-            img = Image.fromarray(image_array.astype('uint8'), 'L')
+        # The styles already return uint8; only other dtypes are converted
+        pixels = image_array.astype(np.uint8, copy=False)
+        if len(pixels.shape) == 2:
+            img = Image.fromarray(pixels, 'L')
         else:
-            img = Image.fromarray(image_array.astype('uint8'), 'RGB')
+            img = Image.fromarray(pixels, 'RGB')
         
         buffered = io.BytesIO()
         img.save(buffered, format="PNG")
@@ -48,13 +109,19 @@ def encode_image_to_base64(image_array):
         print(f"Error encoding image: {e}")
         raise
 
-def apply_advanced_canny(image, low_threshold=50, high_threshold=150):
+def grayscale(image):
+    """Single-channel image; colour input is converted into a scratch buffer"""
+    if len(image.shape) == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=scratch(image.shape[:2]))
+    return image
+
+def apply_advanced_canny(image, low_threshold=50, high_threshold=150, denoise_diameter=9):
     """Apply clean line art style with minimal texture"""
     # Convert to grayscale
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
     
     # Apply bilateral filter to reduce noise while keeping edges sharp
-    filtered = cv2.bilateralFilter(gray, 9, 75, 75)
+    filtered = cv2.bilateralFilter(gray, denoise_diameter, 75, 75)
     
     # Apply edge detection - Canny gives white edges on black background
     edges = cv2.Canny(filtered, low_threshold, high_threshold)
@@ -64,7 +131,7 @@ def apply_advanced_canny(image, low_threshold=50, high_threshold=150):
     edges = cv2.dilate(edges, kernel_dilate, iterations=1)
     
     # Invert to get black lines on white background
-    result = cv2.bitwise_not(edges)
+    result = cv2.bitwise_not(edges, dst=edges)
     
     return result
 
@@ -84,17 +151,17 @@ def create_artistic_edges(image):
     edges = cv2.dilate(edges, kernel, iterations=1)
     
     # Invert to get black lines on white
-    result = cv2.bitwise_not(edges)
+    result = cv2.bitwise_not(edges, dst=edges)
     
     return result
 
-def create_embossed_effect(image):
+def create_embossed_effect(image, denoise_diameter=15):
     """Create clean embossed effect for engraving"""
     # Convert to grayscale
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
     
     # Apply bilateral filter for edge-preserving smoothing
-    smooth = cv2.bilateralFilter(gray, 15, 80, 80)
+    smooth = cv2.bilateralFilter(gray, denoise_diameter, 80, 80)
     
     # Use Canny for reliable edge detection
     edges = cv2.Canny(smooth, 60, 150)
@@ -107,7 +174,7 @@ def create_embossed_effect(image):
     edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
     
     # Invert to get black lines on white background
-    result = cv2.bitwise_not(edges)
+    result = cv2.bitwise_not(edges, dst=edges)
     
     return result
 
@@ -124,7 +191,7 @@ def create_detailed_engraving(image):
     edges = cv2.Canny(adaptive, 50, 150)
     
     # Combine adaptive threshold and edges for more detail
-    combined = cv2.bitwise_and(adaptive, cv2.bitwise_not(edges))
+    combined = cv2.bitwise_and(adaptive, cv2.bitwise_not(edges, dst=edges))
     
     # Clean up
     kernel = np.ones((2,2), np.uint8)
@@ -139,68 +206,28 @@ def create_detailed_engraving(image):
     
     return clean
 
-def create_halftone_pattern(image, dot_size=3):
-    """Create clean pattern for engraving"""
+def create_halftone_pattern(image, lpi=HALFTONE_LPI, angle=HALFTONE_ANGLE, dot_size=HALFTONE_DOT_SIZE,
+                            dpi=HALFTONE_DPI):
+    """AM halftone: a rotated screen with one dot per cell sized to the cell's tone"""
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
-    
-    # Apply Gaussian blur to reduce noise
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    
-    # Use Canny edge detection
-    edges = cv2.Canny(blurred, 60, 140)
-    
-    # Create stipple effect by finding contours
-    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Create white background
-    output = np.ones_like(gray) * 255
-    
-    # Draw contours as dots/stipples
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area > 20:  # Filter out tiny noise
-            # Get contour center
-            M = cv2.moments(contour)
-            if M["m00"] != 0:
-                cx = int(M["m10"] / M["m00"])
-                cy = int(M["m01"] / M["m00"])
-                # Draw small circles for stipple effect
-                cv2.circle(output, (cx, cy), dot_size, 0, -1)
-    
-    # Also draw the main edges
-    output = cv2.min(output, cv2.bitwise_not(edges))
-    
-    return output
-
-def create_crosshatch_pattern(image, line_spacing=3):
-    """Create clean crosshatch pattern for engraving"""
+    return am_halftone(gray, lpi, angle, dot_size, dpi)
+
+def create_crosshatch_pattern(image, line_spacing=CROSSHATCH_SPACING, angle=CROSSHATCH_ANGLE,
+                              layers=CROSSHATCH_LAYERS):
+    """Tone-mapped crosshatch: one hatch direction per darkness layer"""
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
-    
-    # Denoise first
-    denoised = cv2.bilateralFilter(gray, 9, 75, 75)
-    
-    # Get edges
-    edges = cv2.Canny(denoised, 50, 150)
-    
-    # Create crosshatch effect
-    kernel_diag1 = np.array([[1, 0, 0],
-                            [0, 1, 0],
-                            [0, 0, 1]], np.uint8)
-    kernel_diag2 = np.array([[0, 0, 1],
-                            [0, 1, 0],
-                            [1, 0, 0]], np.uint8)
-    
-    # Apply diagonal dilations
-    diag1 = cv2.dilate(edges, kernel_diag1, iterations=1)
-    diag2 = cv2.dilate(edges, kernel_diag2, iterations=1)
-    
-    # Combine for crosshatch effect
-    crosshatch = cv2.bitwise_or(diag1, diag2)
-    
-    # Invert for black lines on white
-    output = cv2.bitwise_not(crosshatch)
-    
-    return output
+    return crosshatch(gray, line_spacing, angle, layers)
+
+def create_crosshatch_svg(image, line_spacing=CROSSHATCH_SPACING, angle=CROSSHATCH_ANGLE,
+                          layers=CROSSHATCH_LAYERS):
+    """The crosshatch layers as straight vector hatch lines"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    return crosshatch_svg(gray, line_spacing, angle, layers)
+
+def create_dithered_engraving(image, method=DITHER_METHOD, bayer_size=DITHER_BAYER_SIZE, scale=DITHER_SCALE):
+    """Photographic dither: Bayer, blue-noise or Floyd-Steinberg"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    return dither(gray, method, bayer_size, scale)
 
 def create_standard_engraving(image):
     """Create standard clean engraving - minimal lines, high contrast"""
@@ -209,23 +236,18 @@ def create_standard_engraving(image):
     # Convert to grayscale
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
     
-    # Use Sobel edge detection for more reliable results
-    sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-    sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    # Use Sobel edge detection for more reliable results (int16, no float temporaries)
+    sobelx, sobely = sobel_int16(gray)
     
-    # Combine Sobel X and Y
-    sobel_combined = np.sqrt(sobelx**2 + sobely**2)
-    sobel_combined = np.uint8(np.clip(sobel_combined, 0, 255))
-    
-    # Threshold to get binary edges
-    _, edges = cv2.threshold(sobel_combined, 30, 255, cv2.THRESH_BINARY)
+    # Binary edges where the gradient magnitude exceeds 30
+    edges = gradient_above(sobelx, sobely, 30)
     
     # Thin the lines
     kernel = cv2.getStructuringElement(cv2.MORPH_CROSS, (3,3))
     edges = cv2.morphologyEx(edges, cv2.MORPH_ERODE, kernel, iterations=1)
     
     # Invert to get black lines on white
-    result = cv2.bitwise_not(edges)
+    result = cv2.bitwise_not(edges, dst=edges)
     
     print(f"Standard engraving complete - mean value: {result.mean():.2f}")
     
@@ -247,54 +269,62 @@ def create_bold_engraving(image):
     thick_edges = cv2.dilate(edges, kernel, iterations=3)
     
     # Combine with adaptive for better coverage
-    result = cv2.bitwise_and(adaptive, cv2.bitwise_not(thick_edges))
+    result = cv2.bitwise_and(adaptive, cv2.bitwise_not(thick_edges, dst=thick_edges))
     
     # Final cleanup
     result = cv2.morphologyEx(result, cv2.MORPH_CLOSE, kernel)
     
     return result
 
+def outline_strokes(image_array):
+    """Closed contour polylines of a binary image as (points, closed, stroke width) strokes"""
+    # Ensure binary image
+    if len(image_array.shape) == 3:
+        gray = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image_array
+    
+    # Invert if needed (we want black lines to trace)
+    if np.mean(gray) > 127:
+        gray = cv2.bitwise_not(gray)
+    
+    _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+    
+    # Find contours with hierarchy
+    contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    
+    # Approximate contours for smoother paths suitable for engraving
+    strokes = []
+    for contour in contours:
+        if len(contour) > 2:
+            # Simplify curves into smooth paths for engraving
+            epsilon = 2  # Fixed epsilon for consistent simplification
+            approx = cv2.approxPolyDP(contour, epsilon, True)
+            
+            if len(approx) > 2:
+                # Thicker stroke for better engraving visibility
+                strokes.append((approx.reshape(-1, 2), True, 3))
+    return strokes
+
 def vectorize_to_svg(image_array, output_path=None):
     """Convert binary image to SVG using optimized contours"""
     try:
-        # Ensure binary image
-        if len(image_array.shape) == 3:
-            gray = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = image_array
-        
-        # Invert if needed (we want black lines to trace)
-        if np.mean(gray) > 127:
-            gray = cv2.bitwise_not(gray)
-        
-        _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-        
-        # Find contours with hierarchy
-        contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        strokes = outline_strokes(image_array)
         
         # Create SVG
-        height, width = binary.shape
+        height, width = image_array.shape[:2]
         dwg = svgwrite.Drawing(size=(width, height))
         
         # Add white background
         dwg.add(dwg.rect(insert=(0, 0), size=(width, height), fill='white'))
         
-        # Approximate contours for smoother paths suitable for engraving
-        for contour in contours:
-            if len(contour) > 2:
-                # Simplify curves into smooth paths for engraving
-                epsilon = 2  # Fixed epsilon for consistent simplification
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-                
-                if len(approx) > 2:
-                    points = approx.reshape(-1, 2).tolist()
-                    path_data = f"M {points[0][0]},{points[0][1]} "
-                    for point in points[1:]:
-                        path_data += f"L {point[0]},{point[1]} "
-                    path_data += "Z"
-                    
-                    # Thicker stroke for better engraving visibility
-                    dwg.add(dwg.path(d=path_data, fill='none', stroke='black', stroke_width=3))
+        for points, _, stroke_width in strokes:
+            points = points.tolist()
+            path_data = f"M {points[0][0]},{points[0][1]} "
+            for point in points[1:]:
+                path_data += f"L {point[0]},{point[1]} "
+            path_data += "Z"
+            dwg.add(dwg.path(d=path_data, fill='none', stroke='black', stroke_width=stroke_width))
         
         # Save or return SVG
         if output_path:
@@ -310,80 +340,816 @@ def vectorize_to_svg(image_array, output_path=None):
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "service": "vectorization"})
+    return jsonify({"status": "healthy", "service": "vectorization", "ready": readiness.is_ready,
+                    "admission": admission.stats(), "coalescing": coalescer.stats(),
+                    "compute_pool": compute_pool_stats(), "stage_cache": stage_cache.stats(),
+                    "mask_cache": mask_cache.stats(),
+                    "buffer_arena": arena_stats(), "compression": compression_stats(),
+                    "degradation": degradation.stats(),
+                    "threads": thread_policy.report()})
 
-@app.route('/vectorize', methods=['POST'])
-def vectorize_image():
+@app.route('/results/<key>', methods=['GET'])
+def result_file(key):
+    """Stored result (delivery=url) with ETag and Range support"""
+    return serve_result(key)
+
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    return jsonify(readiness.liveness())
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    payload, status = readiness.readiness()
+    return jsonify(payload), status
+
+# Style name -> renderer; every renderer returns a (height, width) uint8 image
+STYLE_FUNCTIONS = {
+    'standard': create_standard_engraving,
+    'detailed': create_detailed_engraving,
+    'bold': create_bold_engraving,
+    'canny': apply_advanced_canny,
+    'artistic': create_artistic_edges,
+    'embossed': create_embossed_effect,
+    'halftone': create_halftone_pattern,
+    'crosshatch': create_crosshatch_pattern,
+    'dither': create_dithered_engraving,
+}
+
+def requested_styles(style):
+    """The three dashboard styles plus the extras selected by 'style'"""
+    styles = ['standard', 'detailed', 'bold']
+    for extra in ['canny', 'artistic', 'embossed', 'halftone', 'crosshatch', 'dither']:
+        if style == 'all' or style == extra:
+            styles.append(extra)
+    return styles
+
+def svg_source_style(style):
+    """Which rendered style the SVG is traced from (or drawn directly, see VECTOR_STYLES)"""
+    primary_style = style if style != 'all' else 'standard'
+    return primary_style if primary_style in ('standard', 'detailed', 'bold', 'canny', 'artistic',
+                                              'crosshatch') else 'standard'
+
+# SVG tracers: 'outline' follows both edges of every stroke, 'centerline'
+# emits one open polyline per stroke (about half the laser path)
+SVG_TRACERS = {
+    'outline': vectorize_to_svg,
+    'centerline': vectorize_to_centerline_svg,
+}
+
+# Styles whose SVG is drawn from the source image as vector lines instead of
+# tracing the rendered raster; the response reports trace='hatch'
+VECTOR_STYLES = {
+    'crosshatch': create_crosshatch_svg,
+}
+
+def trace_centerline_strokes(image_array):
+    # Isolated dots become zero-length strokes, as in the SVG
+    return [(polyline if len(polyline) > 1 else np.repeat(polyline, 2, axis=0), False, width)
+            for polyline, width in centerline_strokes(image_array)]
+
+# The strokes behind SVG_TRACERS and VECTOR_STYLES, exported to G-code/DXF
+# without going through SVG
+STROKE_TRACERS = {
+    'outline': outline_strokes,
+    'centerline': trace_centerline_strokes,
+}
+VECTOR_STROKES = {
+    'crosshatch': hatch_strokes,
+}
+
+def parse_halftone_params(params):
+    """Halftone screen overrides (lpi, angle, dot_size, dpi) from request params"""
     try:
-        data = request.json
-        image_base64 = data.get('image')
-        style = data.get('style', 'canny')
-        
-        if not image_base64:
-            return jsonify({"error": "No image provided"}), 400
-        
-        # Decode image
-        image = decode_base64_image(image_base64)
-        
-        # Apply different vectorization styles
-        result_images = {}
-        
-        # Always generate the three main styles for the dashboard
-        standard_result = create_standard_engraving(image)
-        result_images['standard'] = encode_image_to_base64(standard_result)
-        
-        detailed_result = create_detailed_engraving(image)
-        result_images['detailed'] = encode_image_to_base64(detailed_result)
-        
-        bold_result = create_bold_engraving(image)
-        result_images['bold'] = encode_image_to_base64(bold_result)
-        
-        # Additional styles based on request
-        if style == 'all' or style == 'canny':
-            canny_result = apply_advanced_canny(image)
-            result_images['canny'] = encode_image_to_base64(canny_result)
-        
-        if style == 'all' or style == 'artistic':
-            artistic_result = create_artistic_edges(image)
-            result_images['artistic'] = encode_image_to_base64(artistic_result)
-        
-        if style == 'all' or style == 'embossed':
-            embossed_result = create_embossed_effect(image)
-            result_images['embossed'] = encode_image_to_base64(embossed_result)
-        
-        if style == 'all' or style == 'halftone':
-            halftone_result = create_halftone_pattern(image)
-            result_images['halftone'] = encode_image_to_base64(halftone_result)
+        return halftone_options(**{name: params[name] for name in ('lpi', 'angle', 'dot_size', 'dpi')
+                                   if params.get(name) not in (None, '')})
+    except (TypeError, ValueError) as e:
+        raise ImageRequestError(f"Invalid halftone parameters: {e}")
+
+def parse_crosshatch_params(params):
+    """Crosshatch overrides (line_spacing, hatch_angle, hatch_layers) from request params"""
+    names = {'line_spacing': 'line_spacing', 'hatch_angle': 'angle', 'hatch_layers': 'layers'}
+    try:
+        return crosshatch_options(**{argument: params[name] for name, argument in names.items()
+                                     if params.get(name) not in (None, '')})
+    except (TypeError, ValueError) as e:
+        raise ImageRequestError(f"Invalid crosshatch parameters: {e}")
+
+def parse_dither_params(params):
+    """Dither overrides (dither method, bayer_size, dither_scale) from request params"""
+    names = {'dither': 'method', 'bayer_size': 'bayer_size', 'dither_scale': 'scale'}
+    try:
+        return dither_options(**{argument: params[name] for name, argument in names.items()
+                                 if params.get(name) not in (None, '')})
+    except (TypeError, ValueError) as e:
+        raise ImageRequestError(f"Invalid dither parameters: {e}")
+
+# Request parameter parsers of the styles that take options
+STYLE_PARAMS = {
+    'halftone': parse_halftone_params,
+    'crosshatch': parse_crosshatch_params,
+    'dither': parse_dither_params,
+}
+
+def parse_style_options(style, params):
+    """Options of every requested style that takes them, keyed by style"""
+    return {name: parser(params) for name, parser in STYLE_PARAMS.items() if name in requested_styles(style)}
+
+def style_options(name, options):
+    """Keyword arguments for a style renderer"""
+    return (options or {}).get(name, {})
+
+# Bilateral neighbourhoods for degraded quality tiers: the filter cost grows
+# with the square of the diameter
+FAST_DENOISE_OPTIONS = {
+    'canny': {'denoise_diameter': 5},
+    'embossed': {'denoise_diameter': 7},
+}
+PET_DENOISE_DIAMETER = 15
+PET_FAST_DENOISE_DIAMETER = 7
+
+def tier_options(options, tier):
+    """Style options with the quality tier's cheaper denoising merged in"""
+    if not TIER_SETTINGS[tier]['fast_denoise']:
+        return options
+    merged = {name: dict(values) for name, values in (options or {}).items()}
+    for name, values in FAST_DENOISE_OPTIONS.items():
+        merged.setdefault(name, {}).update(values)
+    return merged
+
+def rendered_styles(style, tier='full'):
+    """Styles to render; the minimal tier keeps only the SVG source and the requested extra"""
+    if TIER_SETTINGS[tier]['optional_styles']:
+        return requested_styles(style)
+    svg_style = svg_source_style(style)
+    extra = [style] if style in STYLE_FUNCTIONS and style != svg_style else []
+    return [svg_style] + extra
+
+def parse_pendant_params(params, default=None):
+    """Pendant shape from pendant_shape / pendant_svg (None when cropping is off)"""
+    name, svg = params.get('pendant_shape'), params.get('pendant_svg')
+    if name in (None, '') and not svg:
+        name = default
+    try:
+        return pendant_shape(name, svg)
+    except ValueError as e:
+        raise ImageRequestError(f"Invalid pendant shape: {e}")
+
+def parse_export_params(params, style):
+    """G-code/DXF options from format, feed, power and width_mm (None for the JSON response)"""
+    fmt = (params.get('format') or 'json').lower()
+    if fmt == 'json':
+        return None
+    try:
+        return export_options(fmt, style, **{name: params[name] for name in ('feed', 'power', 'width_mm')
+                                             if params.get(name) not in (None, '')})
+    except (TypeError, ValueError) as e:
+        raise ImageRequestError(f"Invalid export parameters: {e}")
+
+def crop_to_pendant(image, pendant):
+    """Style raster with white outside the pendant shape (unchanged without one)"""
+    return image if pendant is None else composite(image, pendant, dst=scratch(image.shape))
+
+def clip_to_pendant(svg_string, pendant, image):
+    """SVG clipped geometrically to the pendant outline (unchanged without one)"""
+    return svg_string if pendant is None else clip_svg(svg_string, pendant, image.shape[1], image.shape[0])
+
+def clip_strokes_to_pendant(strokes, pendant, image):
+    """Export strokes clipped to the pendant outline (unchanged without one)"""
+    if pendant is None:
+        return strokes
+    height, width = image.shape[:2]
+    clipped = clip_strokes([(points, closed) for points, closed, _ in strokes],
+                           pendant.outline(width, height), outside_mask(pendant, width, height))
+    return [(piece, piece_closed, stroke_width)
+            for (_, _, stroke_width), pieces in zip(strokes, clipped) for piece, piece_closed in pieces]
+
+def process_vectorization(image, style='canny', trace='outline', options=None, pendant=None, tier='full'):
+    """
+    Render the dashboard styles plus the SVG for the primary style. With a
+    pendant shape the SVG is traced from the uncropped raster and clipped as
+    vectors, and the rasters are cropped afterwards. The image arrives
+    already downscaled for a degraded quality tier.
+    """
+    styles = rendered_styles(style, tier)
+    svg_style = svg_source_style(style)
+    tracer = SVG_TRACERS[trace]
+    quality = degradation.report(tier, working_size=(image.shape[1], image.shape[0]),
+                                 skipped_styles=[name for name in requested_styles(style) if name not in styles])
+    
+    # Every style works on grayscale: convert once instead of once per style
+    image = grayscale(image)
+    
+    pool = get_compute_pool()
+    if pool is not None:
+        return process_vectorization_pooled(pool, image, style, styles, svg_style, trace, options, pendant,
+                                            quality)
+    
+    # Apply different vectorization styles
+    rendered = {name: STYLE_FUNCTIONS[name](image, **style_options(name, options)) for name in styles}
+    result_images = {name: encode_image_to_base64(crop_to_pendant(rendered[name], pendant)) for name in styles}
+    
+    # Generate SVG for the primary style
+    if svg_style in VECTOR_STYLES:
+        svg_string = VECTOR_STYLES[svg_style](image, **style_options(svg_style, options))
+        trace = 'hatch'
+    else:
+        svg_string = tracer(rendered[svg_style])
+    
+    return vectorization_response(result_images, clip_to_pendant(svg_string, pendant, image), style, trace, pendant,
+                                  quality)
+
+def process_vectorization_pooled(pool, image, style, styles, svg_style, trace='outline', options=None,
+                                 pendant=None, quality=None):
+    """
+    Same as process_vectorization, but every style and the SVG trace run in
+    the process pool on shared memory; the parent only PNG-encodes
+    """
+    with pool.session() as session:
+        source = session.share(image)
+        futures = {name: session.submit_image(STYLE_FUNCTIONS[name], source, **style_options(name, options))
+                   for name in styles}
         
-        if style == 'all' or style == 'crosshatch':
-            crosshatch_result = create_crosshatch_pattern(image)
-            result_images['crosshatch'] = encode_image_to_base64(crosshatch_result)
+        if svg_style in VECTOR_STYLES:
+            svg_future = session.submit_value(VECTOR_STYLES[svg_style], source, **style_options(svg_style, options))
+            trace = 'hatch'
+        else:
+            # Start the GIL-heavy contour trace as soon as its input exists
+            svg_future = session.submit_value(SVG_TRACERS[trace], futures[svg_style].result())
         
-        # Generate SVG for the primary style
-        primary_style = style if style != 'all' else 'standard'
-        if primary_style == 'standard':
-            svg_input = standard_result
-        elif primary_style == 'detailed':
-            svg_input = detailed_result
-        elif primary_style == 'bold':
-            svg_input = bold_result
-        elif primary_style == 'canny':
-            svg_input = apply_advanced_canny(image)
-        elif primary_style == 'artistic':
-            svg_input = create_artistic_edges(image)
+        result_images = {name: encode_image_to_base64(crop_to_pendant(futures[name].result().array, pendant))
+                         for name in styles}
+        svg_string = svg_future.result()
+    
+    return vectorization_response(result_images, clip_to_pendant(svg_string, pendant, image), style, trace, pendant,
+                                  quality)
+
+def parse_preview_params(params):
+    """Styles (comma-separated, default all) and sprite layout of a contact-sheet preview"""
+    names = params.get('styles')
+    styles = [name.strip() for name in names.split(',') if name.strip()] if names else list(STYLE_FUNCTIONS)
+    unknown = [name for name in styles if name not in STYLE_FUNCTIONS]
+    if unknown or not styles:
+        raise ImageRequestError(f"Unknown styles {unknown}, expected some of {list(STYLE_FUNCTIONS)}")
+    try:
+        layout = preview_layout(params.get('tile_size'), params.get('columns'), params.get('labels'))
+    except ValueError as e:
+        raise ImageRequestError(str(e))
+    return list(dict.fromkeys(styles)), layout
+
+def process_style_preview(image, styles, options=None, pendant=None, layout=None):
+    """
+    Render the styles on the already downscaled image (in the process pool
+    when there is one) and tile them into one sprite with a single PNG encode
+    """
+    image = grayscale(image)
+    layout = layout or preview_layout()
+    
+    pool = get_compute_pool()
+    if pool is not None:
+        with pool.session() as session:
+            source = session.share(image)
+            futures = {name: session.submit_image(STYLE_FUNCTIONS[name], source, **style_options(name, options))
+                       for name in styles}
+            rendered = {name: crop_to_pendant(futures[name].result().array, pendant) for name in styles}
+            sprite, index = style_sprite(rendered, layout['columns'], layout['labels'])
+    else:
+        rendered = {name: crop_to_pendant(STYLE_FUNCTIONS[name](image, **style_options(name, options)), pendant)
+                    for name in styles}
+        sprite, index = style_sprite(rendered, layout['columns'], layout['labels'])
+    
+    response = {
+        "success": True,
+        "count": len(index),
+        "sheet": encode_image_to_base64(sprite),
+        "sheet_size": [sprite.shape[1], sprite.shape[0]],
+        "index": index
+    }
+    if pendant is not None:
+        response["pendant_shape"] = pendant.name
+    return response
+
+def export_strokes(image, svg_style, trace='outline', options=None):
+    """Strokes of the primary style, straight from the tracer"""
+    if svg_style in VECTOR_STROKES:
+        return VECTOR_STROKES[svg_style](image, **style_options(svg_style, options))
+    return STROKE_TRACERS[trace](STYLE_FUNCTIONS[svg_style](image, **style_options(svg_style, options)))
+
+def process_vector_export(image, style, trace, options, pendant, export):
+    """
+    Toolpath of the primary style for a G-code/DXF response: only that style
+    is rendered and traced, and nothing is PNG-encoded or written as SVG
+    """
+    svg_style = svg_source_style(style)
+    image = grayscale(image)
+    
+    pool = get_compute_pool()
+    if pool is not None:
+        with pool.session() as session:
+            strokes = session.submit_value(export_strokes, session.share(image), svg_style, trace, options).result()
+    else:
+        strokes = export_strokes(image, svg_style, trace, options)
+    
+    strokes = clip_strokes_to_pendant(strokes, pendant, image)
+    # Hatch lines already come in back-and-forth engraving order
+    return Toolpath(image.shape[1], image.shape[0], strokes, svg_style, export,
+                    ordered=svg_style not in VECTOR_STROKES)
+
+def vectorization_response(result_images, svg_string, style, trace='outline', pendant=None, quality=None):
+    response = {
+        "success": True,
+        "styles": result_images,  # Changed from "images" to "styles" to match frontend expectation
+        "images": result_images,  # Keep for backward compatibility
+        "svg": svg_string,
+        "style": style,
+        "trace": trace
+    }
+    if pendant is not None:
+        response["pendant_shape"] = pendant.name
+    if quality is not None:
+        response["quality"] = quality
+    return response
+
+def opencv_subject_mask(image):
+    """Mask of the largest non-white region, or None when there is no clear subject"""
+    # Convert to grayscale
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    
+    # Apply threshold to create a mask
+    _, mask = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY_INV)
+    
+    # Apply morphological operations to clean up the mask
+    kernel = np.ones((3,3), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+    
+    # Find contours
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    if not contours:
+        return None
+    
+    # Get the largest contour (assumed to be the main subject)
+    largest_contour = max(contours, key=cv2.contourArea)
+    
+    # Create a clean mask from the largest contour
+    mask_clean = scratch(gray.shape, fill=0)
+    cv2.drawContours(mask_clean, [largest_contour], -1, 255, -1)
+    
+    # Apply some smoothing to the mask edges (in place)
+    cv2.GaussianBlur(mask_clean, (5, 5), 0, dst=mask_clean)
+    cv2.threshold(mask_clean, 128, 255, cv2.THRESH_BINARY, dst=mask_clean)
+    return mask_clean
+
+def process_background_removal(image, mode='full'):
+    """
+    Remove background from a decoded image using OpenCV thresholding.
+    In 'lowres' mode the mask is found on a bounded copy and only its edge
+    band is refined at full resolution.
+    """
+    refinement = None
+    if mode == 'lowres':
+        mask_clean, refinement = lowres_alpha(image, opencv_subject_mask)
+    else:
+        mask_clean = opencv_subject_mask(image)
+    
+    if mask_clean is not None:
+        # Create RGBA image
+        if len(image.shape) == 3:
+            b, g, r = cv2.split(image)
+            rgba = cv2.merge([b, g, r, mask_clean])
         else:
-            svg_input = standard_result
+            rgba = cv2.merge([image, image, image, mask_clean])
+    
+        # Convert to PIL Image for encoding
+        img_pil = Image.fromarray(rgba, 'RGBA')
+    
+        # Save to buffer
+        buffered = io.BytesIO()
+        img_pil.save(buffered, format="PNG")
+        img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+    
+        result = {
+            "success": True,
+            "image": f"data:image/png;base64,{img_base64}",
+            "has_transparency": True
+        }
+        if refinement is not None:
+            result["refinement"] = refinement
+        return result
+    else:
+        # If no contours found, return original with white background
+        return {
+            "success": True,
+            "image": encode_image_to_base64(image),
+            "has_transparency": False,
+            "message": "No clear subject detected, returning original"
+        }
+
+def pet_face_crop(image):
+    """Largest detected face plus padding (the whole image without one); returns (cropped, box)"""
+    # Load pet face cascade (we'll use human face cascade as fallback)
+    face_cascade = get_face_cascade()
+    
+    # Convert to grayscale for detection
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    
+    # Detect faces
+    faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+    
+    # Process based on detection
+    if len(faces) > 0:
+        # Get the largest face
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+    
+        # Add padding
+        padding = int(max(w, h) * 0.2)
+        x = max(0, x - padding)
+        y = max(0, y - padding)
+        w = min(image.shape[1] - x, w + 2 * padding)
+        h = min(image.shape[0] - y, h + 2 * padding)
+    
+        # Crop to face region
+        cropped = image[y:y+h, x:x+w]
+        return cropped, (x, y, w, h)
+    return image, None
+
+def pet_contrast_edges(cropped):
+    """High contrast edges for clear features; the pet SVG is traced from these"""
+    contrast = cv2.convertScaleAbs(cropped, alpha=2.0, beta=0)
+    return apply_advanced_canny(contrast, 30, 90)
+
+def process_pet(image, tier='full'):
+    """Pet processing with face detection, returns the styles and SVG"""
+    settings = TIER_SETTINGS[tier]
+    cropped, box = pet_face_crop(image)
+    
+    # Create multiple engraving styles optimized for pets
+    results = {}
+    
+    # High contrast for clear features
+    contrast_edges = pet_contrast_edges(cropped)
+    results['contrast'] = encode_image_to_base64(contrast_edges)
+    
+    if settings['optional_styles']:
+        # Soft edges for fur texture
+        diameter = PET_FAST_DENOISE_DIAMETER if settings['fast_denoise'] else PET_DENOISE_DIAMETER
+        soft_edges = cv2.bilateralFilter(cropped, diameter, 80, 80)
+        soft_edges_gray = cv2.cvtColor(soft_edges, cv2.COLOR_BGR2GRAY) if len(soft_edges.shape) == 3 else soft_edges
+        _, soft_binary = cv2.threshold(soft_edges_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        results['soft'] = encode_image_to_base64(soft_binary)
         
-        svg_string = vectorize_to_svg(svg_input)
+        # Artistic style
+        artistic = create_artistic_edges(cropped)
+        results['artistic'] = encode_image_to_base64(artistic)
         
-        return jsonify({
-            "success": True,
-            "styles": result_images,  # Changed from "images" to "styles" to match frontend expectation
-            "images": result_images,  # Keep for backward compatibility
-            "svg": svg_string,
-            "style": style
-        })
+        # Detailed engraving
+        detailed = create_detailed_engraving(cropped)
+        results['detailed'] = encode_image_to_base64(detailed)
+    
+    # Generate SVG
+    svg_string = vectorize_to_svg(contrast_edges)
+    
+    skipped = [] if settings['optional_styles'] else ['soft', 'artistic', 'detailed']
+    return {
+        "success": True,
+        "face_detected": box is not None,
+        "face_coordinates": dict(zip(("x", "y", "width", "height"), map(int, box))) if box is not None else None,
+        "styles": results,
+        "svg": svg_string,
+        "quality": degradation.report(tier, working_size=(image.shape[1], image.shape[0]), skipped_styles=skipped)
+    }
+
+def process_pet_export(image, export):
+    """Toolpath of the pet contrast edges for a G-code/DXF response"""
+    cropped, _ = pet_face_crop(image)
+    strokes = outline_strokes(pet_contrast_edges(cropped))
+    return Toolpath(cropped.shape[1], cropped.shape[0], strokes, 'pet', export)
+
+def run_admitted(image_bytes, steps, process, *args, max_side=None):
+    """
+    Price the request from the image header, then decode and process within
+    budget; max_side (a degraded quality tier) downscales while decoding
+    """
+    width, height = probe_image_size(image_bytes)
+    working_width, working_height = scaled_size(width, height, max_side)
+    cost = estimate_cost(width, height, steps, working_width * working_height)
     
+    # Scratch buffers are reused across requests and returned once the
+    # response is built
+    with admission.admit(cost), request_scope(process.__name__):
+        image = decode_image_bytes(image_bytes, max_side)
+        return process(image, *args)
+
+def parse_professional_params(params):
+    """Professional filter overrides from request params (unknown keys ignored)"""
+    overrides = {}
+    for name, default in PROFESSIONAL_PARAMS.items():
+        if params.get(name) in (None, ''):
+            continue
+        try:
+            overrides[name] = type(default)(params[name])
+        except (TypeError, ValueError):
+            raise ImageRequestError(f"Invalid value for {name}: {params[name]}")
+    return overrides
+
+def process_professional_engraving(image, overrides=None, pendant=BUILTIN_SHAPES['circle']):
+    """Professional pet engraving filter cropped to the pendant shape, returned as a PNG data URL"""
+    crop = False if pendant is None else outside_mask(pendant, image.shape[1], image.shape[0])
+    result = professional_engraving(image, overrides, pendant=crop)
+    return {
+        "success": True,
+        "image": encode_image_to_base64(result),
+        "style": "professional",
+        "pendant_shape": pendant.name if pendant is not None else 'none',
+        "parameters": dict(PROFESSIONAL_PARAMS, **(overrides or {})),
+        "dimensions": {"width": int(result.shape[1]), "height": int(result.shape[0])}
+    }
+
+def parse_sweep_grid(params):
+    """
+    Sweep grid from request params; each axis is a JSON list or a
+    comma-separated string and falls back to the CLI default grid
+    """
+    grid = {}
+    for axis, default in DEFAULT_SWEEP.items():
+        values = params.get(axis, default)
+        if isinstance(values, str):
+            values = [v for v in values.split(',') if v.strip()]
+        elif not isinstance(values, (list, tuple)):
+            values = [values]
+        try:
+            cast = float if axis in ('contrasts', 'adapt_cs') else int
+            grid[axis] = [cast(v) for v in values]
+        except (TypeError, ValueError):
+            raise ImageRequestError(f"Invalid values for {axis}: {values}")
+        if not grid[axis]:
+            raise ImageRequestError(f"{axis} must not be empty")
+    
+    variants = 1
+    for values in grid.values():
+        variants *= len(values)
+    if variants > MAX_SWEEP_VARIANTS:
+        raise ImageRequestError(f"Sweep grid has {variants} variants, the limit is {MAX_SWEEP_VARIANTS}")
+    return grid
+
+def process_engraving_sweep(image, grid, output='sheet'):
+    """Render the whole grid from shared intermediates as a contact sheet or per-variant images"""
+    results = engraving_sweep(image, grid['blur_sizes'], grid['contrasts'],
+                              grid['block_sizes'], grid['adapt_cs'])
+    
+    if output == 'images':
+        variants = [{
+            "blur_size": blur_size,
+            "contrast": contrast,
+            "block_size": block_size,
+            "adapt_c": adapt_c,
+            "image": encode_image_to_base64(result)
+        } for (blur_size, contrast, block_size, adapt_c), result in results.items()]
+        return {"success": True, "count": len(variants), "variants": variants}
+    
+    sheet, index = make_contact_sheet(results)
+    return {
+        "success": True,
+        "count": len(index),
+        "sheet": encode_image_to_base64(sheet),
+        "index": index
+    }
+
+def parse_engraving_params(params):
+    """Engraving filter parameters and auto-tune options from request params"""
+    try:
+        options = {
+            'blur_size': int(params.get('blur_size', DEFAULT_PARAMS['blur_size'])),
+            'contrast': float(params.get('contrast', DEFAULT_PARAMS['contrast'])),
+            'block_size': int(params.get('block_size', DEFAULT_PARAMS['block_size'])),
+            'adapt_c': float(params.get('adapt_c', DEFAULT_PARAMS['adapt_c'])),
+            'target_black': float(params['target_black']) if params.get('target_black') not in (None, '') else None,
+            'tolerance': float(params.get('tolerance', 0.02))
+        }
+    except (TypeError, ValueError) as e:
+        raise ImageRequestError(f"Invalid engraving parameters: {e}")
+    if options['target_black'] is not None and not 0 <= options['target_black'] <= 1:
+        raise ImageRequestError("target_black must be between 0 and 1")
+    options['tune_contrast'] = str(params.get('tune_contrast', 'false')).lower() in ('1', 'true', 'yes')
+    return options
+
+def process_engraving_filter(image, options):
+    """
+    Simple engraving filter; with target_black the adaptive constant (and
+    optionally contrast) is tuned to that ink coverage first
+    """
+    filter_params = {k: options[k] for k in ('blur_size', 'contrast', 'block_size', 'adapt_c')}
+    if options['target_black'] is not None:
+        result, report = auto_tune_density(image, options['target_black'], options['tolerance'],
+                                           options['tune_contrast'], **filter_params)
+    else:
+        results = engraving_sweep(image, [filter_params['blur_size']], [filter_params['contrast']],
+                                  [filter_params['block_size']], [filter_params['adapt_c']])
+        result = next(iter(results.values()))
+        report = dict(filter_params, black_ratio=round(float(np.mean(result == 0)), 4))
+    
+    return {
+        "success": True,
+        "image": encode_image_to_base64(result),
+        "style": "engraving",
+        "parameters": report
+    }
+
+def parse_quality_params(params):
+    """Quality tier for an interactive request: the degradation controller's, capped by 'quality'"""
+    try:
+        return degradation.tier(quality_tier(params.get('quality')))
+    except ValueError as e:
+        raise ImageRequestError(str(e))
+
+def run_tiered(request_key, tier, compute):
+    """
+    Compute an interactive result at a quality tier. Under pressure a recent
+    result of the same request is served from the preview cache instead.
+    """
+    if tier != 'full':
+        cached = degradation.previews.get(request_key)
+        if cached is not None:
+            cached_tier, result = cached
+            return dict(result, quality=degradation.report(cached_tier, cached=True))
+    with degradation.timed():
+        result = coalescer.do(f"{request_key}-{tier}", compute)
+    if 'quality' not in result:
+        result = dict(result, quality=degradation.report(tier))
+    degradation.previews.put(request_key, tier, result)
+    return result
+
+# Engine entry points on encoded image bytes: identical concurrent requests
+# share one computation, and each computation runs within the admission budget.
+
+def vectorize_bytes(image_bytes, style='canny', trace=None, params=None):
+    trace = trace or 'outline'
+    if trace not in SVG_TRACERS:
+        raise ImageRequestError(f"Unknown trace '{trace}', expected one of {sorted(SVG_TRACERS)}")
+    options = parse_style_options(style, params or {})
+    pendant = parse_pendant_params(params or {}, 'none')
+    export = parse_export_params(params or {}, svg_source_style(style))
+    if export is not None:
+        key = coalescer.make_key('vectorize-export', image_bytes, style=style, trace=trace,
+                                 pendant=pendant.key if pendant is not None else 'none', **export,
+                                 **{f"{name}_{k}": v for name, values in options.items() for k, v in values.items()})
+        steps = export_steps(svg_source_style(style), trace, pendant is not None)
+        return coalescer.do(key, lambda: run_admitted(
+            image_bytes, steps, process_vector_export, style, trace, options, pendant, export))
+    request_key = coalescer.make_key('vectorize', image_bytes, style=style, trace=trace,
+                                     pendant=pendant.key if pendant is not None else 'none',
+                                     **{f"{name}_{k}": v for name, values in options.items() for k, v in values.items()})
+    tier = parse_quality_params(params or {})
+    steps = vectorize_steps(style, trace, options.get('dither', {}).get('method'), pendant is not None,
+                            rendered_styles(style, tier))
+    return run_tiered(request_key, tier, lambda: run_admitted(
+        image_bytes, steps, process_vectorization, style, trace, tier_options(options, tier), pendant, tier,
+        max_side=TIER_SETTINGS[tier]['max_side']))
+
+def remove_background_bytes(image_bytes, mode=None, model=None, quality=None):
+    # model selects a rembg variant; the OpenCV fallback has only one, and
+    # degrades by working resolution only
+    try:
+        mode = removal_mode(mode)
+    except ValueError as e:
+        raise ImageRequestError(str(e))
+    request_key = coalescer.make_key('remove-background-opencv', image_bytes, mode=mode)
+    tier = parse_quality_params({'quality': quality})
+    return run_tiered(request_key, tier, lambda: run_admitted(
+        image_bytes, REMOVE_BACKGROUND_STEPS, process_background_removal, mode,
+        max_side=TIER_SETTINGS[tier]['max_side']))
+
+def process_pet_bytes(image_bytes, params=None):
+    export = parse_export_params(params or {}, 'pet')
+    if export is not None:
+        key = coalescer.make_key('process-pet-export', image_bytes, **export)
+        return coalescer.do(key, lambda: run_admitted(
+            image_bytes, PET_EXPORT_STEPS, process_pet_export, export))
+    request_key = coalescer.make_key('process-pet', image_bytes)
+    tier = parse_quality_params(params or {})
+    steps = PET_STEPS if TIER_SETTINGS[tier]['optional_styles'] else PET_MINIMAL_STEPS
+    return run_tiered(request_key, tier, lambda: run_admitted(
+        image_bytes, steps, process_pet, tier, max_side=TIER_SETTINGS[tier]['max_side']))
+
+def style_preview_bytes(image_bytes, params=None):
+    params = params or {}
+    styles, layout = parse_preview_params(params)
+    options = {name: parser(params) for name, parser in STYLE_PARAMS.items() if name in styles}
+    pendant = parse_pendant_params(params, 'none')
+    key = coalescer.make_key('style-preview', image_bytes, styles=','.join(styles),
+                             pendant=pendant.key if pendant is not None else 'none', **layout,
+                             **{f"{name}_{k}": v for name, values in options.items() for k, v in values.items()})
+    return coalescer.do(key, lambda: run_admitted(
+        image_bytes, preview_steps(styles, pendant is not None), process_style_preview, styles, options, pendant,
+        layout, max_side=layout['tile_size']))
+
+def professional_engraving_bytes(image_bytes, params=None):
+    overrides = parse_professional_params(params or {})
+    pendant = parse_pendant_params(params or {})
+    key = coalescer.make_key('professional-engraving', image_bytes,
+                             pendant=pendant.key if pendant is not None else 'none', **overrides)
+    return coalescer.do(key, lambda: run_admitted(
+        image_bytes, PROFESSIONAL_STEPS, process_professional_engraving, overrides, pendant))
+
+def engraving_sweep_bytes(image_bytes, params):
+    grid = parse_sweep_grid(params)
+    output = 'images' if params.get('output') == 'images' else 'sheet'
+    passes = len(grid['blur_sizes']) * len(grid['contrasts'])
+    variants = passes * len(grid['block_sizes']) * len(grid['adapt_cs'])
+    steps = sweep_steps(passes, variants, images=(output == 'images'))
+    
+    key = coalescer.make_key('engraving-sweep', image_bytes, output=output,
+                             **{axis: ','.join(map(str, values)) for axis, values in grid.items()})
+    return coalescer.do(key, lambda: run_admitted(
+        image_bytes, steps, process_engraving_sweep, grid, output))
+
+def engraving_filter_bytes(image_bytes, params):
+    options = parse_engraving_params(params)
+    passes = len(TUNE_CONTRASTS) if options['target_black'] is not None and options['tune_contrast'] else 1
+    
+    key = coalescer.make_key('engraving-filter', image_bytes, **options)
+    return coalescer.do(key, lambda: run_admitted(
+        image_bytes, sweep_steps(passes, 1), process_engraving_filter, options))
+
+def trace_image(image, trace):
+    return SVG_TRACERS[trace](image)
+
+def trace_bytes(image_bytes, trace):
+    """SVG of an already engraved (binary) raster"""
+    key = coalescer.make_key('trace', image_bytes, trace=trace)
+    return coalescer.do(key, lambda: run_admitted(
+        image_bytes, ['decode', trace_step(trace)], trace_image, trace))
+
+def parse_nest_items(params):
+    """
+    (Artwork, width_mm, height_mm, quantity) per item; an item carries an
+    'svg' document or an engraved raster 'image' that is traced first
+    """
+    items = params.get('items')
+    if not isinstance(items, list) or not items:
+        raise ImageRequestError("items must be a non-empty list")
+    
+    parsed = []
+    for number, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ImageRequestError(f"Item {number} must be an object")
+        trace = item.get('trace') or 'outline'
+        if trace not in SVG_TRACERS:
+            raise ImageRequestError(f"Item {number}: unknown trace '{trace}'")
+        try:
+            if item.get('svg'):
+                svg_string = item['svg']
+            elif item.get('image'):
+                svg_string = trace_bytes(base64_to_bytes(item['image']), trace)
+            else:
+                raise ValueError("needs 'svg' or 'image'")
+            artwork = parse_svg(svg_string)
+            width_mm, height_mm = pendant_size(artwork, item.get('width_mm'), item.get('height_mm'))
+            quantity = int(item.get('quantity', 1))
+        except (TypeError, ValueError) as e:
+            raise ImageRequestError(f"Item {number}: {e}")
+        if width_mm <= 0 or height_mm <= 0 or quantity < 1:
+            raise ImageRequestError(f"Item {number}: sizes and quantity must be positive")
+        if quantity > NEST_MAX_QUANTITY:
+            raise ImageRequestError(f"Item {number}: quantity {quantity} is over the limit of {NEST_MAX_QUANTITY}")
+        parsed.append((artwork, width_mm, height_mm, quantity))
+    return parsed
+
+def nest_request(params):
+    """Pack the items of a /nest request onto engraver beds"""
+    try:
+        bed_width = float(params.get('bed_width_mm', NEST_BED_WIDTH_MM))
+        bed_height = float(params.get('bed_height_mm', NEST_BED_HEIGHT_MM))
+        spacing = float(params.get('spacing_mm', NEST_SPACING_MM))
+    except (TypeError, ValueError) as e:
+        raise ImageRequestError(f"Invalid bed parameters: {e}")
+    if bed_width <= 0 or bed_height <= 0 or spacing < 0:
+        raise ImageRequestError("Bed size must be positive and spacing non-negative")
+    rotate = str(params.get('rotate', 'true')).lower() in ('1', 'true', 'yes')
+    
+    items = parse_nest_items(params)
+    cost = nest_cost(nest_points(items), sum(artwork.points for artwork, _, _, _ in items))
+    try:
+        with admission.admit(cost):
+            return nest(items, bed_width, bed_height, spacing, rotate)
+    except ValueError as e:
+        raise ImageRequestError(str(e))
+
+@app.route('/vectorize', methods=['POST'])
+def vectorize_image():
+    try:
+        image_bytes, params = read_image_payload(request)
+        style = params.get('style', 'canny')
+        
+        result = vectorize_bytes(image_bytes, style, params.get('trace'), params)
+        if isinstance(result, Toolpath):
+            return result.response()
+        return jsonify(deliver(result, params.get('delivery')))
+    
+    except ImageRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
     except Exception as e:
         print(f"Error in vectorization: {e}")
         traceback.print_exc()
@@ -393,70 +1159,15 @@ def vectorize_image():
 def remove_background():
     """Remove background from image using OpenCV"""
     try:
-        data = request.json
-        image_base64 = data.get('image')
-        
-        if not image_base64:
-            return jsonify({"error": "No image provided"}), 400
-        
-        # Decode image
-        image = decode_base64_image(image_base64)
+        image_bytes, params = read_image_payload(request)
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
-        
-        # Apply threshold to create a mask
-        _, mask = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY_INV)
-        
-        # Apply morphological operations to clean up the mask
-        kernel = np.ones((3,3), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
-        
-        # Find contours
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if contours:
-            # Get the largest contour (assumed to be the main subject)
-            largest_contour = max(contours, key=cv2.contourArea)
-            
-            # Create a clean mask from the largest contour
-            mask_clean = np.zeros(gray.shape, np.uint8)
-            cv2.drawContours(mask_clean, [largest_contour], -1, 255, -1)
-            
-            # Apply some smoothing to the mask edges
-            mask_clean = cv2.GaussianBlur(mask_clean, (5, 5), 0)
-            _, mask_clean = cv2.threshold(mask_clean, 128, 255, cv2.THRESH_BINARY)
-            
-            # Create RGBA image
-            if len(image.shape) == 3:
-                b, g, r = cv2.split(image)
-                rgba = cv2.merge([b, g, r, mask_clean])
-            else:
-                rgba = cv2.merge([gray, gray, gray, mask_clean])
-            
-            # Convert to PIL Image for encoding
-            img_pil = Image.fromarray(rgba, 'RGBA')
-            
-            # Save to buffer
-            buffered = io.BytesIO()
-            img_pil.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-            
-            return jsonify({
-                "success": True,
-                "image": f"data:image/png;base64,{img_base64}",
-                "has_transparency": True
-            })
-        else:
-            # If no contours found, return original with white background
-            return jsonify({
-                "success": True,
-                "image": encode_image_to_base64(image),
-                "has_transparency": False,
-                "message": "No clear subject detected, returning original"
-            })
-            
+        return jsonify(deliver(remove_background_bytes(image_bytes, params.get('mode'), quality=params.get('quality')),
+                               params.get('delivery')))
+    
+    except ImageRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
     except Exception as e:
         print(f"Error in background removal: {e}")
         traceback.print_exc()
@@ -466,79 +1177,136 @@ def remove_background():
 def process_pet_image():
     """Special endpoint for pet image processing with face detection"""
     try:
-        data = request.json
-        image_base64 = data.get('image')
-        
-        if not image_base64:
-            return jsonify({"error": "No image provided"}), 400
-        
-        # Decode image
-        image = decode_base64_image(image_base64)
-        
-        # Load pet face cascade (we'll use human face cascade as fallback)
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        # Convert to grayscale for detection
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
-        
-        # Detect faces
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-        
-        # Process based on detection
-        if len(faces) > 0:
-            # Get the largest face
-            x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
-            
-            # Add padding
-            padding = int(max(w, h) * 0.2)
-            x = max(0, x - padding)
-            y = max(0, y - padding)
-            w = min(image.shape[1] - x, w + 2 * padding)
-            h = min(image.shape[0] - y, h + 2 * padding)
-            
-            # Crop to face region
-            cropped = image[y:y+h, x:x+w]
-        else:
-            cropped = image
-        
-        # Create multiple engraving styles optimized for pets
-        results = {}
+        image_bytes, params = read_image_payload(request)
         
-        # Soft edges for fur texture
-        soft_edges = cv2.bilateralFilter(cropped, 15, 80, 80)
-        soft_edges_gray = cv2.cvtColor(soft_edges, cv2.COLOR_BGR2GRAY) if len(soft_edges.shape) == 3 else soft_edges
-        _, soft_binary = cv2.threshold(soft_edges_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        results['soft'] = encode_image_to_base64(soft_binary)
+        result = process_pet_bytes(image_bytes, params)
+        if isinstance(result, Toolpath):
+            return result.response()
+        return jsonify(deliver(result, params.get('delivery')))
+    
+    except ImageRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        print(f"Error in pet processing: {e}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/style-preview', methods=['POST'])
+def style_preview_image():
+    """Contact sheet of every style at thumbnail size, for the style picker"""
+    try:
+        image_bytes, params = read_image_payload(request)
         
-        # High contrast for clear features
-        contrast = cv2.convertScaleAbs(cropped, alpha=2.0, beta=0)
-        contrast_edges = apply_advanced_canny(contrast, 30, 90)
-        results['contrast'] = encode_image_to_base64(contrast_edges)
+        return jsonify(deliver(style_preview_bytes(image_bytes, params), params.get('delivery')))
+    
+    except ImageRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        print(f"Error in style preview: {e}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/professional-engraving', methods=['POST'])
+def professional_engraving_image():
+    """Professional pet engraving filter from filtre_gravure_simple"""
+    try:
+        image_bytes, params = read_image_payload(request)
         
-        # Artistic style
-        artistic = create_artistic_edges(cropped)
-        results['artistic'] = encode_image_to_base64(artistic)
+        return jsonify(deliver(professional_engraving_bytes(image_bytes, params), params.get('delivery')))
+    
+    except ImageRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        print(f"Error in professional engraving: {e}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/engraving-filter', methods=['POST'])
+def engraving_filter_image():
+    """Simple engraving filter, optionally auto-tuned to a target black ratio"""
+    try:
+        image_bytes, params = read_image_payload(request)
         
-        # Detailed engraving
-        detailed = create_detailed_engraving(cropped)
-        results['detailed'] = encode_image_to_base64(detailed)
+        return jsonify(deliver(engraving_filter_bytes(image_bytes, params), params.get('delivery')))
+    
+    except ImageRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        print(f"Error in engraving filter: {e}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/engraving-sweep', methods=['POST'])
+def engraving_sweep_image():
+    """Render a grid of engraving filter parameters for tuning"""
+    try:
+        image_bytes, params = read_image_payload(request)
         
-        # Generate SVG
-        svg_string = vectorize_to_svg(contrast_edges)
+        return jsonify(deliver(engraving_sweep_bytes(image_bytes, params), params.get('delivery')))
+    
+    except ImageRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        print(f"Error in engraving sweep: {e}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/nest', methods=['POST'])
+def nest_pendants():
+    """Pack many pendant engravings onto one engraver job per bed"""
+    try:
+        _, params = read_json_payload(request)
         
-        return jsonify({
-            "success": True,
-            "face_detected": len(faces) > 0,
-            "face_coordinates": {"x": int(x), "y": int(y), "width": int(w), "height": int(h)} if len(faces) > 0 else None,
-            "styles": results,
-            "svg": svg_string
-        })
+        return jsonify(deliver(nest_request(params), params.get('delivery')))
     
+    except ImageRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except AdmissionRejected as e:
+        return rejection_response(e)
     except Exception as e:
-        print(f"Error in pet processing: {e}")
+        print(f"Error in bed nesting: {e}")
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+
+def _warmup_svg(image):
+    vectorize_to_svg(create_standard_engraving(image))
+
+def _warmup_face_detection(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    get_face_cascade().detectMultiScale(gray, 1.1, 4)
+
+# Every style plus SVG tracing and encoding, run once per worker at boot
+WARMUP_STEPS = [
+    ('standard', create_standard_engraving),
+    ('detailed', create_detailed_engraving),
+    ('bold', create_bold_engraving),
+    ('canny', apply_advanced_canny),
+    ('artistic', create_artistic_edges),
+    ('embossed', create_embossed_effect),
+    ('halftone', create_halftone_pattern),
+    ('crosshatch', create_crosshatch_pattern),
+    # Builds the cached blue-noise matrix
+    ('dither', create_dithered_engraving),
+    ('svg', _warmup_svg),
+    ('centerline', lambda image: vectorize_to_centerline_svg(apply_advanced_canny(image))),
+    ('face_detection', _warmup_face_detection),
+    ('professional', professional_engraving),
+    ('encode', encode_image_to_base64),
+]
+
+readiness.start(WARMUP_STEPS)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file